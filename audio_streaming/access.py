@@ -0,0 +1,60 @@
+# Nombre del archivo: access.py
+
+import functools
+import hmac
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+from rest_framework.permissions import BasePermission
+
+FORBIDDEN_MESSAGE = 'Se requiere un usuario staff o el token de administración (ADMIN_API_TOKEN)'
+
+
+def has_admin_token(request):
+    """Si la petición trae `Authorization: Bearer <ADMIN_API_TOKEN>`."""
+    token = settings.ADMIN_API_TOKEN
+    scheme, _, value = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(value.encode(), token.encode())
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_active and user.is_staff)
+
+
+def _csrf_rejected(request):
+    """Con la cookie de sesión de un staff, la vista `csrf_exempt` vuelve a exigir el token CSRF."""
+    check = CsrfViewMiddleware(lambda request: None)
+    check.process_request(request)
+    return check.process_view(request, None, (), {})
+
+
+def admin_required(view):
+    """
+    Restringe una vista de administración del worker (drenaje, perfilado...).
+
+    Pasa quien trae el token de `ADMIN_API_TOKEN` (scripts, `curl`) o un
+    usuario staff con sesión de Django; a este último se le exige además el
+    token CSRF en los POST. El resto recibe un 403.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not has_admin_token(request):
+            if not is_staff(request):
+                return JsonResponse({'error': FORBIDDEN_MESSAGE}, status=403)
+            rejected = _csrf_rejected(request)
+            if rejected is not None:
+                return rejected
+        return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class IsAdmin(BasePermission):
+    """Lo mismo que `admin_required` para las vistas de DRF (su `SessionAuthentication` ya exige CSRF)."""
+
+    message = FORBIDDEN_MESSAGE
+
+    def has_permission(self, request, view):
+        return has_admin_token(request) or is_staff(request)
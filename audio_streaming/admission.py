@@ -0,0 +1,196 @@
+# Nombre del archivo: admission.py
+
+import asyncio
+import logging
+import os
+import re
+import socket
+import time
+
+from django.conf import settings
+
+from . import metrics
+from .layers import PROFILE_ACTIONS, WORKER_DRAIN, WORKER_RESUME, WORKERS_GROUP, worker_group
+from .loop_monitor import get_loop_monitor
+from .profiling import get_profiler
+from .sessions import sessions
+from .tts import get_tts_engine
+
+logger = logging.getLogger(__name__)
+
+# Código de cierre del WebSocket para "servidor sobrecargado, reintenta más tarde" (RFC 6455)
+CLOSE_TRY_AGAIN_LATER = 1013
+
+# Motivos de rechazo
+REJECT_DRAINING = 'draining'
+REJECT_SESSIONS = 'sessions'
+REJECT_TTS_QUEUE = 'tts_queue'
+REJECT_LOOP_LAG = 'loop_lag'
+
+# Cada cuánto se vuelve a unir el canal del worker a sus grupos (caducan en la capa de Redis)
+_REJOIN_INTERVAL = 3600
+
+
+def default_worker_id():
+    """`<host>-<pid>`, válido como nombre de grupo de la capa de canales."""
+    return re.sub(r'[^A-Za-z0-9._-]', '-', f'{socket.gethostname()}-{os.getpid()}')[:80]
+
+
+class AdmissionController:
+    """
+    Decide si el worker acepta una llamada o conexión nueva.
+
+    Mira señales en vivo: sesiones activas, síntesis TTS esperando hueco y
+    retraso del event loop (media móvil). Un límite a 0 no se comprueba. Si
+    el worker está saturado es mejor rechazar pronto (el WebSocket con el
+    código 1013, la llamada con un TwiML de "ocupado") que aceptar y
+    degradar a todas las llamadas a la vez.
+
+    En drenaje (`drain`) se rechaza todo lo nuevo y las llamadas en curso
+    siguen hasta colgar: `/audio/health/` responde 503 para que el balanceador
+    deje de enviar tráfico y el worker pueda reiniciarse sin cortar a nadie.
+
+    Una llamada admitida en el webhook reserva su plaza (`reserve`) hasta
+    que llega su stream, que la ocupa con `check(call_sid)` aunque el
+    worker se haya llenado o esté en drenaje entretanto: Twilio ya la ha
+    contestado y rechazarla en el socket la dejaría en silencio. La reserva
+    es del proceso y caduca a los `reservation_ttl` segundos.
+    """
+
+    def __init__(self, max_sessions=0, max_tts_waiting=0, max_loop_lag=0.0, worker_id=None,
+                 reservation_ttl=30.0):
+        self.max_sessions = max_sessions
+        self.max_tts_waiting = max_tts_waiting
+        self.max_loop_lag = max_loop_lag
+        self.worker_id = worker_id or default_worker_id()
+        self.reservation_ttl = reservation_ttl
+        self.draining = False
+        self.rejected = {}
+        self._reservations = {}
+
+    def check(self, call_sid=None):
+        """
+        Devuelve el motivo para rechazar una llamada nueva, o None si se admite.
+
+        Si `call_sid` tiene plaza reservada, la ocupa y se admite siempre.
+        """
+        if call_sid is not None and self._claim(call_sid):
+            return None
+        if self.draining:
+            return self._reject(REJECT_DRAINING)
+        if self.max_sessions and len(sessions) + self.reserved >= self.max_sessions:
+            return self._reject(REJECT_SESSIONS)
+        if self.max_tts_waiting and get_tts_engine().waiting >= self.max_tts_waiting:
+            return self._reject(REJECT_TTS_QUEUE)
+        if self.max_loop_lag and get_loop_monitor().lag >= self.max_loop_lag:
+            return self._reject(REJECT_LOOP_LAG)
+        return None
+
+    def reserve(self, call_sid):
+        """Reserva plaza para la llamada `call_sid`, admitida en el webhook, hasta que llegue su stream."""
+        self._reservations[call_sid] = time.monotonic() + self.reservation_ttl
+
+    @property
+    def reserved(self):
+        """Plazas reservadas que aún no ha ocupado su stream (descarta las caducadas)."""
+        if self._reservations:
+            now = time.monotonic()
+            for call_sid in [sid for sid, expires in self._reservations.items() if expires <= now]:
+                del self._reservations[call_sid]
+        return len(self._reservations)
+
+    def _claim(self, call_sid):
+        expires = self._reservations.pop(call_sid, None)
+        return expires is not None and expires > time.monotonic()
+
+    def _reject(self, reason):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        metrics.ADMISSION_REJECTED.inc()
+        return reason
+
+    def drain(self):
+        if not self.draining:
+            self.draining = True
+            logger.warning(f"🚰 Worker {self.worker_id} en drenaje: {len(sessions)} sesiones activas siguen hasta terminar")
+
+    def resume(self):
+        if self.draining:
+            self.draining = False
+            logger.info(f"🚰 Worker {self.worker_id} vuelve a admitir llamadas")
+
+    def stats(self):
+        engine = get_tts_engine()
+        return {
+            'worker': self.worker_id,
+            'draining': self.draining,
+            'sessions': len(sessions),
+            'reserved': self.reserved,
+            'tts_waiting': engine.waiting,
+            'loop_lag': get_loop_monitor().lag,
+            'limits': {
+                'sessions': self.max_sessions,
+                'tts_waiting': self.max_tts_waiting,
+                'loop_lag': self.max_loop_lag,
+            },
+            'rejected': self.rejected,
+        }
+
+    async def listen(self, layer):
+        """
+        Atiende las órdenes de `manage.py drain` y `manage.py profile` por la capa de canales.
+
+        El proceso abre su propio canal y lo une a `workers` y a
+        `worker.<id>`; cada orden con `reply_to` se contesta con `stats()` (o
+        con el estado del perfilador, si es una orden de perfilado).
+        """
+        channel = await layer.new_channel()
+        groups = (WORKERS_GROUP, worker_group(self.worker_id))
+        try:
+            while True:
+                for group in groups:
+                    await layer.group_add(group, channel)
+                try:
+                    message = await asyncio.wait_for(layer.receive(channel), _REJOIN_INTERVAL)
+                except asyncio.TimeoutError:
+                    continue
+                await self._handle_control(layer, message)
+        finally:
+            for group in groups:
+                await layer.group_discard(group, channel)
+
+    async def _handle_control(self, layer, message):
+        action = message.get('action')
+        if action in PROFILE_ACTIONS:
+            # Órdenes de `manage.py profile`; un error se devuelve en la respuesta
+            try:
+                reply = {'type': 'worker.profile', **get_profiler().control(action, message)}
+            except ValueError as e:
+                reply = {'type': 'worker.profile', 'error': str(e)}
+            reply['worker'] = self.worker_id
+        else:
+            if action == WORKER_DRAIN:
+                self.drain()
+            elif action == WORKER_RESUME:
+                self.resume()
+            reply = {'type': 'worker.status', **self.stats()}
+        if message.get('reply_to'):
+            await layer.send(message['reply_to'], reply)
+
+
+_admission = None
+
+
+def get_admission():
+    """Devuelve el control de admisión del proceso."""
+    global _admission
+    if _admission is None:
+        _admission = AdmissionController(
+            max_sessions=settings.ADMISSION_MAX_SESSIONS,
+            max_tts_waiting=settings.ADMISSION_MAX_TTS_WAITING,
+            max_loop_lag=settings.ADMISSION_MAX_LOOP_LAG_MS / 1000,
+            worker_id=settings.WORKER_ID,
+            reservation_ttl=settings.ADMISSION_RESERVATION_SECONDS,
+        )
+        metrics.REGISTRY.gauge('worker_draining', 'El worker está en drenaje (1) o admite llamadas (0)',
+                               lambda: int(_admission.draining))
+    return _admission
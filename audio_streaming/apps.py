@@ -1,6 +1,100 @@
+import asyncio
+import atexit
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class AudioStreamingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "audio_streaming"
+
+    def ready(self):
+        from channels.layers import get_channel_layer
+
+        from . import lifespan
+        from .admission import get_admission
+        from .clients import tts_providers
+        from .log_pipeline import get_log_pipeline
+        from .log_writer import get_audio_log_writer
+        from .loop_monitor import get_loop_monitor
+        from .profiling import get_profiler
+        from .prompts import get_prompt_library
+        from .tts import get_tts_engine
+
+        if settings.LOG_QUEUE_ENABLED:
+            # Los logs se escriben desde un hilo: el event loop solo los encola
+            pipeline = get_log_pipeline()
+            pipeline.start()
+            # Escribe lo pendiente al salir (también en los comandos de manage.py)
+            atexit.register(pipeline.stop)
+
+        @lifespan.on_startup
+        async def init_tts_providers():
+            # Crea el proveedor por defecto (y su pool HTTP) antes de la primera llamada
+            await asyncio.to_thread(tts_providers.get)
+            if settings.TTS_HEALTHCHECK_ON_STARTUP:
+                await asyncio.to_thread(tts_providers.check_health)
+
+        @lifespan.on_startup
+        def load_prompt_library():
+            # Mapea en memoria las locuciones de `manage.py build_prompts` antes de la primera llamada
+            get_prompt_library()
+
+        @lifespan.on_startup
+        def prewarm_tts_cache():
+            engine = get_tts_engine()
+            provider = tts_providers.get()
+            if not (settings.TTS_PREWARM_ON_STARTUP and engine.cache and provider):
+                return
+            # En segundo plano: el worker empieza a aceptar llamadas sin esperar. Se
+            # precalienta el formato de Twilio y el que reciben los navegadores. En
+            # Twilio no hace falta lo que ya está en la biblioteca de locuciones,
+            # salvo el relleno, que `hedging.py` toma de la caché
+            prompts = get_prompt_library()
+            twilio_texts = [
+                text for text in settings.TTS_PREWARM_TEXTS
+                if text == settings.VOICE_FALLBACK_MESSAGE or not prompts.covers(text, provider)
+            ]
+            twilio_format = provider.negotiate_format(settings.TWILIO_TTS_OUTPUT_FORMAT)
+            self._prewarm_task = asyncio.ensure_future(asyncio.gather(
+                engine.prewarm(provider, twilio_texts, output_format=twilio_format),
+                engine.prewarm(provider, settings.TTS_PREWARM_TEXTS),
+            ))
+
+        @lifespan.on_startup
+        def start_admission_control():
+            # Retraso del event loop para el control de admisión, y órdenes de `manage.py drain`
+            get_loop_monitor().start()
+            layer = get_channel_layer()
+            if layer is not None:
+                self._worker_control_task = asyncio.ensure_future(get_admission().listen(layer))
+
+        @lifespan.on_startup
+        def attach_profiler():
+            # Perfilado del event loop: se activa en caliente (/audio/admin/profiling/ o `manage.py profile`)
+            profiler = get_profiler()
+            profiler.attach()
+            if settings.LOOP_STALL_DETECTION:
+                profiler.start_stall_detection()
+
+        @lifespan.on_shutdown
+        def stop_profiler():
+            get_profiler().stop()
+
+        @lifespan.on_shutdown
+        async def stop_admission_control():
+            task = getattr(self, '_worker_control_task', None)
+            if task:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            await get_loop_monitor().stop()
+
+        @lifespan.on_shutdown
+        async def flush_audio_logs():
+            await get_audio_log_writer().close()
+
+        @lifespan.on_shutdown
+        def close_tts_providers():
+            get_tts_engine().shutdown()
+            tts_providers.close()
@@ -0,0 +1,162 @@
+# Nombre del archivo: cache.py
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Cabecera de los ficheros del nivel de disco: firma, longitud del audio y resumen BLAKE2b
+_DISK_MAGIC = b'TTSC1'
+_DIGEST_SIZE = 16
+_DISK_HEADER = struct.Struct(f'<5sQ{_DIGEST_SIZE}s')
+
+
+def _digest(audio):
+    return hashlib.blake2b(audio, digest_size=_DIGEST_SIZE).digest()
+
+
+def cache_key(provider, text, voice_id, model_id, output_format):
+    """Clave por contenido: el mismo texto con el mismo proveedor, voz, modelo y formato da el mismo audio."""
+    raw = '\x1f'.join((provider, text, voice_id, model_id, output_format))
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    Caché de audio sintetizado en dos niveles.
+
+    - Memoria: LRU acotada en bytes (`max_bytes`).
+    - Disco (opcional): un fichero por clave en `disk_dir`. Los aciertos se
+      sirven con `mmap`, así que el audio vive en la page cache del sistema y
+      lo comparten todos los workers sin copiarlo a cada proceso. Cada
+      fichero lleva la longitud y el resumen del audio: uno truncado o
+      corrupto se borra y cuenta como fallo, y se vuelve a sintetizar.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_dir=None, max_open_maps=256):
+        self.max_bytes = max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.max_open_maps = max_open_maps
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._maps = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+
+    def get(self, key):
+        """Devuelve el audio (bytes o vista de solo lectura de un mmap) o None si no está en caché."""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+
+            audio = self._get_disk(key)
+            if audio is not None:
+                self.disk_hits += 1
+                return audio
+
+            self.misses += 1
+            return None
+
+    def put(self, key, audio):
+        """Guarda el audio en memoria, expulsando las entradas menos usadas si no cabe."""
+        audio = bytes(audio)
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self._memory[key] = audio
+            self.size += len(audio)
+            while self.size > self.max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def store_disk(self, key, audio):
+        """Escribe el audio en el nivel de disco. Es bloqueante: llamar fuera del event loop."""
+        if not self.disk_dir:
+            return
+        path = self._path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(exist_ok=True)
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(_DISK_HEADER.pack(_DISK_MAGIC, len(audio), _digest(audio)))
+            f.write(audio)
+        # Renombrado atómico: otros workers nunca ven un fichero a medias
+        os.replace(tmp, path)
+
+    def _path(self, key):
+        return self.disk_dir / key[:2] / f'{key}.audio'
+
+    def _get_disk(self, key):
+        if not self.disk_dir:
+            return None
+        mapped = self._maps.get(key)
+        if mapped is not None:
+            self._maps.move_to_end(key)
+            return mapped
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # Fichero vacío: no se puede mapear
+            mapped = None
+        audio = self._verify(mapped)
+        if audio is None:
+            logger.warning(f"⚠️ Audio de la caché en disco truncado o corrupto, se descarta: {path.name}")
+            if mapped is not None:
+                mapped.close()
+            path.unlink(missing_ok=True)
+            return None
+        self._maps[key] = audio
+        if len(self._maps) > self.max_open_maps:
+            # El mmap se libera cuando nadie más lo referencia
+            self._maps.popitem(last=False)
+        return audio
+
+    @staticmethod
+    def _verify(mapped):
+        """El audio del fichero mapeado (sin la cabecera) si está completo e intacto, o None."""
+        if mapped is None or len(mapped) < _DISK_HEADER.size:
+            return None
+        magic, size, digest = _DISK_HEADER.unpack_from(mapped)
+        audio = memoryview(mapped)[_DISK_HEADER.size:]
+        if magic != _DISK_MAGIC or len(audio) != size or _digest(audio) != digest:
+            audio.release()
+            return None
+        return audio
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            'entries': len(self._memory),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            'disk_enabled': self.disk_dir is not None,
+        }
@@ -0,0 +1,72 @@
+# Nombre del archivo: clients.py
+
+import logging
+import threading
+
+from django.conf import settings
+
+from .providers import PROVIDERS
+
+logger = logging.getLogger(__name__)
+
+
+class TTSProviderRegistry:
+    """
+    Proveedores TTS compartidos por todo el proceso.
+
+    Cada proveedor se crea la primera vez que se pide (desde los settings) y
+    se reutiliza en todas las conexiones, así ElevenLabs mantiene un único
+    pool HTTP con keep-alive por worker.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._providers = {}
+
+    def get(self, name=None):
+        """Devuelve el proveedor `name` (por defecto `TTS_PROVIDER`), o None si no se puede crear."""
+        name = name or settings.TTS_PROVIDER
+        provider = self._providers.get(name)
+        if provider is None:
+            with self._lock:
+                provider = self._providers.get(name)
+                if provider is None:
+                    provider = self._create(name)
+                    if provider is not None:
+                        self._providers[name] = provider
+        return provider
+
+    @staticmethod
+    def _create(name):
+        cls = PROVIDERS.get(name)
+        if cls is None:
+            logger.error(f"❌ Proveedor TTS desconocido: {name}")
+            return None
+        try:
+            provider = cls.from_settings()
+            logger.info(f"✅ Proveedor TTS {name} inicializado")
+            return provider
+        except Exception as e:
+            logger.error(f"❌ Error al inicializar el proveedor TTS {name}: {str(e)}")
+            return None
+
+    def check_health(self, name=None):
+        """Comprueba que el proveedor responde. Es bloqueante."""
+        provider = self.get(name)
+        return provider.check_health() if provider is not None else False
+
+    def status(self):
+        return {
+            'default': settings.TTS_PROVIDER,
+            'providers': {name: provider.status() for name, provider in self._providers.items()},
+        }
+
+    def close(self):
+        """Cierra todos los proveedores; el siguiente `get()` los volverá a crear."""
+        with self._lock:
+            providers, self._providers = self._providers, {}
+        for provider in providers.values():
+            provider.close()
+
+
+tts_providers = TTSProviderRegistry()
@@ -1,97 +1,212 @@
 # Nombre del archivo: consumers.py
 
-import json
+import asyncio
 import logging
-import base64
-import traceback
+import contextlib
+import time
 
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.exceptions import StopConsumer
-from elevenlabs.client import ElevenLabs
 from django.conf import settings
-from channels.db import database_sync_to_async
+
+from . import lifespan, metrics
+from .admission import CLOSE_TRY_AGAIN_LATER, get_admission
+from .clients import tts_providers
+from .hedging import Attempt, hedged_stream
+from .log_pipeline import get_error_reporter
+from .log_writer import get_audio_log_writer
+from .tts import get_tts_engine
+from .transcode import Transcoder
+from .sessions import CallSession, sessions
+from .twilio_media import SAMPLE_RATE as TWILIO_SAMPLE_RATE, WIRE_FORMAT as TWILIO_FORMAT
+from .layers import call_group
+from .framing import FRAMING_MODES, FRAMING_TWILIO, TwilioMediaFramer
+from .outbound import OutboundQueue
+from .prompts import get_prompt_library
+from .vad import SPEECH_START, UTTERANCE_END, EnergyVAD
+from .wire import DecodeError, get_message_codec
 
 logger = logging.getLogger(__name__)
 
 class AudioStreamConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.is_streaming = False
-        self.client_id = None
-        self.client = self._init_elevenlabs_client()
-
-    def _init_elevenlabs_client(self):
-        try:
-            client = ElevenLabs(api_key=settings.ELEVENLABS_API_KEY)
-            logger.info("✅ Cliente ElevenLabs inicializado")
-            return client
-        except Exception as e:
-            logger.error(f"❌ Error al inicializar ElevenLabs: {str(e)}")
-            return None
+        # Estado de la llamada; el consumidor solo guarda la infraestructura de la conexión
+        self.session = CallSession(
+            client_id=str(id(self)),
+            stream_audio=settings.TTS_STREAMING,
+            buffer_seconds=settings.TWILIO_INBOUND_BUFFER_SECONDS,
+        )
+        self._response_task = None
+        self._connected = False
+        # Admisión aplazada hasta el `start` (ver `connect`)
+        self._admission_pending = False
+        self._call_group = None
+        self.outbound = OutboundQueue(self._send_frame, maxsize=settings.OUTBOUND_QUEUE_MAX_MESSAGES)
+        self.provider = tts_providers.get()
+        self.tts = get_tts_engine()
+        self.prompts = get_prompt_library()
+        self.log_writer = get_audio_log_writer()
+        self.codec = get_message_codec()
+        self.errors = get_error_reporter()
+        self.admission = get_admission()
 
     async def connect(self):
+        # Bajo Daphne no hay `lifespan`: el worker arranca con la primera conexión
+        await lifespan.ensure_started()
         await self.accept()
-        self.client_id = str(id(self))
+        client = self.scope.get('client')
+        self.session.ip_address = client[0] if client else None
 
-        if not self.client:
-            await self._send_error('init_error', 'Cliente ElevenLabs no inicializado')
+        if not self.provider:
+            await self._send_error('init_error', 'Proveedor TTS no inicializado')
             await self.close()
             return
 
-        logger.info(f"🔗 Cliente conectado (ID: {self.client_id})")
+        if self.admission.reserved:
+            # Puede ser una llamada con plaza reservada en `handle_call`: se sabe con su `start`
+            self._admission_pending = True
+        elif not await self._admit():
+            return
+
+        logger.info(f"🔗 Cliente conectado (ID: {self.session.client_id})")
         await self.send_json({
             'event': 'connection_established',
             'message': 'Conexión WebSocket establecida',
-            'client_id': self.client_id
+            'client_id': self.session.client_id
         })
 
+    async def _admit(self, call_sid=None):
+        """Pasa el control de admisión y registra la sesión; si se rechaza, cierra con 1013 y devuelve False."""
+        self._admission_pending = False
+        reason = self.admission.check(call_sid)
+        if reason:
+            # 🚦 Worker saturado o en drenaje: se rechaza ya en lugar de degradar a todas las llamadas
+            self.errors.report(logger, 'admission', f"🚦 Conexión rechazada ({reason})")
+            await self._send_error('overloaded', f'Servidor ocupado ({reason}), reintenta más tarde')
+            await self.close(code=CLOSE_TRY_AGAIN_LATER)
+            return False
+        metrics.ACTIVE_STREAMS.inc()
+        self._connected = True
+        sessions.add(self.session)
+        return True
+
     async def disconnect(self, close_code):
-        logger.info(f"❌ Cliente {self.client_id} desconectado (código {close_code})")
-        self.is_streaming = False
+        logger.info(f"❌ Cliente {self.session.client_id} desconectado (código {close_code})")
+        self.session.streaming = False
+        if self._connected:
+            metrics.ACTIVE_STREAMS.dec()
+            self._connected = False
+            sessions.remove(self.session)
+        if self._call_group:
+            await self.channel_layer.group_discard(self._call_group, self.channel_name)
+            self._call_group = None
+        self._cancel_response()
+        await self.outbound.close()
+        await self.log_writer.flush()
         raise StopConsumer()
 
     async def receive(self, text_data):
+        self.session.received_at = time.perf_counter()
         try:
-            data = json.loads(text_data)
+            data = self.codec.decode(text_data)
             event = data.get('event', '')
 
             match event:
                 case 'start':
-                    await self._handle_start_stream()
+                    await self._handle_start_stream(data)
                 case 'stop':
                     await self._handle_stop_stream()
                 case 'media':
                     await self._handle_media_data(data)
+                case 'mark':
+                    self._handle_mark(data)
                 case 'connected':
+                    if data.get('protocol'):
+                        # Twilio Media Streams: {"event": "connected", "protocol": "Call", ...}
+                        logger.info(f"📞 Twilio conectado (cliente {self.session.client_id})")
+                        return
                     await self.send_json({
                         'event': 'ready',
                         'message': 'Listo para streaming',
-                        'client_id': self.client_id
+                        'client_id': self.session.client_id
                     })
                 case _:
-                    logger.warning(f"❓ Evento desconocido: {event}")
+                    self.errors.report(logger, 'unknown_event', f"❓ Evento desconocido: {event}")
                     await self._send_error('unknown_event', f'Evento no reconocido: {event}')
 
-        except json.JSONDecodeError:
-            logger.error("❌ Formato JSON inválido")
+        except DecodeError:
+            self.errors.report(logger, 'json', "❌ Formato JSON inválido", level=logging.ERROR)
             await self._send_error('json_error', 'Formato JSON inválido')
         except Exception as e:
-            error_traceback = traceback.format_exc()
-            logger.error(f"❌ Error al procesar el mensaje: {str(e)}\n{error_traceback}")
+            self.errors.report(logger, 'receive', "❌ Error al procesar el mensaje", e)
             await self._send_error('internal_error', str(e))
 
-    async def _handle_start_stream(self):
-        self.is_streaming = True
-        logger.info(f"▶️ Stream iniciado para cliente {self.client_id}")
+    async def _handle_start_stream(self, data):
+        start = data.get('start')
+        if self._admission_pending and not await self._admit(start.get('callSid') if isinstance(start, dict) else None):
+            return
+        self.session.streaming = True
+        if isinstance(start, dict):
+            # Twilio Media Streams: {"event": "start", "start": {"streamSid": ..., "callSid": ...}}
+            self.session.start_twilio(start, vad=EnergyVAD(**settings.VAD_CONFIG))
+            sessions.index(self.session)
+            self.outbound.start()
+            # <Parameter name="provider" value="..."/> en el TwiML elige el proveedor de la llamada
+            await self._select_provider(self.session.custom_parameters.get('provider'))
+            if self.session.call_sid and self.channel_layer is not None:
+                # Grupo de la llamada: cualquier worker puede mandarle órdenes de control
+                self._call_group = call_group(self.session.call_sid)
+                await self.channel_layer.group_add(self._call_group, self.channel_name)
+            logger.info(f"▶️ Stream de Twilio {self.session.stream_sid} iniciado (llamada {self.session.call_sid})")
+            # El TwiML de `handle_call` no saluda: el saludo (de la biblioteca de locuciones o de la caché) sale por el stream
+            self._start_response(settings.VOICE_WELCOME_MESSAGE)
+            return
+
+        # El cliente puede pedir audio en streaming al iniciar: {"event": "start", "streaming": true}
+        self.session.stream_audio = bool(data.get('streaming', self.session.stream_audio))
+        # ...y negociar el entramado: frames binarios ("raw") o mensajes `media` estilo Twilio ("twilio")
+        framing = data.get('framing', self.session.framing)
+        if framing not in FRAMING_MODES:
+            await self._send_error('framing_error', f'Entramado no soportado: {framing}')
+            return
+        self.session.framing = framing
+        # ...y elegir proveedor TTS: {"event": "start", "provider": "local"}
+        if not await self._select_provider(data.get('provider')):
+            return
+        if self.session.framing == FRAMING_TWILIO:
+            self.outbound.start()
+        logger.info(f"▶️ Stream iniciado para cliente {self.session.client_id}")
         await self.send_json({
             'event': 'started',
             'message': 'Streaming iniciado',
             'status': 'streaming'
         })
 
+    async def _select_provider(self, name):
+        """Cambia el proveedor TTS de la conexión. Devuelve False si `name` no está permitido o no arranca."""
+        if not name or name == self.provider.name:
+            return True
+        provider = None
+        if name in settings.TTS_SELECTABLE_PROVIDERS:
+            provider = await asyncio.to_thread(tts_providers.get, name)
+        if provider is None:
+            logger.warning(f"⚠️ Proveedor TTS no disponible: {name} (cliente {self.session.client_id})")
+            if not self.session.is_twilio:
+                # Twilio no entiende mensajes de error: la llamada sigue con el proveedor por defecto
+                await self._send_error('provider_error', f'Proveedor TTS no disponible: {name}')
+            return False
+        self.provider = provider
+        logger.info(f"🔀 Proveedor TTS {name} para cliente {self.session.client_id}")
+        return True
+
     async def _handle_stop_stream(self):
-        self.is_streaming = False
-        logger.info(f"⏹️ Stream detenido para cliente {self.client_id}")
+        self.session.streaming = False
+        logger.info(f"⏹️ Stream detenido para cliente {self.session.client_id}")
+        if self.session.is_twilio:
+            # Twilio cierra el socket después de `stop`; no espera respuesta
+            self.session.release_audio()
+            return
         await self.send_json({
             'event': 'stopped',
             'message': 'Streaming detenido',
@@ -99,85 +214,287 @@ class AudioStreamConsumer(AsyncWebsocketConsumer):
         })
 
     async def _handle_media_data(self, data):
-        if not self.is_streaming:
-            logger.warning(f"⚠️ Datos recibidos sin stream activo para cliente {self.client_id}")
+        if not self.session.streaming:
+            self.errors.report(logger, 'media_without_stream', "⚠️ Datos recibidos sin stream activo")
             return
 
         try:
             media_data = data.get('media')
             if not media_data:
-                logger.warning("⚠️ Campo 'media' vacío o faltante")
+                self.errors.report(logger, 'media_empty', "⚠️ Campo 'media' vacío o faltante")
                 return
 
-            response_text = "Mensaje recibido correctamente"
-
-            # 🎙️ Generar audio con ElevenLabs
-            try:
-                response = self.client.text_to_speech.convert(
-                    text=response_text,
-                    voice_id="9BWtsMINqrJLrRacOk9x",
-                    model_id="eleven_multilingual_v2"
-                )
-                
-                logger.info(f"Tipo de respuesta: {type(response)}")
-                
-                # Verificar qué contiene realmente la respuesta
-                if hasattr(response, 'read'):
-                    # Probablemente es un objeto tipo archivo
-                    audio_bytes = response.read()
-                elif hasattr(response, '__iter__'):
-                    # Es un iterable, pero seamos más cuidadosos
-                    try:
-                        audio_bytes = b''.join(chunk for chunk in response)
-                    except Exception as e:
-                        logger.error(f"❌ Error al unir fragmentos de audio: {str(e)}")
-                        await self._send_error('audio_error', f'Error al procesar fragmentos de audio: {str(e)}')
-                        return
-                else:
-                    # Podría ser ya bytes
-                    audio_bytes = response if isinstance(response, bytes) else bytes(response)
-                
-                # Registrar la longitud para confirmar que tenemos datos
-                audio_length = len(audio_bytes) / 1000.0  # Convertir a kilobytes como aproximación
-                logger.info(f"Longitud de bytes de audio: {len(audio_bytes)}")
-                
-                audio_b64 = base64.b64encode(audio_bytes).decode("utf-8")
-
-                # 📤 Enviar audio al cliente
-                await self.send(bytes_data=audio_bytes)
-                logger.info(f"🎵 Audio enviado para cliente {self.client_id}")
+            if self.session.is_twilio and isinstance(media_data, dict):
+                await self._handle_twilio_media(data, media_data)
+                return
 
-                # 💾 Guardar log en la base de datos
-                await self._save_audio_log(response_text, audio_length)
-                
-            except Exception as audio_error:
-                error_traceback = traceback.format_exc()
-                logger.error(f"❌ Error específico al generar audio: {str(audio_error)}\n{error_traceback}")
-                await self._send_error('audio_generation_error', str(audio_error))
+            await self._respond(settings.VOICE_ACK_MESSAGE)
 
         except Exception as e:
-            # Añadir información de error más detallada
-            error_traceback = traceback.format_exc()
-            logger.error(f"❌ Error procesando datos de audio: {str(e)}\n{error_traceback}")
+            self.errors.report(logger, 'media', "❌ Error procesando datos de audio", e)
             await self._send_error('audio_error', str(e))
 
-    async def _save_audio_log(self, response_text, audio_length):
+    async def _handle_twilio_media(self, data, media_data):
+        # Trama de Twilio: 20 ms de audio μ-law 8 kHz en base64
+        self.session.receive_media(media_data.get('payload', ''), data.get('sequenceNumber'))
+        vad_events = self.session.vad.feed(self.session.inbound)
+        metrics.RECEIVE_DECODE.observe(time.perf_counter() - self.session.received_at)
+
+        for vad_event in vad_events:
+            if vad_event.kind == SPEECH_START and self._is_speaking():
+                # ✋ El llamante habla encima del bot: se corta la respuesta
+                await self._barge_in()
+            elif vad_event.kind == UTTERANCE_END:
+                # Solo se responde una vez por turno, cuando el llamante deja de hablar
+                logger.info(f"🗣️ Fin de turno ({vad_event.duration:.1f} s de voz) en llamada {self.session.call_sid}")
+                self.session.turn_ended_at = self.session.received_at
+                self._start_response(settings.VOICE_ACK_MESSAGE)
+
+    def _is_speaking(self):
+        """El bot está hablando si aún sintetiza, tiene audio por enviar o Twilio no lo ha reproducido."""
+        return bool(
+            (self._response_task and not self._response_task.done())
+            or self.outbound.depth
+            or self.session.marks.playing
+        )
+
+    def _start_response(self, text):
+        """Lanza la respuesta como tarea cancelable para seguir recibiendo audio mientras tanto."""
+        self._cancel_response()
+        self._response_task = asyncio.ensure_future(self._respond(text))
+
+    def _cancel_response(self):
+        if self._response_task and not self._response_task.done():
+            self._response_task.cancel()
+        self._response_task = None
+
+    async def _interrupt(self):
+        """Corta la respuesta en curso y descarta el audio pendiente. Devuelve los mensajes descartados."""
+        self._cancel_response()
+        dropped = self.outbound.flush()
+        if self.session.framing == FRAMING_TWILIO:
+            # Vacía también el audio que Twilio ya tiene en su búfer; sus marks ya no cuentan
+            await self.send_json({'event': 'clear', 'streamSid': self.session.stream_sid})
+            self.session.marks.clear()
+        return dropped
+
+    async def _barge_in(self):
+        dropped = await self._interrupt()
+        metrics.BARGE_INS.inc()
+        logger.info(f"✋ Interrupción del llamante: respuesta cancelada ({dropped} mensajes descartados)")
+
+    async def _respond(self, response_text):
+        # 🎙️ Generar audio con ElevenLabs (en el pool de hilos, sin bloquear el loop)
         try:
-            from .models import AudioLog  # Importación *dentro* del método
-            
-            # Creamos el registro usando los campos correctos del modelo
-            await database_sync_to_async(AudioLog.objects.create)(
-                event="media_processed",  # Un evento descriptivo
-                response_text=response_text,
-                audio_length=audio_length,
-                ip_address=self.scope.get('client')[0] if 'client' in self.scope else None
-                # twilio_sid se deja como None ya que no parece relevante para este caso
-            )
-            
-            logger.info(f"📝 Log guardado para cliente {self.client_id}")
-        except Exception as e:
-            error_traceback = traceback.format_exc()
-            logger.error(f"❌ Error al guardar log: {str(e)}\n{error_traceback}")
+            if self.session.framing == FRAMING_TWILIO:
+                # 📤 Responder con mensajes `media` μ-law de 20 ms y un `mark`
+                audio_size = await self._send_twilio_audio(response_text)
+            elif self.session.stream_audio:
+                # 📤 Enviar cada fragmento al cliente en cuanto llega
+                audio_size = await self._stream_audio(response_text)
+            else:
+                audio_bytes = b''.join([chunk async for _, chunk in self._tts_stream(response_text)])
+                audio_size = len(audio_bytes)
+
+                # 📤 Enviar audio al cliente
+                await self._send_frame(audio_bytes)
+
+            # Registrar la longitud para confirmar que tenemos datos
+            if self.session.framing == FRAMING_TWILIO:
+                audio_length = audio_size / TWILIO_SAMPLE_RATE  # μ-law: un byte por muestra
+            else:
+                audio_length = audio_size / 1000.0  # Convertir a kilobytes como aproximación
+            logger.debug("🎵 Audio enviado para cliente %s (%d bytes)", self.session.client_id, audio_size)
+
+            # 💾 Guardar log en la base de datos
+            await self._save_audio_log(response_text, audio_length)
+
+        except asyncio.CancelledError:
+            logger.info(f"⏹️ Respuesta cancelada para cliente {self.session.client_id}")
+            raise
+        except Exception as audio_error:
+            self.errors.report(logger, 'tts', "❌ Error al generar audio", audio_error)
+            await self._send_error('audio_generation_error', str(audio_error))
+
+    async def call_control(self, event):
+        """Órdenes enviadas al grupo de la llamada desde cualquier worker (`calls.views.call_control`)."""
+        action = event.get('action')
+        call_sid = self.session.call_sid
+        logger.info(f"🎛️ Orden '{action}' para la llamada {call_sid}")
+
+        match action:
+            case 'hangup':
+                # Al cerrarse el stream Twilio sigue con el TwiML; tras <Connect> no hay nada más y cuelga
+                await self._interrupt()
+                await self.close()
+            case 'say':
+                if self._is_speaking():
+                    await self._interrupt()
+                self._start_response(event.get('text') or settings.VOICE_ACK_MESSAGE)
+            case 'transfer':
+                await self._interrupt()
+                try:
+                    await asyncio.to_thread(self._transfer_call, call_sid, event.get('to'))
+                except Exception as e:
+                    logger.error(f"❌ Error transfiriendo la llamada {call_sid}: {str(e)}")
+            case _:
+                logger.warning(f"❓ Orden de control desconocida: {action}")
+
+    @staticmethod
+    def _transfer_call(call_sid, to):
+        """Redirige la llamada a un <Dial>; Twilio cierra entonces este stream."""
+        from twilio.rest import Client
+        from twilio.twiml.voice_response import VoiceResponse
+
+        response = VoiceResponse()
+        response.dial(to)
+        Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN).calls(call_sid).update(twiml=str(response))
+
+    def _handle_mark(self, data):
+        name = (data.get('mark') or {}).get('name')
+        if not name:
+            return
+        latency = self.session.marks.ack(name)
+        if latency is not None:
+            logger.debug("🔖 Mark %s reproducido tras %.0f ms", name, latency * 1000)
+
+    async def _send_twilio_audio(self, text):
+        """Sintetiza `text` en μ-law 8 kHz y lo envía en tramas de 20 ms, terminando con un `mark` (en Twilio)."""
+        framer = TwilioMediaFramer(self.session.stream_sid)
+        prompt = self.prompts.get(text, self.provider)
+        if prompt is not None:
+            # 🗣️ Locución ya sintetizada (`manage.py build_prompts`): sin esperar al TTS
+            return await self._send_twilio_prompt(framer, prompt)
+        encoder = None
+        source = None
+        audio_size = 0
+
+        # Se pide μ-law o PCM al proveedor; si no es ya μ-law 8 kHz se convierte al vuelo
+        chunks = self._tts_stream(text, settings.TWILIO_TTS_OUTPUT_FORMAT, filler=True)
+        async with contextlib.aclosing(chunks):
+            async for attempt, chunk in chunks:
+                if attempt is not source:
+                    # El formato depende de qué petición respondió antes (y el relleno va por delante)
+                    ulaw = encoder.flush() if encoder else b''
+                    encoder, source = Transcoder(attempt.output_format, TWILIO_FORMAT), attempt
+                    ulaw += encoder.feed(chunk)
+                else:
+                    ulaw = encoder.feed(chunk)
+                audio_size += len(ulaw)
+                frames = framer.frames(ulaw)
+                if frames and self.session.turn_ended_at is not None:
+                    metrics.TIME_TO_FIRST_AUDIO.observe(time.perf_counter() - self.session.turn_ended_at)
+                    self.session.turn_ended_at = None
+                for frame in frames:
+                    await self.outbound.put(frame)
+
+        ulaw = encoder.flush() if encoder else b''
+        audio_size += len(ulaw)
+        for frame in framer.frames(ulaw) + framer.flush():
+            await self.outbound.put(frame)
+        await self._send_mark(framer)
+        return audio_size
+
+    async def _send_twilio_prompt(self, framer, prompt):
+        """Envía una locución de la biblioteca (μ-law 8 kHz) en tramas de 20 ms y un `mark` (en Twilio)."""
+        frames = framer.frames(prompt) + framer.flush()
+        if frames and self.session.turn_ended_at is not None:
+            metrics.TIME_TO_FIRST_AUDIO.observe(time.perf_counter() - self.session.turn_ended_at)
+            self.session.turn_ended_at = None
+        for frame in frames:
+            await self.outbound.put(frame)
+        await self._send_mark(framer)
+        return len(prompt)
+
+    async def _send_mark(self, framer):
+        """Twilio devolverá este mark cuando haya terminado de reproducir la respuesta."""
+        if self.session.is_twilio:
+            # Un navegador con entramado 'twilio' no devuelve los marks: se quedarían pendientes para siempre
+            await self.outbound.put(framer.mark(self.session.marks.next('respuesta')))
+
+    def _tts_stream(self, text, preferred_format=None, filler=False):
+        """
+        Fragmentos `(attempt, chunk)` de `text` con plazo para el primero: si el
+        proveedor tarda se lanza una petición de respaldo y, con `filler`, se
+        reproduce el relleno cacheado (`hedging.py`). `preferred_format` se
+        negocia con cada proveedor.
+
+        El relleno solo tiene sentido si quien consume transcodifica cada
+        `attempt` a un formato común, como `_send_twilio_audio`: en los demás
+        caminos quedaría pegado a la respuesta, quizá en otro formato.
+        """
+        primary = Attempt('principal', self.provider, output_format=self.provider.negotiate_format(preferred_format))
+        attempts = [primary]
+        if settings.TTS_HEDGE_AFTER_MS:
+            hedge = tts_providers.get(settings.TTS_HEDGE_PROVIDER) if settings.TTS_HEDGE_PROVIDER else None
+            if hedge is None and settings.TTS_HEDGE_SAME_PROVIDER:
+                hedge = self.provider
+            if hedge is not None and (hedge.name != self.provider.name or settings.TTS_HEDGE_SAME_PROVIDER):
+                # Contra el mismo proveedor duplicaría peticiones y cuota justo cuando va lento: solo si se pide
+                attempts.append(Attempt(
+                    'respaldo',
+                    hedge,
+                    voice_id=settings.TTS_HEDGE_VOICE_ID or None,
+                    output_format=hedge.negotiate_format(preferred_format),
+                ))
+        return hedged_stream(
+            self.tts,
+            text,
+            attempts,
+            hedge_after=settings.TTS_HEDGE_AFTER_MS / 1000,
+            fallback=primary,
+            fallback_text=settings.VOICE_FALLBACK_MESSAGE if filler and settings.TTS_FALLBACK_AFTER_MS else None,
+            fallback_after=settings.TTS_FALLBACK_AFTER_MS / 1000,
+            max_buffered_chunks=settings.TTS_STREAM_BUFFER_CHUNKS,
+        )
+
+    async def _send_frame(self, frame):
+        """Envía un frame ya construido: bytes como frame binario, str como frame de texto."""
+        started = time.perf_counter()
+        if isinstance(frame, str):
+            await self.send(text_data=frame)
+        else:
+            await self.send(bytes_data=frame)
+        metrics.WS_SEND.observe(time.perf_counter() - started)
+
+    async def _stream_audio(self, text):
+        """
+        Reenvía al socket cada fragmento de audio según lo entrega el TTS.
+
+        El audio va entre dos mensajes JSON (`audio_start` / `audio_end`) para
+        que el cliente sepa dónde empieza y termina cada respuesta.
+        """
+        started = time.perf_counter()
+        ttfb = None
+        audio_size = 0
+
+        await self.send_json({'event': 'audio_start'})
+        chunks = self._tts_stream(text)
+        async with contextlib.aclosing(chunks):
+            async for _, chunk in chunks:
+                if ttfb is None:
+                    ttfb = time.perf_counter() - started
+                await self._send_frame(chunk)
+                audio_size += len(chunk)
+
+        await self.send_json({
+            'event': 'audio_end',
+            'bytes': audio_size,
+            'ttfb_ms': round(ttfb * 1000, 1) if ttfb is not None else None
+        })
+        return audio_size
+
+    async def _save_audio_log(self, response_text, audio_length):
+        # Se encola y se escribe por lotes en segundo plano (ver log_writer.py)
+        self.log_writer.add(
+            event="media_processed",  # Un evento descriptivo
+            response_text=response_text,
+            audio_length=audio_length,
+            ip_address=self.session.ip_address,
+            # Enlaza el log con la llamada (`Call.call_sid`); None para clientes que no son Twilio
+            twilio_sid=self.session.call_sid,
+        )
+        logger.debug("📝 Log encolado para cliente %s", self.session.client_id)
 
     async def _send_error(self, code, message):
         await self.send_json({
@@ -188,4 +505,4 @@ class AudioStreamConsumer(AsyncWebsocketConsumer):
 
     async def send_json(self, content: dict):
         """Envoltura para enviar mensajes JSON"""
-        await self.send(text_data=json.dumps(content))
\ No newline at end of file
+        await self.send(text_data=self.codec.encode(content))
\ No newline at end of file
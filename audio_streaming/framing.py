@@ -0,0 +1,64 @@
+# Nombre del archivo: framing.py
+
+import base64
+import json
+
+from .twilio_media import FRAME_SAMPLES
+
+# Modos de entramado del audio saliente que puede negociar una conexión
+FRAMING_RAW = 'raw'          # frames binarios del WebSocket con el audio tal cual
+FRAMING_TWILIO = 'twilio'    # mensajes JSON `media` de Twilio con μ-law en base64
+FRAMING_MODES = (FRAMING_RAW, FRAMING_TWILIO)
+
+
+class TwilioMediaFramer:
+    """
+    Trocea μ-law en mensajes `media` de Twilio de 20 ms (160 bytes).
+
+    El JSON se arma concatenando un prefijo y un sufijo precalculados con el
+    base64 de cada trozo, que se toma como `memoryview` del fragmento
+    recibido: no hay copia del audio completo ni `json.dumps` por trama.
+    Lo que no llega a completar una trama se guarda para el siguiente
+    fragmento.
+    """
+
+    def __init__(self, stream_sid, frame_bytes=FRAME_SAMPLES):
+        self.frame_bytes = frame_bytes
+        self._sid = json.dumps(stream_sid)
+        self._prefix = '{"event":"media","streamSid":' + self._sid + ',"media":{"payload":"'
+        self._suffix = '"}}'
+        self._pending = bytearray()
+
+    def frames(self, ulaw):
+        view = memoryview(ulaw)
+        out = []
+        if self._pending:
+            needed = self.frame_bytes - len(self._pending)
+            self._pending += view[:needed]
+            view = view[needed:]
+            if len(self._pending) < self.frame_bytes:
+                return out
+            out.append(self._frame(self._pending))
+            self._pending = bytearray()
+
+        frame_bytes = self.frame_bytes
+        end = len(view) - len(view) % frame_bytes
+        for offset in range(0, end, frame_bytes):
+            out.append(self._frame(view[offset:offset + frame_bytes]))
+        if end < len(view):
+            self._pending += view[end:]
+        return out
+
+    def flush(self):
+        """Devuelve la última trama incompleta, si la hay."""
+        if not self._pending:
+            return []
+        out = [self._frame(self._pending)]
+        self._pending = bytearray()
+        return out
+
+    def _frame(self, payload):
+        return self._prefix + base64.b64encode(payload).decode('ascii') + self._suffix
+
+    def mark(self, name):
+        return '{"event":"mark","streamSid":' + self._sid + ',"mark":{"name":' + json.dumps(name) + '}}'
@@ -0,0 +1,154 @@
+# Nombre del archivo: hedging.py
+
+import asyncio
+import contextlib
+import logging
+
+from . import metrics
+from .log_pipeline import get_error_reporter
+from .tts import CACHED_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class Attempt:
+    """Una forma de obtener el audio: proveedor, voz y formato de salida."""
+
+    __slots__ = ('label', 'provider', 'voice_id', 'model_id', 'output_format')
+
+    def __init__(self, label, provider, voice_id=None, model_id=None, output_format=None):
+        self.label = label
+        self.provider = provider
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self.output_format = output_format
+
+    def __repr__(self):
+        return f'{self.label} ({self.provider.name}, voz {self.voice_id or self.provider.voice_id})'
+
+
+async def hedged_stream(engine, text, attempts, hedge_after, fallback=None, fallback_text=None,
+                        fallback_after=None, max_buffered_chunks=8):
+    """
+    Sintetiza `text` con plazo para el primer fragmento y entrega pares `(attempt, fragmento)`.
+
+    Empieza por `attempts[0]`. Si en `hedge_after` segundos no ha llegado el
+    primer fragmento (o la petición falla), lanza la siguiente de `attempts`
+    sin cancelar las que siguen en curso: gana la primera que entregue audio y
+    las demás se cancelan. Si a los `fallback_after` segundos ninguna ha
+    respondido, se reproduce `fallback_text` con la voz y el formato de
+    `fallback`, pero solo si ya está en la caché: el relleno no debe esperar a
+    otra síntesis. El relleno no sustituye a la respuesta: las peticiones
+    siguen en curso y su audio se entrega a continuación. Si fallan todas, se
+    propaga el último error (tras el relleno, si lo hubo).
+
+    El formato del audio depende de la petición ganadora, de ahí los pares; el
+    relleno llega con su propio `Attempt` ('relleno').
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    waiting = list(attempts)
+    running = {}
+    error = None
+    winner = None
+
+    def launch():
+        attempt = waiting.pop(0)
+        chunks = engine.stream(
+            attempt.provider, text, attempt.voice_id, attempt.model_id, attempt.output_format, max_buffered_chunks
+        )
+        running[asyncio.ensure_future(anext(chunks))] = (attempt, chunks)
+
+    launch()
+    next_hedge_at = hedge_after
+    try:
+        while winner is None:
+            elapsed = loop.time() - started
+            deadlines = []
+            if waiting:
+                deadlines.append(next_hedge_at)
+            if fallback_text and fallback_after:
+                deadlines.append(fallback_after)
+            timeout = max(0.0, min(deadlines) - elapsed) if deadlines else None
+
+            if running:
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            else:
+                done = ()
+            for task in done:
+                attempt, chunks = running.pop(task)
+                try:
+                    first = task.result()
+                except StopAsyncIteration:
+                    error = RuntimeError(f'{attempt!r} no devolvió audio')
+                except Exception as e:
+                    error = e
+                else:
+                    if winner is None:
+                        winner = (attempt, chunks, first)
+                    else:
+                        # Dos respuestas en la misma vuelta: se queda la primera
+                        await chunks.aclose()
+                    continue
+                metrics.TTS_ATTEMPT_ERRORS.inc()
+                get_error_reporter().report(
+                    logger, 'tts_attempt', f"⚠️ Falló la petición TTS {attempt!r}", error, level=logging.WARNING
+                )
+                await chunks.aclose()
+            if winner is not None:
+                break
+
+            elapsed = loop.time() - started
+            if waiting and (elapsed >= next_hedge_at or not running):
+                metrics.TTS_HEDGES.inc()
+                logger.info(f"🪃 Sin audio tras {elapsed * 1000:.0f} ms: se lanza {waiting[0]!r}")
+                launch()
+                next_hedge_at = elapsed + hedge_after
+                continue
+
+            if fallback_text and (not running or (fallback_after and elapsed >= fallback_after)):
+                filler = engine.cached(
+                    fallback.provider, fallback_text, fallback.voice_id, fallback.model_id, fallback.output_format
+                )
+                if filler is not None:
+                    metrics.TTS_FALLBACKS.inc()
+                    logger.warning(f"⏳ Sin audio tras {elapsed * 1000:.0f} ms: se reproduce el relleno '{fallback_text}'")
+                    filler_attempt = Attempt(
+                        'relleno', fallback.provider, fallback.voice_id, fallback.model_id, fallback.output_format
+                    )
+                    # Mientras suena, las peticiones siguen: la respuesta llega detrás
+                    for offset in range(0, len(filler), CACHED_CHUNK_SIZE):
+                        yield filler_attempt, filler[offset:offset + CACHED_CHUNK_SIZE]
+                else:
+                    # Sin relleno en caché no se vuelve a mirar: se espera a las peticiones en curso
+                    logger.warning(f"⚠️ El relleno '{fallback_text}' no está en la caché")
+                # Un único relleno por respuesta
+                fallback_text = None
+                continue
+
+            if not running:
+                raise error
+
+        await _cancel(running)
+        attempt, chunks, first = winner
+        if attempt is not attempts[0]:
+            metrics.TTS_HEDGE_WINS.inc()
+            logger.info(f"🪃 Respuesta servida por {attempt!r}")
+        async with contextlib.aclosing(chunks):
+            yield attempt, first
+            async for chunk in chunks:
+                yield attempt, chunk
+    finally:
+        # Interrupción del llamante o cierre: no deja peticiones huérfanas
+        await _cancel(running)
+
+
+async def _cancel(running):
+    """Cancela las peticiones perdedoras y cierra sus generadores."""
+    tasks = list(running)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for task in tasks:
+        _, chunks = running.pop(task)
+        await chunks.aclose()
@@ -0,0 +1,101 @@
+# Nombre del archivo: layers.py
+
+import asyncio
+
+from channels_redis.core import RedisChannelLayer
+
+# Prefijo de los grupos por llamada: el consumidor que atiende el stream de
+# Twilio se une a `call.<CallSid>` y cualquier worker puede enviarle órdenes
+CALL_GROUP_PREFIX = 'call.'
+
+# Órdenes de control que acepta una llamada en curso (mensajes `call.control`)
+CONTROL_HANGUP = 'hangup'
+CONTROL_SAY = 'say'
+CONTROL_TRANSFER = 'transfer'
+CONTROL_ACTIONS = (CONTROL_HANGUP, CONTROL_SAY, CONTROL_TRANSFER)
+
+
+def call_group(call_sid):
+    """Nombre del grupo de la capa de canales de una llamada."""
+    return CALL_GROUP_PREFIX + call_sid
+
+
+def control_message(action, **params):
+    """Mensaje que entrega `group_send` al método `call_control` del consumidor."""
+    return {'type': 'call.control', 'action': action, **params}
+
+
+# Órdenes de operación para los workers: todos están en `workers` y cada uno
+# en `worker.<id>`; las recibe el canal propio del proceso (`admission.py`)
+WORKERS_GROUP = 'workers'
+WORKER_GROUP_PREFIX = 'worker.'
+
+WORKER_DRAIN = 'drain'
+WORKER_RESUME = 'resume'
+WORKER_STATUS = 'status'
+WORKER_ACTIONS = (WORKER_DRAIN, WORKER_RESUME, WORKER_STATUS)
+
+# Órdenes de perfilado del event loop (`profiling.py`): detección de bloqueos,
+# perfil por muestreo y volcado de pilas; también las acepta `/audio/admin/profiling/`
+PROFILE_STATUS = 'profile_status'
+PROFILE_STALLS_ON = 'stalls_on'
+PROFILE_STALLS_OFF = 'stalls_off'
+PROFILE_START = 'profile'
+PROFILE_STOP = 'profile_stop'
+PROFILE_RESET = 'reset'
+PROFILE_DUMP = 'dump'
+PROFILE_ACTIONS = (
+    PROFILE_STATUS, PROFILE_STALLS_ON, PROFILE_STALLS_OFF, PROFILE_START, PROFILE_STOP, PROFILE_RESET, PROFILE_DUMP,
+)
+
+
+def worker_group(worker_id):
+    """Nombre del grupo de un solo worker."""
+    return WORKER_GROUP_PREFIX + worker_id
+
+
+def worker_message(action, reply_to=None, **params):
+    """Orden para los workers; si lleva `reply_to`, cada uno responde ahí con su estado."""
+    return {'type': 'worker.control', 'action': action, 'reply_to': reply_to, **params}
+
+
+async def ask_workers(layer, groups, action, timeout, **params):
+    """
+    Envía una orden a los grupos de workers y devuelve sus respuestas por ID.
+
+    Espera respuestas hasta que pasan `timeout` segundos sin que llegue ninguna.
+    """
+    reply_to = await layer.new_channel()
+    for group in groups:
+        await layer.group_send(group, worker_message(action, reply_to, **params))
+    workers = {}
+    while True:
+        try:
+            message = await asyncio.wait_for(layer.receive(reply_to), timeout)
+        except asyncio.TimeoutError:
+            return workers
+        workers[message['worker']] = message
+
+
+class FakeRedisChannelLayer(RedisChannelLayer):
+    """
+    `RedisChannelLayer` sobre un Redis simulado en memoria (`fakeredis`).
+
+    Ejecuta el mismo código que producción (scripts Lua, grupos, expiración)
+    sin un servidor Redis, para pruebas y desarrollo local. El servidor
+    simulado vive en el proceso: no comunica workers distintos.
+    """
+
+    _server = None
+
+    def __init__(self, hosts=None, **kwargs):
+        try:
+            from fakeredis import FakeServer
+            from fakeredis.aioredis import FakeAsyncRedisConnection
+        except ImportError as e:
+            raise ImportError("REDIS_URL=fakeredis:// necesita `pip install fakeredis[lua]`") from e
+
+        if FakeRedisChannelLayer._server is None:
+            FakeRedisChannelLayer._server = FakeServer()
+        hosts = [{'connection_class': FakeAsyncRedisConnection, 'server': FakeRedisChannelLayer._server}]
+        super().__init__(hosts=hosts, **kwargs)
@@ -0,0 +1,97 @@
+# Nombre del archivo: lifespan.py
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+_startup_hooks = []
+_shutdown_hooks = []
+
+# Tarea del arranque en el event loop del worker (una por loop)
+_startup = None
+
+
+def on_startup(func):
+    """Registra una función (síncrona o corrutina) a ejecutar al arrancar el worker."""
+    _startup_hooks.append(func)
+    return func
+
+
+def on_shutdown(func):
+    """Registra una función (síncrona o corrutina) a ejecutar al parar el worker."""
+    _shutdown_hooks.append(func)
+    return func
+
+
+async def _run_hook(hook):
+    result = hook()
+    if asyncio.iscoroutine(result):
+        await result
+
+
+async def _run_startup_hooks():
+    for hook in _startup_hooks:
+        await _run_hook(hook)
+
+
+def _startup_task():
+    global _startup
+    loop = asyncio.get_running_loop()
+    if _startup is None or _startup.get_loop() is not loop:
+        _startup = loop.create_task(_run_startup_hooks())
+    return _startup
+
+
+async def run_startup():
+    await asyncio.shield(_startup_task())
+
+
+async def ensure_started():
+    """
+    Arranca el worker si el servidor no envió el protocolo `lifespan`.
+
+    Daphne no lo implementa, y sin esto no arrancarían el monitor del event
+    loop, la escucha de `manage.py drain` y `manage.py profile` ni la
+    precarga. Se llama con cada conexión nueva: la primera ejecuta los hooks
+    de arranque y las que llegan mientras tanto esperan a que terminen. Un
+    fallo se registra y no tumba la conexión.
+    """
+    started = _startup is not None and _startup.get_loop() is asyncio.get_running_loop()
+    if started and _startup.done():
+        return
+    if not started:
+        logger.warning("⚠️ El servidor no envió el protocolo lifespan: el worker arranca con la primera conexión")
+    try:
+        await run_startup()
+    except Exception as e:
+        logger.error(f"❌ Error en el arranque: {str(e)}")
+
+
+async def run_shutdown():
+    # En orden inverso al arranque; un fallo no impide ejecutar el resto
+    for hook in reversed(_shutdown_hooks):
+        try:
+            await _run_hook(hook)
+        except Exception as e:
+            logger.error(f"❌ Error en la parada ({getattr(hook, '__name__', hook)}): {str(e)}")
+
+
+async def lifespan_app(scope, receive, send):
+    """Aplicación ASGI para el protocolo `lifespan` (arranque y parada ordenados)."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await run_startup()
+            except Exception as e:
+                logger.error(f"❌ Error en el arranque: {str(e)}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            logger.info("🚀 Worker listo")
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await run_shutdown()
+            logger.info("👋 Worker detenido")
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
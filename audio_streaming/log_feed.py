@@ -0,0 +1,134 @@
+# Nombre del archivo: log_feed.py
+
+import logging
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Grupo de la capa de canales que avisa de que hay AudioLog nuevos
+LOG_FEED_GROUP = 'audio_logs'
+
+# Cursor anterior a cualquier log: con él se recibe la tabla desde el principio
+START_CURSOR = '0'
+
+LOG_FIELDS = ('id', 'timestamp', 'event', 'response_text', 'audio_length', 'twilio_sid', 'ip_address')
+
+# Formato de `timestamp` en la API (el de siempre, en UTC)
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Ids entregados por encima de un hueco que caben en el cursor; por encima se deja de esperar
+_MAX_PENDING_IDS = 1000
+
+
+def decode_log_cursor(cursor):
+    """
+    Devuelve (suelo, ids entregados por encima del suelo, desde cuándo se espera el hueco o None).
+
+    El feed avanza por `id` y no por `timestamp`: cada worker escribe sus logs
+    por lotes y un lote puede traer horas anteriores a filas ya enviadas por
+    otro worker. Pero en Postgres los ids se reparten al insertar y no al
+    confirmar: con dos lotes en vuelo, el de ids mayores puede verse antes.
+    Por eso el cursor es `<suelo>` (todo lo anterior está entregado) o
+    `<suelo>:<desde>:<id>,<id>...` cuando falta algún id por debajo de otros
+    ya entregados; el hueco se vuelve a consultar durante
+    `AUDIO_LOG_FEED_GAP_SECONDS` y después se da por perdido (una
+    transacción deshecha también deja huecos). Lanza ValueError si el
+    cursor no es válido.
+    """
+    try:
+        floor, _, rest = str(cursor).partition(':')
+        floor = int(floor)
+        if rest:
+            since, _, ids = rest.partition(':')
+            since = float(since)
+            delivered = {int(pk) for pk in ids.split(',')}
+        else:
+            since, delivered = None, set()
+    except ValueError as e:
+        raise ValueError(f'Cursor inválido: {cursor}') from e
+    if floor < 0 or any(pk <= floor for pk in delivered):
+        raise ValueError(f'Cursor inválido: {cursor}')
+    return floor, delivered, since
+
+
+def _encode_log_cursor(floor, delivered, since):
+    if not delivered:
+        return str(floor)
+    return f"{floor}:{since:.3f}:{','.join(map(str, sorted(delivered)))}"
+
+
+def _advance(floor, delivered, since, now):
+    """Sube el suelo por los ids entregados seguidos y por los huecos que llevan demasiado esperando."""
+    while delivered:
+        if floor + 1 in delivered:
+            floor += 1
+            delivered.discard(floor)
+            since = None
+        elif since is None:
+            since = now
+            if len(delivered) <= _MAX_PENDING_IDS:
+                break
+        elif now - since >= settings.AUDIO_LOG_FEED_GAP_SECONDS or len(delivered) > _MAX_PENDING_IDS:
+            logger.debug(f"🕳️ Hueco de logs tras el id {floor} abandonado")
+            floor = min(delivered) - 1
+            since = None
+        else:
+            break
+    return _encode_log_cursor(floor, delivered, since)
+
+
+def _format(rows):
+    for row in rows:
+        row['timestamp'] = row['timestamp'].strftime(TIMESTAMP_FORMAT)
+    return rows
+
+
+def latest_logs(limit):
+    """Los `limit` logs más recientes (del más nuevo al más antiguo) y el cursor tras ellos."""
+    from .models import AudioLog
+
+    rows = list(AudioLog.objects.order_by('-id').values(*LOG_FIELDS)[:limit])
+    if not rows:
+        return rows, None
+    # Los huecos entre las filas entregadas se esperan como en `logs_since`
+    delivered = {row['id'] for row in rows}
+    cursor = _advance(min(delivered) - 1, delivered, None, time.time())
+    return _format(rows), cursor
+
+
+def logs_since(cursor, limit):
+    """
+    Logs posteriores a `cursor` (del más nuevo al más antiguo), como mucho `limit`.
+
+    Devuelve (filas, cursor tras lo entregado, si quedan más). Si hay más
+    de `limit` nuevos se entregan los más antiguos y el cliente vuelve a pedir
+    con el cursor devuelto. Los ids que faltaban en una consulta anterior se
+    entregan si aparecen después (ver `decode_log_cursor`). Lanza ValueError
+    si el cursor no es válido.
+    """
+    from .models import AudioLog
+
+    floor, delivered, since = decode_log_cursor(cursor)
+    rows = list(
+        AudioLog.objects.filter(id__gt=floor).exclude(id__in=delivered).order_by('id').values(*LOG_FIELDS)[:limit + 1]
+    )
+    more = len(rows) > limit
+    rows = rows[:limit]
+    delivered.update(row['id'] for row in rows)
+    cursor = _advance(floor, delivered, since, time.time())
+    rows.reverse()
+    return _format(rows), cursor, more
+
+
+async def notify_logs_written():
+    """Despierta a los feeds de logs de todos los workers; el mensaje no lleva datos."""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        await layer.group_send(LOG_FEED_GROUP, {'type': 'audio_logs.written'})
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo avisar de logs nuevos: {str(e)}")
@@ -0,0 +1,197 @@
+# Nombre del archivo: log_pipeline.py
+
+import copy
+import logging
+import logging.handlers
+import queue
+import time
+
+from django.conf import settings
+
+from . import metrics
+
+# Loggers de `settings.LOGGING` cuyos handlers se mueven detrás de la cola
+QUEUED_LOGGERS = ('', 'calls', 'audio_streaming')
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Encola los registros de log sin bloquear.
+
+    El mensaje se compone con sus argumentos al encolar, como en
+    `QueueHandler.prepare`: los argumentos pueden cambiar (o dejar de ser
+    seguros de leer) antes de que el `QueueListener` llegue al registro. Lo
+    caro, aplicar el formato y convertir el traceback en texto, se hace en
+    el hilo del listener, fuera del event loop. Si la cola está llena el
+    registro se descarta y se cuenta en `dropped`.
+    """
+
+    def __init__(self, queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Copia: los demás handlers del registro (p. ej. los de los tests) lo ven intacto
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class QueueLogging:
+    """
+    Escritura de logs en segundo plano (en consola y en `logs/debug.log`).
+
+    `start` sustituye los handlers de los loggers configurados por un
+    `NonBlockingQueueHandler`, y un `QueueListener` (un hilo) los vacía hacia
+    los handlers originales. Los loggers que comparten handlers comparten
+    cola. `stop` escribe lo pendiente y restaura la configuración.
+    """
+
+    def __init__(self, max_records=10000):
+        self.max_records = max_records
+        self._pipes = []
+        self._saved = {}
+
+    @property
+    def running(self):
+        return bool(self._pipes)
+
+    def start(self, logger_names=QUEUED_LOGGERS):
+        if self.running:
+            return
+        pipes = {}
+        for name in logger_names:
+            log = logging.getLogger(name)
+            handlers = tuple(log.handlers)
+            if not handlers:
+                continue
+            if handlers not in pipes:
+                handler = NonBlockingQueueHandler(queue.Queue(self.max_records))
+                listener = logging.handlers.QueueListener(handler.queue, *handlers, respect_handler_level=True)
+                pipes[handlers] = (handler, listener)
+            self._saved[name] = log.handlers
+            log.handlers = [pipes[handlers][0]]
+        self._pipes = list(pipes.values())
+        for _, listener in self._pipes:
+            listener.start()
+
+    def stop(self):
+        for name, handlers in self._saved.items():
+            logging.getLogger(name).handlers = handlers
+        for _, listener in self._pipes:
+            listener.stop()
+        self._saved = {}
+        self._pipes = []
+
+    @property
+    def dropped(self):
+        return sum(handler.dropped for handler, _ in self._pipes)
+
+    def stats(self):
+        return {
+            'running': self.running,
+            'queued': sum(handler.queue.qsize() for handler, _ in self._pipes),
+            'dropped': self.dropped,
+        }
+
+
+class ErrorReporter:
+    """
+    Registro de errores con límite y muestreo por tipo.
+
+    Cada error se cuenta por `(where, tipo de excepción)`. De cada tipo se
+    registran con traceback los `burst` primeros de cada `interval` segundos;
+    el resto solo se cuenta y, de ellos, uno de cada `sample_every` se
+    registra en una línea con el número de omitidos. Así una caída del
+    proveedor o un cliente que envía basura en cada trama no generan miles
+    de tracebacks idénticos. Se usa desde el event loop (no es thread-safe).
+    """
+
+    def __init__(self, burst=5, interval=60.0, sample_every=100):
+        self.burst = burst
+        self.interval = interval
+        self.sample_every = sample_every
+        self.counts = {}
+        self.suppressed = 0
+        # (where, tipo) -> [inicio del intervalo, registrados, omitidos]
+        self._windows = {}
+
+    def report(self, logger, where, message, error=None, level=None):
+        """
+        Cuenta el error y lo registra en `logger` si entra en el límite.
+
+        `level` es ERROR por defecto si hay excepción y WARNING si no.
+        Devuelve True si se registró.
+        """
+        key = (where, type(error).__name__ if error is not None else '')
+        self.counts[key] = self.counts.get(key, 0) + 1
+        metrics.ERRORS.inc()
+
+        now = time.monotonic()
+        window = self._windows.get(key)
+        if window is None or now - window[0] >= self.interval:
+            window = self._windows[key] = [now, 0, window[2] if window else 0]
+
+        if level is None:
+            level = logging.ERROR if error is not None else logging.WARNING
+        if window[1] < self.burst:
+            window[1] += 1
+            omitted, window[2] = window[2], 0
+            suffix = f' ({omitted} similares omitidos)' if omitted else ''
+            # stacklevel=2: el registro lleva el módulo que informa del error, no este
+            if error is not None:
+                logger.log(level, '%s: %s%s', message, error, suffix, exc_info=error, stacklevel=2)
+            else:
+                logger.log(level, '%s%s', message, suffix, stacklevel=2)
+            return True
+
+        window[2] += 1
+        self.suppressed += 1
+        metrics.ERRORS_SUPPRESSED.inc()
+        if window[2] % self.sample_every == 0:
+            if error is not None:
+                logger.log(level, '%s: %s (%d similares omitidos)', message, error, window[2], stacklevel=2)
+            else:
+                logger.log(level, '%s (%d similares omitidos)', message, window[2], stacklevel=2)
+            return True
+        return False
+
+    def stats(self):
+        return {
+            'counts': {f'{where}:{kind}' if kind else where: count for (where, kind), count in self.counts.items()},
+            'suppressed': self.suppressed,
+        }
+
+
+_pipeline = None
+_errors = None
+
+
+def get_log_pipeline():
+    """Devuelve la tubería de logs del proceso (se arranca en `AudioStreamingConfig.ready`)."""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = QueueLogging(max_records=settings.LOG_QUEUE_MAX_RECORDS)
+        metrics.REGISTRY.counter(
+            'log_records_dropped_total', 'Registros de log descartados por cola llena', lambda: _pipeline.dropped
+        )
+    return _pipeline
+
+
+def get_error_reporter():
+    """Devuelve el contador de errores compartido por todas las conexiones del proceso."""
+    global _errors
+    if _errors is None:
+        _errors = ErrorReporter(
+            burst=settings.LOG_ERROR_BURST,
+            interval=settings.LOG_ERROR_INTERVAL,
+            sample_every=settings.LOG_ERROR_SAMPLE_EVERY,
+        )
+    return _errors
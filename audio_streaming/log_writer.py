@@ -0,0 +1,138 @@
+# Nombre del archivo: log_writer.py
+
+import asyncio
+import logging
+import time
+from collections import deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from . import metrics
+from .log_feed import notify_logs_written
+
+logger = logging.getLogger(__name__)
+
+
+class AudioLogWriter:
+    """
+    Escritura de `AudioLog` en segundo plano y por lotes.
+
+    Los registros se acumulan en memoria y una tarea los inserta con
+    `bulk_create` cuando hay `batch_size` pendientes o han pasado
+    `flush_interval` segundos. Si la base de datos no da abasto y se
+    acumulan más de `max_pending`, los nuevos se descartan y se cuentan.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_pending=10000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = deque()
+        self._wakeup = None
+        self._task = None
+        self._flush_lock = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    def add(self, **fields):
+        """Encola un registro; no toca la base de datos."""
+        from .models import AudioLog
+
+        if len(self._pending) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._pending.append(AudioLog(**fields))
+        self._ensure_started()
+        if len(self._pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Inserta todo lo pendiente. Devuelve cuántos registros se escribieron."""
+        if not self._pending:
+            return 0
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                batch = [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+                started = time.perf_counter()
+                try:
+                    await database_sync_to_async(self._bulk_create)(batch)
+                    metrics.AUDIO_LOG_WRITE.observe(time.perf_counter() - started)
+                    written += len(batch)
+                except Exception as e:
+                    self.failed += len(batch)
+                    logger.error(f"❌ Error al guardar {len(batch)} logs de audio: {str(e)}")
+            self.written += written
+            self.flushes += 1
+        if written:
+            await notify_logs_written()
+        return written
+
+    @staticmethod
+    def _bulk_create(batch):
+        from .models import AudioLog
+
+        AudioLog.objects.bulk_create(batch)
+
+    async def close(self):
+        """Detiene la tarea y escribe lo que quede pendiente."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._pending:
+            self._flush_lock = self._flush_lock or asyncio.Lock()
+            await self.flush()
+
+    def stats(self):
+        return {
+            'pending': len(self._pending),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+            'flushes': self.flushes,
+        }
+
+
+_writer = None
+
+
+def _register_metrics(writer):
+    metrics.REGISTRY.gauge('audio_log_pending', 'AudioLog en cola pendientes de escribir', lambda: len(writer._pending))
+    metrics.REGISTRY.counter('audio_log_written_total', 'AudioLog escritos en la base de datos', lambda: writer.written)
+    metrics.REGISTRY.counter('audio_log_dropped_total', 'AudioLog descartados por exceso de pendientes', lambda: writer.dropped)
+    metrics.REGISTRY.counter('audio_log_failed_total', 'AudioLog perdidos por errores de escritura', lambda: writer.failed)
+
+
+def get_audio_log_writer():
+    """Devuelve el escritor de logs compartido por todas las conexiones del proceso."""
+    global _writer
+    if _writer is None:
+        _writer = AudioLogWriter(
+            batch_size=settings.AUDIO_LOG_BATCH_SIZE,
+            flush_interval=settings.AUDIO_LOG_FLUSH_INTERVAL,
+            max_pending=settings.AUDIO_LOG_MAX_PENDING,
+        )
+        _register_metrics(_writer)
+    return _writer
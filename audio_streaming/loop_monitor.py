@@ -0,0 +1,74 @@
+# Nombre del archivo: loop_monitor.py
+
+import asyncio
+import contextlib
+
+from django.conf import settings
+
+from . import metrics
+
+
+class LoopLagMonitor:
+    """
+    Retraso del event loop del worker.
+
+    Cada `interval` segundos se duerme y mide cuánto tarda de más en
+    despertar: un loop sano despierta a tiempo (menos de 1 ms), y si hay
+    callbacks largos o más trabajo del que da abasto el retraso crece. `lag`
+    es la media móvil exponencial (`smoothing`) que usa el control de
+    admisión; `last` y `max_lag` son la última medida y la mayor vista.
+    """
+
+    def __init__(self, interval=0.1, smoothing=0.2):
+        self.interval = interval
+        self.smoothing = smoothing
+        self.lag = 0.0
+        self.last = 0.0
+        self.max_lag = 0.0
+        self._task = None
+
+    @property
+    def running(self):
+        # Una tarea de un loop ya cerrado no volverá a ejecutarse
+        return self._task is not None and not self._task.done() and not self._task.get_loop().is_closed()
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.observe(max(0.0, loop.time() - expected))
+
+    def observe(self, lag):
+        self.last = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.lag += self.smoothing * (lag - self.lag)
+        metrics.LOOP_LAG.observe(lag)
+
+    def stats(self):
+        return {'running': self.running, 'lag': self.lag, 'last': self.last, 'max': self.max_lag}
+
+
+_monitor = None
+
+
+def get_loop_monitor():
+    """Devuelve el monitor del event loop del proceso (se arranca con el worker)."""
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopLagMonitor(interval=settings.LOOP_LAG_INTERVAL_MS / 1000)
+        metrics.REGISTRY.gauge(
+            'event_loop_lag_smoothed_seconds', 'Retraso del event loop (media móvil)', lambda: _monitor.lag
+        )
+    return _monitor
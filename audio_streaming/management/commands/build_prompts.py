@@ -0,0 +1,82 @@
+# Nombre del archivo: build_prompts.py
+
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from audio_streaming.clients import tts_providers
+from audio_streaming.prompts import write_bundle
+from audio_streaming.transcode import Transcoder
+from audio_streaming.tts import TTSEngine
+from audio_streaming.twilio_media import SAMPLE_RATE, WIRE_FORMAT
+
+
+class Command(BaseCommand):
+    help = (
+        'Sintetiza las locuciones de VOICE_PROMPTS en μ-law 8 kHz y las empaqueta en '
+        'PROMPTS_DIR. Los workers cargan el bundle al arrancar y las reproducen sin llamar al TTS.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--provider', help='proveedor TTS (por defecto, TTS_PROVIDER)')
+        parser.add_argument('--output', help='directorio del bundle (por defecto, PROMPTS_DIR)')
+        parser.add_argument('--concurrency', type=int, default=settings.TTS_MAX_CONCURRENCY,
+                            help='síntesis simultáneas')
+        parser.add_argument('--only', action='append', default=[],
+                            help='nombre de la locución (ver VOICE_PROMPTS); se puede repetir y el bundle '
+                                 'solo tendrá esas. Por defecto, todas')
+
+    def handle(self, *args, **options):
+        provider = tts_providers.get(options['provider'])
+        if provider is None:
+            raise CommandError(f"Proveedor TTS no disponible: {options['provider'] or settings.TTS_PROVIDER}")
+
+        catalog = settings.VOICE_PROMPTS
+        unknown = [name for name in options['only'] if name not in catalog]
+        if unknown:
+            raise CommandError(f"Locuciones desconocidas: {', '.join(unknown)} (hay: {', '.join(catalog)})")
+        names = options['only'] or list(catalog)
+
+        started = time.perf_counter()
+        prompts = async_to_sync(self._synthesize)(provider, [(name, catalog[name]) for name in names], options)
+        manifest = write_bundle(options['output'] or settings.PROMPTS_DIR, prompts)
+
+        for prompt in prompts:
+            self.stdout.write(f"🗣️ {prompt['name']}: {len(prompt['audio']) / SAMPLE_RATE:.2f} s")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {len(prompts)} locuciones de {provider.name} en {manifest} "
+            f"({time.perf_counter() - started:.1f} s). Reinicia los workers para cargarlas"
+        ))
+
+    async def _synthesize(self, provider, catalog, options):
+        # Motor propio sin caché: siempre se pide audio nuevo al proveedor
+        engine = TTSEngine(max_concurrency=max(1, options['concurrency']))
+        output_format = provider.negotiate_format(WIRE_FORMAT)
+        try:
+            results = await asyncio.gather(
+                *(engine.synthesize(provider, text, output_format=output_format) for _, text in catalog),
+                return_exceptions=True,
+            )
+        finally:
+            engine.shutdown()
+
+        errors = [f'{name}: {result}' for (name, _), result in zip(catalog, results) if isinstance(result, Exception)]
+        if errors:
+            # No se escribe un bundle a medias
+            raise CommandError('No se pudieron sintetizar:\n' + '\n'.join(errors))
+
+        prompts = []
+        for (name, text), audio in zip(catalog, results):
+            encoder = Transcoder(output_format, WIRE_FORMAT)
+            prompts.append({
+                'name': name,
+                'text': text,
+                'provider': provider.name,
+                'voice_id': provider.voice_id,
+                'model_id': provider.model_id,
+                'audio': encoder.feed(audio) + encoder.flush(),
+            })
+        return prompts
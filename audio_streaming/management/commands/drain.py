@@ -0,0 +1,61 @@
+# Nombre del archivo: drain.py
+
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import CommandError
+
+from audio_streaming.layers import WORKER_DRAIN, WORKER_RESUME, WORKER_STATUS
+from audio_streaming.management.workers import WorkerCommand
+
+# Segundos entre consultas de estado con --wait
+POLL_INTERVAL = 2.0
+
+
+class Command(WorkerCommand):
+    help = (
+        'Drena los workers para un despliegue sin cortes: dejan de admitir llamadas nuevas '
+        'y terminan las que tienen. Con --resume vuelven a admitirlas.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--resume', action='store_true', help='vuelve a admitir llamadas')
+        parser.add_argument('--status', action='store_true', help='solo muestra el estado de los workers')
+        parser.add_argument('--wait', action='store_true',
+                            help='espera a que los workers en drenaje no tengan sesiones activas')
+        parser.add_argument('--wait-timeout', type=float, default=600.0, help='máximo de segundos con --wait')
+
+    def handle(self, *args, **options):
+        layer = self.get_layer()
+        if options['status']:
+            action = WORKER_STATUS
+        elif options['resume']:
+            action = WORKER_RESUME
+        else:
+            action = WORKER_DRAIN
+        async_to_sync(self._run)(layer, action, options)
+
+    async def _run(self, layer, action, options):
+        workers = await self.ask(layer, action, options)
+        self._print(workers)
+        if action != WORKER_DRAIN or not options['wait']:
+            return
+
+        deadline = time.monotonic() + options['wait_timeout']
+        while any(worker['sessions'] for worker in workers.values() if worker['draining']):
+            if time.monotonic() >= deadline:
+                raise CommandError('Tiempo agotado: aún hay llamadas activas en los workers en drenaje')
+            await asyncio.sleep(POLL_INTERVAL)
+            workers = await self.ask(layer, WORKER_STATUS, options)
+            self._print(workers)
+        self.stdout.write(self.style.SUCCESS('✅ Workers drenados: sin llamadas activas'))
+
+    def _print(self, workers):
+        for worker_id, worker in sorted(workers.items()):
+            state = 'drenaje' if worker['draining'] else 'activo'
+            self.stdout.write(
+                f"{worker_id}: {state}, {worker['sessions']} sesiones, "
+                f"{worker['tts_waiting']} síntesis en espera, retraso del loop {worker['loop_lag'] * 1000:.1f} ms"
+            )
@@ -0,0 +1,103 @@
+# Nombre del archivo: profile.py
+
+import asyncio
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import CommandError
+
+from audio_streaming.layers import (
+    PROFILE_DUMP,
+    PROFILE_RESET,
+    PROFILE_STALLS_OFF,
+    PROFILE_STALLS_ON,
+    PROFILE_START,
+    PROFILE_STATUS,
+)
+from audio_streaming.management.workers import WorkerCommand
+from audio_streaming.profiling import STACKS_PROFILE, STACKS_STALLS
+
+
+class Command(WorkerCommand):
+    help = (
+        'Perfilado en caliente del event loop de los workers: activa o desactiva la detección '
+        'de bloqueos, toma un perfil por muestreo y vuelca las pilas en formato "collapsed" '
+        '(flamegraph.pl, speedscope). Sin opciones muestra el estado.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--stalls', choices=('on', 'off'), help='activa o desactiva la detección de bloqueos')
+        parser.add_argument('--threshold-ms', type=float, help='umbral de bloqueo con --stalls on')
+        parser.add_argument('--seconds', type=float,
+                            help='toma un perfil por muestreo de estos segundos y vuelca sus pilas')
+        parser.add_argument('--interval-ms', type=float, help='intervalo entre muestras con --seconds')
+        parser.add_argument('--dump', choices=(STACKS_PROFILE, STACKS_STALLS),
+                            help='vuelca las pilas del último perfil o de los bloqueos registrados')
+        parser.add_argument('--reset', action='store_true', help='descarta los bloqueos y el perfil registrados')
+        parser.add_argument('-o', '--output', help='fichero para las pilas (por defecto, la salida estándar)')
+
+    def handle(self, *args, **options):
+        layer = self.get_layer()
+        async_to_sync(self._run)(layer, options)
+
+    async def _run(self, layer, options):
+        if options['reset']:
+            await self._ask(layer, PROFILE_RESET, options)
+        if options['stalls'] == 'on':
+            await self._ask(layer, PROFILE_STALLS_ON, options, threshold_ms=options['threshold_ms'])
+        elif options['stalls'] == 'off':
+            await self._ask(layer, PROFILE_STALLS_OFF, options)
+
+        if options['seconds']:
+            await self._ask(layer, PROFILE_START, options,
+                            seconds=options['seconds'], interval_ms=options['interval_ms'])
+            self.stderr.write(f"🔬 Tomando un perfil de {options['seconds']:g} s...")
+            await asyncio.sleep(options['seconds'])
+            await self._dump(layer, STACKS_PROFILE, options)
+        elif options['dump']:
+            await self._dump(layer, options['dump'], options)
+        else:
+            self._print(await self._ask(layer, PROFILE_STATUS, options))
+
+    async def _ask(self, layer, action, options, **params):
+        workers = await self.ask(layer, action, options, **params)
+        errors = [f"{worker_id}: {reply['error']}" for worker_id, reply in workers.items() if 'error' in reply]
+        if errors:
+            raise CommandError('\n'.join(errors))
+        return workers
+
+    async def _dump(self, layer, kind, options):
+        """Escribe las pilas de todos los workers, cada una con el ID del worker como raíz."""
+        workers = await self._ask(layer, PROFILE_DUMP, options, kind=kind)
+        lines = [
+            f'{worker_id};{line}\n'
+            for worker_id, reply in sorted(workers.items())
+            for line in reply['collapsed'].splitlines()
+        ]
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(
+                f"✅ {len(lines)} pilas de {len(workers)} workers en {options['output']}"
+            ))
+        else:
+            self.stdout.write(''.join(lines), ending='')
+
+    def _print(self, workers):
+        for worker_id, worker in sorted(workers.items()):
+            stalls, profile = worker['stalls'], worker['profile']
+            state = f"activada ({stalls['threshold'] * 1000:.0f} ms)" if stalls['enabled'] else 'desactivada'
+            self.stdout.write(
+                f"{worker_id}: retraso del loop {worker['loop_lag']['lag'] * 1000:.1f} ms, "
+                f"detección de bloqueos {state}, {stalls['count']} bloqueos"
+            )
+            for handler, totals in stalls['by_handler'].items():
+                self.stdout.write(f"    bloqueos en {handler}: {totals['count']} ({totals['seconds'] * 1000:.0f} ms)")
+            if profile['samples']:
+                running = ' (en curso)' if profile['running'] else ''
+                self.stdout.write(
+                    f"    perfil{running}: {profile['samples']} muestras, {profile['cpu_seconds']:.2f} s de CPU "
+                    f"en {profile['seconds']:g} s"
+                )
+                for handler, samples in profile['by_handler'].items():
+                    self.stdout.write(f"    {samples / profile['samples']:6.1%} {handler}")
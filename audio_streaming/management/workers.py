@@ -0,0 +1,37 @@
+# Nombre del archivo: workers.py
+
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from django.core.management.base import BaseCommand, CommandError
+
+from audio_streaming.layers import WORKERS_GROUP, ask_workers, worker_group
+
+
+class WorkerCommand(BaseCommand):
+    """Base de los comandos que envían órdenes a los workers por la capa de canales."""
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker', action='append', default=[],
+                            help='ID del worker (ver /audio/health/); se puede repetir. Por defecto, todos')
+        parser.add_argument('--timeout', type=float, default=2.0, help='segundos esperando respuestas')
+
+    def get_layer(self):
+        layer = get_channel_layer()
+        if layer is None:
+            raise CommandError('No hay capa de canales configurada (CHANNEL_LAYERS)')
+        if isinstance(layer, InMemoryChannelLayer):
+            self.stderr.write(self.style.WARNING(
+                'La capa de canales es en memoria: la orden no sale de este proceso. '
+                'Configura REDIS_URL o usa los endpoints /audio/admin/ de cada worker.'
+            ))
+        return layer
+
+    async def ask(self, layer, action, options, **params):
+        """Envía la orden a los workers elegidos y devuelve sus respuestas; error si ninguno responde."""
+        groups = [worker_group(worker) for worker in options['worker']] or [WORKERS_GROUP]
+        workers = await ask_workers(layer, groups, action, options['timeout'], **params)
+        if not workers:
+            raise CommandError(
+                'Ningún worker respondió (sin el protocolo lifespan, como en Daphne, un worker '
+                'atiende órdenes a partir de su primera conexión WebSocket)'
+            )
+        return workers
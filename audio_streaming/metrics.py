@@ -0,0 +1,210 @@
+# Nombre del archivo: metrics.py
+
+from bisect import bisect_left
+
+# Límites (en segundos) pensados para latencias de voz: de 5 ms a 10 s
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Para operaciones del hot path (decodificar una trama, enviar un frame): de 50 µs a 250 ms
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.25)
+
+
+def _escape_help(text):
+    """En el formato de texto de Prometheus, `HELP` escapa la barra invertida y el salto de línea."""
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+class Histogram:
+    """Histograma acumulativo de buckets fijos; `observe` es O(log n) y sin reservas."""
+
+    __slots__ = ('name', 'help', 'buckets', 'counts', 'sum', 'count')
+    type = 'histogram'
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'buckets': dict(zip(self.buckets + (float('inf'),), self.counts)),
+        }
+
+    def render(self):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{self.name}_bucket{{le="{le}"}} {cumulative}')
+        lines.append(f'{self.name}_sum {self.sum}')
+        lines.append(f'{self.name}_count {self.count}')
+        return lines
+
+
+class Counter:
+    """Contador monótono. Con `func`, el valor se lee de otro objeto al exportar."""
+
+    __slots__ = ('name', 'help', 'value', 'func')
+    type = 'counter'
+
+    def __init__(self, name, help, func=None):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.func = func
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.func() if self.func else self.value
+
+    def snapshot(self):
+        return self.get()
+
+    def render(self):
+        return [f'{self.name} {self.get()}']
+
+
+class Gauge(Counter):
+    """Valor instantáneo que puede subir y bajar."""
+
+    __slots__ = ()
+    type = 'gauge'
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Registry:
+    """Registro de métricas del proceso."""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def _get_or_create(self, cls, name, *args, **kwargs):
+        if name not in self._metrics:
+            self._metrics[name] = cls(name, *args, **kwargs)
+        return self._metrics[name]
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._get_or_create(Histogram, name, help, buckets)
+
+    def counter(self, name, help, func=None):
+        return self._get_or_create(Counter, name, help, func)
+
+    def gauge(self, name, help, func=None):
+        return self._get_or_create(Gauge, name, help, func)
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self._metrics.items()}
+
+    def render_prometheus(self):
+        """Exporta todas las métricas en el formato de texto de Prometheus."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {_escape_help(metric.help)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Conexiones
+ACTIVE_STREAMS = REGISTRY.gauge(
+    'audio_streams_active',
+    'Conexiones WebSocket de audio abiertas en este worker',
+)
+RECEIVE_DECODE = REGISTRY.histogram(
+    'stream_receive_decode_seconds',
+    'Desde que llega un mensaje media hasta que su audio está decodificado y analizado',
+    FAST_BUCKETS,
+)
+TIME_TO_FIRST_AUDIO = REGISTRY.histogram(
+    'stream_time_to_first_audio_seconds',
+    'Desde el fin del turno del llamante hasta que la primera trama de la respuesta entra en la cola de salida',
+)
+BARGE_INS = REGISTRY.counter(
+    'stream_barge_ins_total',
+    'Respuestas cortadas porque el llamante empezó a hablar',
+)
+ADMISSION_REJECTED = REGISTRY.counter(
+    'admission_rejected_total',
+    'Llamadas y conexiones rechazadas por el control de admisión (sobrecarga o drenaje)',
+)
+LOOP_LAG = REGISTRY.histogram(
+    'event_loop_lag_seconds',
+    'Retraso del event loop al despertar de una espera programada',
+    FAST_BUCKETS,
+)
+LOOP_STALLS = REGISTRY.histogram(
+    'event_loop_stall_seconds',
+    'Bloqueos del event loop por encima del umbral (solo con la detección de bloqueos activada)',
+)
+
+# Síntesis
+TTS_TIME_TO_FIRST_BYTE = REGISTRY.histogram(
+    'tts_time_to_first_byte_seconds',
+    'Tiempo desde la petición de síntesis hasta el primer fragmento de audio',
+)
+TTS_SYNTHESIS = REGISTRY.histogram(
+    'tts_synthesis_seconds',
+    'Tiempo desde la petición de síntesis hasta el último fragmento de audio',
+)
+TTS_HEDGES = REGISTRY.counter(
+    'tts_hedged_requests_total',
+    'Peticiones TTS de respaldo lanzadas porque la principal no dio el primer fragmento a tiempo o falló',
+)
+TTS_HEDGE_WINS = REGISTRY.counter(
+    'tts_hedge_wins_total',
+    'Respuestas servidas por una petición de respaldo en lugar de la principal',
+)
+TTS_FALLBACKS = REGISTRY.counter(
+    'tts_fallbacks_total',
+    'Respuestas sustituidas por la frase de relleno cacheada',
+)
+TTS_ATTEMPT_ERRORS = REGISTRY.counter(
+    'tts_attempt_errors_total',
+    'Peticiones TTS (principales o de respaldo) que fallaron antes del primer fragmento',
+)
+
+# Envío
+WS_SEND = REGISTRY.histogram(
+    'ws_send_seconds',
+    'Duración de cada envío de un frame al WebSocket',
+    FAST_BUCKETS,
+)
+OUTBOUND_QUEUED = REGISTRY.gauge(
+    'outbound_queue_depth',
+    'Mensajes de audio en cola pendientes de envío (todas las conexiones)',
+)
+
+# Errores y logs
+ERRORS = REGISTRY.counter(
+    'errors_total',
+    'Errores y avisos contados por el registro de errores (se hayan escrito en el log o no)',
+)
+ERRORS_SUPPRESSED = REGISTRY.counter(
+    'errors_suppressed_total',
+    'Errores que no se escribieron en el log por superar el límite de su tipo',
+)
+
+# Base de datos
+AUDIO_LOG_WRITE = REGISTRY.histogram(
+    'audio_log_write_seconds',
+    'Duración de cada bulk_create de AudioLog',
+)
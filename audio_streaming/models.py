@@ -9,4 +9,4 @@ class AudioLog(models.Model):
     ip_address = models.GenericIPAddressField(blank=True, null=True)
 
     def __str__(self):
-        return f"{self.timestamp} | {self.event}"
\ No newline at end of file
+        return f"{self.timestamp} | {self.event}"
@@ -0,0 +1,79 @@
+# Nombre del archivo: outbound.py
+
+import asyncio
+import logging
+
+from . import metrics
+from .log_pipeline import get_error_reporter
+
+logger = logging.getLogger(__name__)
+
+
+class OutboundQueue:
+    """
+    Cola acotada de mensajes salientes de una conexión.
+
+    La síntesis deposita los mensajes y una única tarea los envía al socket en
+    orden. Si el llamante interrumpe, `flush()` descarta lo que aún no salió.
+    Al estar acotada, una síntesis más rápida que el socket espera en `put()`.
+    """
+
+    def __init__(self, send, maxsize=50):
+        self._send = send
+        self._queue = asyncio.Queue(maxsize)
+        self._task = None
+        self.sent = 0
+        self.flushed = 0
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def put(self, message):
+        await self._queue.put(message)
+        metrics.OUTBOUND_QUEUED.inc()
+
+    def flush(self):
+        """Descarta los mensajes pendientes y devuelve cuántos eran."""
+        dropped = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+            self._queue.task_done()
+            dropped += 1
+        self.flushed += dropped
+        metrics.OUTBOUND_QUEUED.dec(dropped)
+        return dropped
+
+    async def join(self):
+        """Espera a que salga todo lo encolado hasta ahora."""
+        await self._queue.join()
+
+    async def close(self):
+        self.flush()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            message = await self._queue.get()
+            metrics.OUTBOUND_QUEUED.dec()
+            try:
+                await self._send(message)
+                self.sent += 1
+            except Exception as e:
+                # Con el socket roto fallan todas las tramas: el registro de errores las agrupa
+                get_error_reporter().report(logger, 'send', "❌ Error enviando audio", e)
+            finally:
+                self._queue.task_done()
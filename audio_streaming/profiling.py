@@ -0,0 +1,330 @@
+# Nombre del archivo: profiling.py
+
+import asyncio
+import logging
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from . import metrics
+from .layers import (
+    PROFILE_DUMP,
+    PROFILE_RESET,
+    PROFILE_STALLS_OFF,
+    PROFILE_STALLS_ON,
+    PROFILE_START,
+    PROFILE_STATUS,
+    PROFILE_STOP,
+)
+from .loop_monitor import get_loop_monitor
+
+logger = logging.getLogger(__name__)
+
+# Módulo cuyos métodos reciben la atribución de bloqueos y muestras
+CONSUMER_MODULE = 'audio_streaming.consumers'
+# Atribución de lo que no pasa por un método del consumidor (vistas, logs, tareas internas)
+OUTSIDE_CONSUMER = '(fuera del consumidor)'
+# Una muestra cuya hoja está en estos módulos es el loop esperando eventos (ocioso)
+IDLE_MODULES = ('selectors',)
+
+# Pilas que se pueden volcar en formato "collapsed"
+STACKS_PROFILE = 'profile'
+STACKS_STALLS = 'stalls'
+
+
+def _walk(frame):
+    """Pila de un frame como tupla de `(code, módulo)`, de la raíz a la hoja."""
+    stack = []
+    while frame is not None:
+        stack.append((frame.f_code, frame.f_globals.get('__name__', '?')))
+        frame = frame.f_back
+    stack.reverse()
+    return tuple(stack)
+
+
+def _frame_name(code, module):
+    return f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def _handler(stack):
+    """Método del consumidor más interno de la pila, o `OUTSIDE_CONSUMER`."""
+    for code, module in reversed(stack):
+        if module == CONSUMER_MODULE:
+            return getattr(code, 'co_qualname', code.co_name)
+    return OUTSIDE_CONSUMER
+
+
+def _seconds(value, default=None):
+    """Milisegundos de un parámetro de la orden (texto o número) en segundos."""
+    if value in (None, ''):
+        return default
+    value = float(value) / 1000
+    if value <= 0:
+        raise ValueError('Los intervalos deben ser mayores que 0')
+    return value
+
+
+class LoopProfiler:
+    """
+    Perfilado en caliente del event loop del worker, desactivado por defecto.
+
+    - Detección de bloqueos: un hilo vigilante programa una sonda en el loop
+      (`call_soon_threadsafe`) y, si no se ejecuta en `stall_threshold`
+      segundos, captura la pila del hilo del loop en ese momento. Cada bloqueo
+      se atribuye al método de `AudioStreamConsumer` más interno de la pila y
+      guarda la función hoja (TTS, base de datos, JSON, logs...).
+    - Perfil por muestreo: durante unos segundos, un temporizador de CPU
+      (`setitimer(ITIMER_PROF)`) interrumpe el hilo del loop cada
+      `sample_interval` de CPU consumida y se guarda su pila. Se muestrea
+      desde el propio hilo (con un hilo aparte, el GIL sesgaría las muestras
+      hacia las esperas de `select`), así que solo funciona si el loop corre
+      en el hilo principal, como en Daphne. Las muestras con el loop
+      esperando eventos cuentan como ociosas; el resto da el reparto de CPU
+      por método.
+
+    Las pilas se vuelcan en formato "collapsed" (`a;b;c 12`), el que leen
+    flamegraph.pl, speedscope o inferno. `attach` se llama desde el loop al
+    arrancar el worker; el resto, desde cualquier hilo.
+    """
+
+    def __init__(self, stall_threshold=0.1, sample_interval=0.005, max_seconds=300, max_stalls=100):
+        self.stall_threshold = stall_threshold
+        self.sample_interval = sample_interval
+        self.max_seconds = max_seconds
+        self.profile = {}
+        self._lock = threading.Lock()
+        self._stalls = deque(maxlen=max_stalls)
+        # pila -> segundos bloqueados; método -> [bloqueos, segundos]
+        self._stall_stacks = {}
+        self._stall_handlers = {}
+        # pila -> muestras del perfil; solo las escribe el hilo del loop
+        self._samples = {}
+        self._idle_samples = 0
+        self._profile_until = 0.0
+        self._loop = None
+        self._thread_id = None
+        # (hilo, evento de parada) del vigilante de bloqueos
+        self._watchdog = None
+
+    def attach(self):
+        """Engancha el perfilador al event loop en curso."""
+        self._loop = asyncio.get_running_loop()
+        self._thread_id = threading.get_ident()
+
+    @property
+    def attached(self):
+        return self._loop is not None and not self._loop.is_closed()
+
+    @property
+    def detecting_stalls(self):
+        return self._watchdog is not None and self._watchdog[0].is_alive()
+
+    @property
+    def profiling(self):
+        return time.monotonic() < self._profile_until
+
+    def _check_attached(self):
+        if not self.attached:
+            raise ValueError('El perfilador no está enganchado a un event loop (se engancha al arrancar el worker o, sin lifespan, con su primera conexión)')
+
+    # Bloqueos
+
+    def start_stall_detection(self, threshold=None):
+        self._check_attached()
+        if threshold:
+            self.stall_threshold = threshold
+        if not self.detecting_stalls:
+            stop = threading.Event()
+            thread = threading.Thread(target=self._watch, args=(stop,), name='loop-stall-watchdog', daemon=True)
+            thread.start()
+            self._watchdog = (thread, stop)
+            logger.info(f"🐢 Detección de bloqueos del event loop activada (umbral {self.stall_threshold * 1000:.0f} ms)")
+
+    def stop_stall_detection(self):
+        # Sin join: el vigilante puede estar esperando una sonda del loop que llama aquí
+        if self._watchdog:
+            self._watchdog[1].set()
+            self._watchdog = None
+            logger.info("🐢 Detección de bloqueos del event loop desactivada")
+
+    def _watch(self, stop):
+        while not stop.is_set():
+            probe = threading.Event()
+            started = time.monotonic()
+            try:
+                self._loop.call_soon_threadsafe(probe.set)
+            except RuntimeError:
+                return  # loop cerrado
+            if not probe.wait(self.stall_threshold):
+                frame = sys._current_frames().get(self._thread_id)
+                stack = _walk(frame) if frame is not None else ()
+                del frame
+                while not probe.wait(self.stall_threshold) and not stop.is_set():
+                    if self._loop.is_closed():
+                        return
+                self._record_stall(time.monotonic() - started, stack)
+            stop.wait(self.stall_threshold / 2)
+
+    def _record_stall(self, duration, stack):
+        handler = _handler(stack)
+        leaf = _frame_name(*stack[-1]) if stack else '?'
+        with self._lock:
+            self._stalls.append({'at': time.time(), 'seconds': duration, 'handler': handler, 'leaf': leaf})
+            self._stall_stacks[stack] = self._stall_stacks.get(stack, 0.0) + duration
+            totals = self._stall_handlers.setdefault(handler, [0, 0.0])
+            totals[0] += 1
+            totals[1] += duration
+        metrics.LOOP_STALLS.observe(duration)
+        logger.warning("🐢 Event loop bloqueado %.0f ms en %s (%s)", duration * 1000, handler, leaf)
+
+    # Perfil por muestreo
+
+    def start_profile(self, seconds, interval=None):
+        """Muestrea la pila del loop durante `seconds` segundos; descarta el perfil anterior."""
+        self._check_attached()
+        if not hasattr(signal, 'setitimer') or self._thread_id != threading.main_thread().ident:
+            raise ValueError('El perfil por muestreo necesita un sistema POSIX y el event loop en el hilo principal')
+        if not 0 < seconds <= self.max_seconds:
+            raise ValueError(f'La duración del perfil debe estar entre 0 y {self.max_seconds} segundos')
+        interval = interval or self.sample_interval
+        self._samples = {}
+        self._idle_samples = 0
+        self._profile_until = time.monotonic() + seconds
+        self.profile = {'started': time.time(), 'seconds': seconds, 'interval': interval}
+        # `signal.signal` solo se puede llamar desde el hilo principal: lo hace el loop
+        self._loop.call_soon_threadsafe(self._arm, interval)
+        logger.info(f"🔬 Perfil del event loop: {seconds:g} s, una muestra cada {interval * 1000:g} ms de CPU")
+
+    def stop_profile(self):
+        # El temporizador se desarma en la siguiente muestra
+        self._profile_until = 0.0
+
+    def _arm(self, interval):
+        # El manejador se queda instalado al terminar: con el de por defecto, un
+        # SIGPROF que llegue tarde terminaría el proceso
+        signal.signal(signal.SIGPROF, self._on_sample)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+
+    def _on_sample(self, signum, frame):
+        # Se ejecuta en el hilo principal (el del loop), entre dos instrucciones de Python
+        if time.monotonic() >= self._profile_until:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            return
+        stack = _walk(frame)
+        if stack[-1][1] in IDLE_MODULES:
+            self._idle_samples += 1
+        else:
+            self._samples[stack] = self._samples.get(stack, 0) + 1
+
+    # Resultados
+
+    def reset(self):
+        with self._lock:
+            self._stalls.clear()
+            self._stall_stacks = {}
+            self._stall_handlers = {}
+        self._samples = {}
+        self._idle_samples = 0
+
+    def collapsed(self, kind=STACKS_PROFILE):
+        """
+        Pilas en formato "collapsed": una línea `raíz;...;hoja valor` por pila.
+
+        El valor es el número de muestras (`profile`) o los milisegundos
+        bloqueados (`stalls`).
+        """
+        if kind == STACKS_PROFILE:
+            items = list(self._samples.items())
+        elif kind == STACKS_STALLS:
+            with self._lock:
+                items = [(stack, round(seconds * 1000)) for stack, seconds in self._stall_stacks.items()]
+        else:
+            raise ValueError(f'Tipo de pilas no soportado: {kind}')
+        lines = sorted(
+            f"{';'.join(_frame_name(code, module) for code, module in stack)} {value}"
+            for stack, value in items if stack and value
+        )
+        return ''.join(f'{line}\n' for line in lines)
+
+    def stats(self, top=10):
+        samples = self._samples.copy()
+        idle = self._idle_samples
+        with self._lock:
+            recent = list(self._stalls)[-top:]
+            stall_handlers = {handler: list(totals) for handler, totals in self._stall_handlers.items()}
+
+        by_handler = {}
+        for stack, count in samples.items():
+            handler = _handler(stack)
+            by_handler[handler] = by_handler.get(handler, 0) + count
+        busy = sum(by_handler.values())
+        return {
+            'attached': self.attached,
+            'loop_lag': get_loop_monitor().stats(),
+            'stalls': {
+                'enabled': self.detecting_stalls,
+                'threshold': self.stall_threshold,
+                'count': sum(count for count, _ in stall_handlers.values()),
+                'by_handler': {
+                    handler: {'count': count, 'seconds': seconds}
+                    for handler, (count, seconds) in sorted(stall_handlers.items(), key=lambda item: -item[1][1])
+                },
+                'recent': recent,
+            },
+            'profile': {
+                **self.profile,
+                'running': self.profiling,
+                'samples': busy,
+                'idle_samples': idle,
+                # CPU que gastó el loop fuera de la espera de eventos (una muestra = `interval` de CPU)
+                'cpu_seconds': busy * self.profile.get('interval', 0.0),
+                'by_handler': dict(sorted(by_handler.items(), key=lambda item: -item[1])[:top]),
+            },
+        }
+
+    def control(self, action, params):
+        """
+        Aplica una orden de `/audio/admin/profiling/` o de `manage.py profile`.
+
+        Devuelve el estado, o las pilas con `dump`. Lanza ValueError si la
+        orden o sus parámetros no son válidos.
+        """
+        if action == PROFILE_STALLS_ON:
+            self.start_stall_detection(_seconds(params.get('threshold_ms')))
+        elif action == PROFILE_STALLS_OFF:
+            self.stop_stall_detection()
+        elif action == PROFILE_START:
+            self.start_profile(float(params.get('seconds') or 10), _seconds(params.get('interval_ms')))
+        elif action == PROFILE_STOP:
+            self.stop_profile()
+        elif action == PROFILE_RESET:
+            self.reset()
+        elif action == PROFILE_DUMP:
+            kind = params.get('kind') or STACKS_PROFILE
+            return {'kind': kind, 'collapsed': self.collapsed(kind)}
+        elif action != PROFILE_STATUS:
+            raise ValueError(f'Acción no soportada: {action}')
+        return self.stats()
+
+    def stop(self):
+        self.stop_stall_detection()
+        self.stop_profile()
+
+
+_profiler = None
+
+
+def get_profiler():
+    """Devuelve el perfilador del event loop del proceso (se engancha al arrancar el worker)."""
+    global _profiler
+    if _profiler is None:
+        _profiler = LoopProfiler(
+            stall_threshold=settings.LOOP_STALL_THRESHOLD_MS / 1000,
+            sample_interval=settings.PROFILE_SAMPLE_INTERVAL_MS / 1000,
+            max_seconds=settings.PROFILE_MAX_SECONDS,
+        )
+    return _profiler
@@ -0,0 +1,217 @@
+# Nombre del archivo: prompts.py
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+
+from . import metrics
+from .twilio_media import SAMPLE_RATE, WIRE_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# Fichero que describe el bundle; lo escribe `manage.py build_prompts`
+MANIFEST_NAME = 'manifest.json'
+# Versión del formato del manifiesto
+MANIFEST_VERSION = 1
+
+
+def write_bundle(directory, prompts, output_format=WIRE_FORMAT):
+    """
+    Escribe el bundle de locuciones y su manifiesto en `directory`.
+
+    `prompts` es una lista de dicts con `name`, `text`, `provider`,
+    `voice_id`, `model_id` y `audio` (μ-law 8 kHz). El audio de todas va
+    seguido en un único fichero `prompts-<hash>.ulaw`; el manifiesto guarda
+    el desplazamiento y la longitud de cada una. Primero se escribe el bundle
+    y luego, con un renombrado atómico, el manifiesto que lo referencia: un
+    worker que arranca a la vez lee el bundle anterior o el nuevo, nunca uno
+    a medias. Devuelve la ruta del manifiesto.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    data = b''.join(prompt['audio'] for prompt in prompts)
+    bundle_name = f'prompts-{hashlib.sha256(data).hexdigest()[:12]}.ulaw'
+
+    entries = {}
+    offset = 0
+    for prompt in prompts:
+        length = len(prompt['audio'])
+        entries[prompt['name']] = {
+            'text': prompt['text'],
+            'provider': prompt['provider'],
+            'voice_id': prompt['voice_id'],
+            'model_id': prompt['model_id'],
+            'offset': offset,
+            'length': length,
+            'duration': round(length / SAMPLE_RATE, 3),
+        }
+        offset += length
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'format': output_format,
+        'bundle': bundle_name,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'prompts': entries,
+    }
+    _write_atomic(directory / bundle_name, data)
+    _write_atomic(directory / MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    # Los bundles anteriores ya no los referencia nadie; los workers que los
+    # tienen mapeados los siguen leyendo hasta reiniciarse
+    for old in directory.glob('prompts-*.ulaw'):
+        if old.name != bundle_name:
+            old.unlink(missing_ok=True)
+    return directory / MANIFEST_NAME
+
+
+def _write_atomic(path, data):
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class PromptLibrary:
+    """
+    Locuciones fijas (saludo, confirmación, relleno) ya sintetizadas en μ-law 8 kHz.
+
+    `load` mapea el bundle de `manage.py build_prompts` en memoria de solo
+    lectura: el audio vive en la page cache del sistema y lo comparten todos
+    los workers sin copiarlo a cada proceso, y `get` devuelve un `memoryview`
+    del mapa, listo para trocear en tramas de Twilio sin esperar al proveedor
+    TTS. Una locución solo se sirve si se sintetizó con el mismo proveedor,
+    voz y modelo que usa la conexión; si no, o si no hay bundle, se sintetiza
+    como siempre.
+    """
+
+    def __init__(self):
+        self.path = None
+        self.created_at = None
+        self.hits = 0
+        # Textos que están en la biblioteca pero se pidieron con otro proveedor, voz o modelo
+        self.misses = 0
+        self._map = None
+        self._view = None
+        self._by_text = {}
+
+    def load(self, directory):
+        """Carga el bundle de `directory`. Devuelve el número de locuciones (0 si no hay o no es válido)."""
+        self.close()
+        directory = Path(directory)
+        try:
+            with open(directory / MANIFEST_NAME, encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            logger.info(f"🗣️ Sin biblioteca de locuciones en {directory} (manage.py build_prompts)")
+            return 0
+        except ValueError as e:
+            logger.warning(f"⚠️ Manifiesto de locuciones inválido en {directory}: {str(e)}")
+            return 0
+
+        if manifest.get('version') != MANIFEST_VERSION or manifest.get('format') != WIRE_FORMAT:
+            logger.warning(
+                f"⚠️ Biblioteca de locuciones descartada: versión {manifest.get('version')}, "
+                f"formato {manifest.get('format')} (se espera {MANIFEST_VERSION}, {WIRE_FORMAT})"
+            )
+            return 0
+
+        path = directory / manifest['bundle']
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            # ValueError: bundle vacío, no se puede mapear
+            logger.warning(f"⚠️ No se pudo mapear el bundle de locuciones {path}: {str(e)}")
+            return 0
+
+        by_text = {}
+        for name, entry in manifest['prompts'].items():
+            if entry['offset'] < 0 or entry['offset'] + entry['length'] > len(mapped):
+                logger.warning(f"⚠️ Locución '{name}' fuera del bundle {path}: se ignora")
+                continue
+            by_text[entry['text']] = (name, entry)
+
+        self._map = mapped
+        self._view = memoryview(mapped)
+        self._by_text = by_text
+        self.path = path
+        self.created_at = manifest.get('created_at')
+        logger.info(f"🗣️ Biblioteca de locuciones cargada: {len(by_text)} en {path} ({len(mapped)} bytes)")
+        return len(by_text)
+
+    def get(self, text, provider, voice_id=None, model_id=None):
+        """Audio μ-law de `text` con esa voz (`memoryview` de solo lectura), o None si no está."""
+        if text not in self._by_text:
+            return None
+        entry = self._match(text, provider, voice_id, model_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._view[entry['offset']:entry['offset'] + entry['length']]
+
+    def covers(self, text, provider, voice_id=None, model_id=None):
+        """Si `get` serviría `text` con esa voz; no cuenta aciertos ni fallos."""
+        return self._match(text, provider, voice_id, model_id) is not None
+
+    def _match(self, text, provider, voice_id, model_id):
+        found = self._by_text.get(text)
+        if found is None:
+            return None
+        _, entry = found
+        if (
+            entry['provider'] != provider.name
+            or entry['voice_id'] != (voice_id or provider.voice_id)
+            or entry['model_id'] != (model_id or provider.model_id)
+        ):
+            return None
+        return entry
+
+    def __len__(self):
+        return len(self._by_text)
+
+    def close(self):
+        try:
+            if self._view is not None:
+                self._view.release()
+            if self._map is not None:
+                self._map.close()
+        except BufferError:
+            # Aún hay respuestas en curso con vistas del mapa: se libera cuando terminen
+            pass
+        self._map = self._view = None
+        self._by_text = {}
+        self.path = self.created_at = None
+
+    def stats(self):
+        return {
+            'prompts': sorted(name for name, _ in self._by_text.values()),
+            'bundle': str(self.path) if self.path else None,
+            'bytes': len(self._map) if self._map is not None else 0,
+            'created_at': self.created_at,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+_library = None
+
+
+def get_prompt_library():
+    """Devuelve la biblioteca de locuciones del proceso; la primera vez carga el bundle de `PROMPTS_DIR`."""
+    global _library
+    if _library is None:
+        _library = PromptLibrary()
+        if settings.PROMPTS_ENABLED:
+            _library.load(settings.PROMPTS_DIR)
+        metrics.REGISTRY.counter(
+            'prompt_library_hits_total', 'Respuestas servidas desde la biblioteca de locuciones', lambda: _library.hits
+        )
+    return _library
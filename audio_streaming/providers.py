@@ -0,0 +1,284 @@
+# Nombre del archivo: providers.py
+
+import asyncio
+import logging
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+
+from .transcode import Transcoder, is_raw_format, parse_format
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_ELEVENLABS = 'elevenlabs'
+PROVIDER_STUB = 'stub'
+PROVIDER_LOCAL = 'local'
+
+# Tamaño de los fragmentos que entregan los proveedores locales al hacer streaming
+LOCAL_CHUNK_BYTES = 4096
+
+
+def join_audio(response):
+    """Convierte la respuesta del SDK (archivo, iterable o bytes) en bytes."""
+    if hasattr(response, 'read'):
+        return response.read()
+    if isinstance(response, (bytes, bytearray, memoryview)):
+        return bytes(response)
+    if hasattr(response, '__iter__'):
+        return b''.join(chunk for chunk in response)
+    return bytes(response)
+
+
+def _chunks(audio):
+    for offset in range(0, len(audio), LOCAL_CHUNK_BYTES):
+        yield audio[offset:offset + LOCAL_CHUNK_BYTES]
+
+
+class TTSProvider:
+    """
+    Interfaz de un proveedor de síntesis de voz.
+
+    `synthesize` y `stream` son bloqueantes: `TTSEngine` los ejecuta en su
+    pool de hilos con el límite de concurrencia del worker. `asynthesize` es
+    la variante para llamar directamente desde el event loop. Si no se pasa
+    `voice_id` o `model_id` se usan los del proveedor.
+    """
+
+    name = None
+    voice_id = None
+    model_id = None
+    # Formatos μ-law/PCM que el proveedor genera directamente; None si genera cualquiera
+    output_formats = None
+
+    def __init__(self):
+        self.healthy = None
+        self.last_check = None
+        self.last_error = None
+
+    @classmethod
+    def from_settings(cls):
+        return cls()
+
+    def stream(self, text, voice_id=None, model_id=None, output_format=None):
+        """Iterable de fragmentos de audio según se generan."""
+        raise NotImplementedError
+
+    def synthesize(self, text, voice_id=None, model_id=None, output_format=None):
+        """Audio completo en bytes."""
+        return join_audio(self.stream(text, voice_id, model_id, output_format))
+
+    async def asynthesize(self, text, voice_id=None, model_id=None, output_format=None):
+        return await asyncio.to_thread(self.synthesize, text, voice_id, model_id, output_format)
+
+    def negotiate_format(self, preferred):
+        """
+        Formato que hay que pedir para obtener `preferred`: el mismo si el
+        proveedor lo genera (o si no es μ-law/PCM); si no, el PCM más cercano
+        por encima (o el de mayor frecuencia) para que `Transcoder` lo convierta.
+        """
+        if self.output_formats is None or preferred in self.output_formats or not is_raw_format(preferred):
+            return preferred
+        rate = parse_format(preferred)[1] or 0
+        candidates = sorted((parse_format(name)[1], name) for name in self.output_formats if is_raw_format(name))
+        for candidate_rate, name in candidates:
+            if candidate_rate >= rate:
+                return name
+        return candidates[-1][1] if candidates else preferred
+
+    def ping(self):
+        """Comprobación ligera de que el proveedor responde; lanza una excepción si no."""
+
+    def check_health(self):
+        """Hace `ping` y guarda el resultado. Es bloqueante."""
+        try:
+            self.ping()
+            self.healthy, self.last_error = True, None
+        except Exception as e:
+            self.healthy, self.last_error = False, str(e)
+            logger.warning(f"⚠️ Proveedor TTS {self.name} no responde: {str(e)}")
+        self.last_check = time.time()
+        return self.healthy
+
+    def status(self):
+        return {
+            'healthy': self.healthy,
+            'last_check': self.last_check,
+            'last_error': self.last_error,
+        }
+
+    def close(self):
+        pass
+
+
+class ElevenLabsProvider(TTSProvider):
+    """
+    ElevenLabs con un único pool HTTP keep-alive por proceso, así las
+    conexiones nuevas no pagan el handshake TLS ni abren sockets propios.
+    """
+
+    name = PROVIDER_ELEVENLABS
+    # Los μ-law/PCM de `output_format` en la API de texto a voz (no hay pcm_8000)
+    output_formats = ('ulaw_8000', 'pcm_16000', 'pcm_22050', 'pcm_24000', 'pcm_44100')
+
+    def __init__(self, api_key, voice_id, model_id, timeout=60, max_connections=32,
+                 max_keepalive=16, keepalive_expiry=60):
+        import httpx
+        from elevenlabs.client import ElevenLabs
+
+        super().__init__()
+        self.voice_id = voice_id
+        self.model_id = model_id
+        self._http = httpx.Client(
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry,
+            ),
+        )
+        self.client = ElevenLabs(api_key=api_key, httpx_client=self._http)
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            api_key=settings.ELEVENLABS_API_KEY,
+            voice_id=settings.ELEVENLABS_VOICE_ID,
+            model_id=settings.ELEVENLABS_MODEL_ID,
+            timeout=settings.TTS_HTTP_TIMEOUT,
+            max_connections=settings.TTS_HTTP_MAX_CONNECTIONS,
+            max_keepalive=settings.TTS_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=settings.TTS_HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def _kwargs(self, text, voice_id, model_id, output_format):
+        kwargs = {'text': text, 'voice_id': voice_id or self.voice_id, 'model_id': model_id or self.model_id}
+        if output_format:
+            kwargs['output_format'] = output_format
+        return kwargs
+
+    def stream(self, text, voice_id=None, model_id=None, output_format=None):
+        return self.client.text_to_speech.convert_as_stream(**self._kwargs(text, voice_id, model_id, output_format))
+
+    def synthesize(self, text, voice_id=None, model_id=None, output_format=None):
+        return join_audio(self.client.text_to_speech.convert(**self._kwargs(text, voice_id, model_id, output_format)))
+
+    def ping(self):
+        self.client.models.get_all()
+
+    def close(self):
+        self._http.close()
+        logger.info("🔌 Pool HTTP de ElevenLabs cerrado")
+
+
+# Bytes por segundo y relleno de silencio de cada formato que sabe generar el stub
+_STUB_FORMATS = {
+    'ulaw_8000': (8000, b'\xff'),
+    'pcm_8000': (16000, b'\x00'),
+    'pcm_16000': (32000, b'\x00'),
+}
+_STUB_DEFAULT_FORMAT = (16000, b'\x00')  # mp3 y otros: solo importa el tamaño
+
+
+class StubProvider(TTSProvider):
+    """
+    Proveedor simulado y determinista para pruebas y benchmarks.
+
+    Espera `latency` segundos (como la petición HTTP) y entrega silencio en el
+    formato pedido, con una duración proporcional al texto (≈ 15 caracteres
+    por segundo), en fragmentos separados por `chunk_interval` segundos. Con
+    latencia cero mide solo el coste del propio servidor. No usa red.
+    """
+
+    name = PROVIDER_STUB
+    voice_id = 'stub'
+    model_id = 'stub'
+    output_formats = tuple(_STUB_FORMATS)
+    seconds_per_char = 0.065
+
+    def __init__(self, latency=0.0, chunk_interval=0.0):
+        super().__init__()
+        self.latency = latency
+        self.chunk_interval = chunk_interval
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            latency=settings.TTS_STUB_LATENCY_MS / 1000,
+            chunk_interval=settings.TTS_STUB_CHUNK_INTERVAL_MS / 1000,
+        )
+
+    def _audio(self, text, output_format):
+        rate, fill = _STUB_FORMATS.get(output_format, _STUB_DEFAULT_FORMAT)
+        size = max(int(len(text) * self.seconds_per_char * rate), LOCAL_CHUNK_BYTES // 4)
+        # PCM de 16 bits necesita longitudes pares
+        return fill * (size - size % 2)
+
+    def stream(self, text, voice_id=None, model_id=None, output_format=None):
+        audio = self._audio(text, output_format)
+        if self.latency:
+            time.sleep(self.latency)
+        for index, chunk in enumerate(_chunks(audio)):
+            if index and self.chunk_interval:
+                time.sleep(self.chunk_interval)
+            yield chunk
+
+
+class EspeakProvider(TTSProvider):
+    """
+    Motor local y sin conexión basado en `espeak-ng`.
+
+    La voz es robótica pero sirve para desarrollar sin cuota ni red, y como
+    reserva si el proveedor remoto falla. El WAV que escribe por stdout se
+    convierte al vuelo con `Transcoder` a μ-law o PCM a la frecuencia pedida;
+    para formatos comprimidos (mp3) se entrega el WAV tal cual.
+    """
+
+    name = PROVIDER_LOCAL
+    model_id = 'espeak-ng'
+
+    def __init__(self, command='espeak-ng', voice_id='es', rate=160, timeout=30):
+        super().__init__()
+        self.command = command
+        self.voice_id = voice_id
+        self.rate = rate
+        self.timeout = timeout
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            command=settings.TTS_LOCAL_COMMAND,
+            voice_id=settings.TTS_LOCAL_VOICE,
+            rate=settings.TTS_LOCAL_RATE,
+        )
+
+    def stream(self, text, voice_id=None, model_id=None, output_format=None):
+        transcoder = Transcoder('wav', output_format) if is_raw_format(output_format) else None
+        # `--` evita que un texto que empieza por "-" se lea como una opción
+        command = [self.command, '-v', voice_id or self.voice_id, '-s', str(self.rate), '--stdout', '--', text]
+        # stderr va a un fichero: una tubería que nadie lee bloquearía el proceso al llenarse
+        with tempfile.TemporaryFile() as stderr:
+            process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+            try:
+                while chunk := process.stdout.read(LOCAL_CHUNK_BYTES):
+                    audio = transcoder.feed(chunk) if transcoder else chunk
+                    if audio:
+                        yield audio
+                if transcoder and (audio := transcoder.flush()):
+                    yield audio
+                if process.wait(self.timeout):
+                    stderr.seek(0)
+                    raise subprocess.CalledProcessError(process.returncode, command, stderr=stderr.read())
+            finally:
+                # Si el consumidor abandona el stream (interrupción), no se deja el proceso vivo
+                if process.poll() is None:
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+
+    def ping(self):
+        subprocess.run([self.command, '--version'], capture_output=True, check=True, timeout=self.timeout)
+
+
+PROVIDERS = {cls.name: cls for cls in (ElevenLabsProvider, StubProvider, EspeakProvider)}
@@ -0,0 +1,152 @@
+# Nombre del archivo: sessions.py
+
+import base64
+import threading
+import time
+
+from . import metrics
+from .framing import FRAMING_RAW, FRAMING_TWILIO
+from .twilio_media import SAMPLE_RATE, MarkTracker, PCMRingBuffer
+
+
+class CallSession:
+    """
+    Estado de una conexión de audio (una llamada de Twilio o un navegador).
+
+    Reúne lo que antes eran atributos sueltos del consumidor: identificadores
+    de Twilio (`stream_sid`, `call_sid`, con los que se enlazan `Call` y
+    `AudioLog`), códec y búfer de entrada, contadores de secuencia, `mark`
+    pendientes y marcas de tiempo. Usa `__slots__` y crea el búfer circular
+    solo cuando llega la primera trama, así una sesión en espera ocupa poco
+    y un worker puede mantener miles (`python -m benchmarks.session_memory`).
+    """
+
+    __slots__ = (
+        'client_id', 'ip_address', 'connected_at', 'streaming', 'stream_audio', 'framing',
+        'stream_sid', 'call_sid', 'account_sid', 'media_format', 'custom_parameters',
+        'buffer_samples', '_inbound', 'vad', 'marks',
+        'last_sequence', 'frames', 'lost_frames', 'received_at', 'turn_ended_at',
+    )
+
+    def __init__(self, client_id, ip_address=None, stream_audio=False, buffer_seconds=2):
+        self.client_id = client_id
+        self.ip_address = ip_address
+        self.connected_at = time.time()
+        self.streaming = False
+        self.stream_audio = stream_audio
+        self.framing = FRAMING_RAW
+        self.stream_sid = None
+        self.call_sid = None
+        self.account_sid = None
+        self.media_format = None
+        self.custom_parameters = None
+        self.buffer_samples = SAMPLE_RATE * buffer_seconds
+        self._inbound = None
+        self.vad = None
+        self.marks = MarkTracker()
+        self.last_sequence = None
+        self.frames = 0
+        self.lost_frames = 0
+        self.received_at = 0.0
+        self.turn_ended_at = None
+
+    @property
+    def is_twilio(self):
+        return self.stream_sid is not None
+
+    def start_twilio(self, start, vad):
+        """Datos del mensaje `start` de Twilio Media Streams."""
+        self.stream_sid = start.get('streamSid')
+        self.call_sid = start.get('callSid')
+        self.account_sid = start.get('accountSid')
+        self.media_format = start.get('mediaFormat') or None
+        self.custom_parameters = start.get('customParameters') or {}
+        self.framing = FRAMING_TWILIO
+        self.vad = vad
+
+    @property
+    def inbound(self):
+        """Búfer circular PCM del audio entrante; se reserva con la primera trama."""
+        if self._inbound is None:
+            self._inbound = PCMRingBuffer(self.buffer_samples)
+        return self._inbound
+
+    def receive_media(self, payload, sequence_number=None):
+        """Decodifica una trama entrante (base64 μ-law) dentro del búfer circular."""
+        if sequence_number is not None:
+            sequence = int(sequence_number)
+            if self.last_sequence is not None and sequence > self.last_sequence + 1:
+                self.lost_frames += sequence - self.last_sequence - 1
+            self.last_sequence = sequence
+        self.inbound.write_ulaw(base64.b64decode(payload))
+        self.frames += 1
+
+    def release_audio(self):
+        """Libera el búfer de entrada y el VAD cuando el stream termina (la sesión puede seguir viva)."""
+        self._inbound = None
+        self.vad = None
+
+    def describe(self):
+        return {
+            'client_id': self.client_id,
+            'call_sid': self.call_sid,
+            'stream_sid': self.stream_sid,
+            'streaming': self.streaming,
+            'framing': self.framing,
+            'connected_at': self.connected_at,
+            'frames': self.frames,
+            'lost_frames': self.lost_frames,
+            'marks_pending': len(self.marks.pending),
+        }
+
+
+class SessionRegistry:
+    """
+    Sesiones activas del proceso, localizables por `callSid`.
+
+    Cada consumidor registra su sesión al conectar y la quita al
+    desconectar; las de Twilio se indexan además por `call_sid` al recibir
+    el `start`. Las órdenes a una llamada desde otro worker van por el grupo
+    `call.<CallSid>` de la capa de canales (`layers.py`).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = set()
+        self._by_call = {}
+
+    def add(self, session):
+        with self._lock:
+            self._sessions.add(session)
+
+    def index(self, session):
+        """Indexa por `call_sid` una sesión ya registrada (tras el `start` de Twilio)."""
+        if session.call_sid:
+            with self._lock:
+                self._by_call[session.call_sid] = session
+
+    def remove(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+            if session.call_sid and self._by_call.get(session.call_sid) is session:
+                del self._by_call[session.call_sid]
+
+    def get(self, call_sid):
+        """Sesión de la llamada `call_sid` en este worker, o None."""
+        return self._by_call.get(call_sid)
+
+    def calls(self):
+        """Sesiones de llamadas de Twilio (ya recibieron el `start` con su `callSid`)."""
+        return len(self._by_call)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def stats(self):
+        return {'active': len(self._sessions), 'calls': self.calls()}
+
+
+sessions = SessionRegistry()
+
+metrics.REGISTRY.gauge('call_sessions_active', 'Sesiones de audio registradas en este worker', lambda: len(sessions))
+metrics.REGISTRY.gauge('call_sessions_calls', 'Sesiones de llamadas de Twilio indexadas por callSid', sessions.calls)
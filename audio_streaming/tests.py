@@ -1,3 +1,1400 @@
-from django.test import TestCase
+import argparse
+import asyncio
+import base64
+import io
+import json
+import logging
+import os
+import queue
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from .admission import CLOSE_TRY_AGAIN_LATER, REJECT_SESSIONS, AdmissionController, get_admission
+from .cache import TTSCache, cache_key
+from .clients import TTSProviderRegistry
+from .consumers import AudioStreamConsumer
+from .framing import FRAMING_TWILIO, TwilioMediaFramer
+from .hedging import Attempt, hedged_stream
+from .log_feed import START_CURSOR, decode_log_cursor, latest_logs, logs_since, notify_logs_written
+from .log_pipeline import ErrorReporter, NonBlockingQueueHandler
+from .log_writer import AudioLogWriter
+from .loop_monitor import get_loop_monitor
+from .metrics import Registry
+from .models import AudioLog
+from .prompts import MANIFEST_NAME, PromptLibrary, write_bundle
+from .providers import LOCAL_CHUNK_BYTES, EspeakProvider, StubProvider, TTSProvider
+from .sessions import CallSession, SessionRegistry, sessions
+from .transcode import Resampler, Transcoder, parse_format
+from .tts import TTSEngine
+from .twilio_media import FRAME_SAMPLES, SAMPLE_RATE, MarkTracker, PCMRingBuffer, decode_ulaw, encode_pcm
+from .vad import SPEECH_START, UTTERANCE_END, EnergyVAD
+from .wire import BACKENDS, DecodeError, MessageCodec, get_backend
+
+
+class FakeProvider:
+    """Proveedor para `FakeEngine`: tarda `delay` segundos y entrega `chunks` o lanza `error`."""
+
+    voice_id = 'voz'
+    model_id = 'modelo'
+
+    def __init__(self, name, delay=0.0, chunks=(b'audio',), error=None):
+        self.name = name
+        self.delay = delay
+        self.chunks = chunks
+        self.error = error
+        self.closed = False
+
+
+class FakeEngine:
+    """Lo que `hedged_stream` usa de `TTSEngine`: `stream` y `cached`."""
+
+    def __init__(self, filler=None):
+        self.filler = filler
+
+    async def stream(self, provider, text, voice_id=None, model_id=None, output_format=None, max_buffered_chunks=8):
+        try:
+            await asyncio.sleep(provider.delay)
+            if provider.error:
+                raise provider.error
+            for chunk in provider.chunks:
+                yield chunk
+        finally:
+            provider.closed = True
+
+    def cached(self, provider, text, voice_id=None, model_id=None, output_format=None):
+        return self.filler
+
+
+class HedgedStreamTests(SimpleTestCase):
+    async def collect(self, engine, attempts, **kwargs):
+        kwargs.setdefault('hedge_after', 0.05)
+        stream = hedged_stream(engine, 'hola', attempts, fallback=attempts[0], **kwargs)
+        return [(attempt.label, chunk) async for attempt, chunk in stream]
+
+    async def test_fast_primary_wins_without_hedging(self):
+        primary = Attempt('principal', FakeProvider('a', chunks=(b'1', b'2')))
+        hedge_provider = FakeProvider('b')
+        chunks = await self.collect(FakeEngine(), [primary, Attempt('respaldo', hedge_provider)])
+        self.assertEqual(chunks, [('principal', b'1'), ('principal', b'2')])
+        self.assertFalse(hedge_provider.closed)
+
+    async def test_hedge_wins_when_primary_is_slow(self):
+        slow = FakeProvider('a', delay=1.0)
+        attempts = [Attempt('principal', slow), Attempt('respaldo', FakeProvider('b', delay=0.01, chunks=(b'r',)))]
+        chunks = await self.collect(FakeEngine(), attempts)
+        self.assertEqual(chunks, [('respaldo', b'r')])
+        # La petición perdedora se cancela
+        self.assertTrue(slow.closed)
+
+    async def test_hedge_is_launched_when_primary_fails(self):
+        attempts = [
+            Attempt('principal', FakeProvider('a', error=RuntimeError('caído'))),
+            Attempt('respaldo', FakeProvider('b', chunks=(b'r',))),
+        ]
+        with self.assertLogs('audio_streaming.hedging', 'WARNING'):
+            chunks = await self.collect(FakeEngine(), attempts, hedge_after=10)
+        self.assertEqual(chunks, [('respaldo', b'r')])
+
+    async def test_filler_bridges_to_the_real_answer(self):
+        attempts = [Attempt('principal', FakeProvider('a', delay=0.2, chunks=(b'respuesta',)))]
+        with self.assertLogs('audio_streaming.hedging', 'WARNING'):
+            chunks = await self.collect(
+                FakeEngine(filler=b'relleno'), attempts, fallback_text='Un momento', fallback_after=0.05
+            )
+        self.assertEqual(chunks, [('relleno', b'relleno'), ('principal', b'respuesta')])
+
+    async def test_filler_is_only_played_when_cached(self):
+        attempts = [Attempt('principal', FakeProvider('a', delay=0.1, chunks=(b'respuesta',)))]
+        with self.assertLogs('audio_streaming.hedging', 'WARNING'):
+            chunks = await self.collect(FakeEngine(), attempts, fallback_text='Un momento', fallback_after=0.01)
+        self.assertEqual(chunks, [('principal', b'respuesta')])
+
+    async def test_error_after_filler_when_every_attempt_fails(self):
+        attempts = [Attempt('principal', FakeProvider('a', delay=0.01, error=RuntimeError('caído')))]
+        stream = hedged_stream(
+            FakeEngine(filler=b'relleno'), 'hola', attempts, hedge_after=0.05,
+            fallback=attempts[0], fallback_text='Un momento', fallback_after=1.0,
+        )
+        chunks = []
+        with self.assertLogs('audio_streaming.hedging', 'WARNING'), self.assertRaisesMessage(RuntimeError, 'caído'):
+            async for attempt, chunk in stream:
+                chunks.append((attempt.label, chunk))
+        self.assertEqual(chunks, [('relleno', b'relleno')])
+
+    async def test_error_without_filler(self):
+        attempts = [Attempt('principal', FakeProvider('a', error=RuntimeError('caído')))]
+        with self.assertLogs('audio_streaming.hedging', 'WARNING'), self.assertRaisesMessage(RuntimeError, 'caído'):
+            await self.collect(FakeEngine(), attempts)
+
+
+@override_settings(ADMIN_API_TOKEN='secreto', TTS_PROVIDER='stub', PROMPTS_ENABLED=False)
+class AdmissionTests(SimpleTestCase):
+    def setUp(self):
+        self.admission = get_admission()
+        self.addCleanup(self.admission.resume)
+        self.addCleanup(self.admission._reservations.clear)
+
+    def test_drain_requires_admin(self):
+        response = self.client.post('/audio/admin/drain/', {'action': 'drain'})
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(self.admission.draining)
+
+        with self.assertLogs('audio_streaming.admission', 'WARNING'):
+            response = self.client.post(
+                '/audio/admin/drain/', {'action': 'drain'}, HTTP_AUTHORIZATION='Bearer secreto'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['draining'])
+
+    def test_profiling_requires_admin(self):
+        self.assertEqual(self.client.get('/audio/admin/profiling/').status_code, 403)
+        self.assertEqual(self.client.post('/audio/admin/profiling/', {'action': 'reset'}).status_code, 403)
+        response = self.client.get('/audio/admin/profiling/', HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertEqual(response.status_code, 200)
+
+    async def test_draining_worker_rejects_with_try_again_later(self):
+        with self.assertLogs('audio_streaming.admission', 'WARNING'):
+            self.admission.drain()
+        communicator = WebsocketCommunicator(AudioStreamConsumer.as_asgi(), '/ws/audio/stream/')
+        with self.assertLogs('audio_streaming', 'WARNING'):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            message = await communicator.receive_json_from()
+        self.assertEqual((message['event'], message['code']), ('error', 'overloaded'))
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': CLOSE_TRY_AGAIN_LATER})
+        # Sin `lifespan` (como en Daphne) la primera conexión arranca el worker
+        self.assertTrue(get_loop_monitor().running)
+        await communicator.wait()
+
+    async def twilio_start(self, call_sid):
+        communicator = WebsocketCommunicator(AudioStreamConsumer.as_asgi(), '/ws/audio/stream/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual((await communicator.receive_json_from())['event'], 'connection_established')
+        await communicator.send_json_to({
+            'event': 'start', 'streamSid': 'MZ1', 'start': {'streamSid': 'MZ1', 'callSid': call_sid},
+        })
+        return communicator
+
+    @mock.patch.object(AudioStreamConsumer, '_save_audio_log', mock.AsyncMock())
+    async def test_reserved_call_is_admitted_while_draining(self):
+        self.admission.reserve('CA1')
+        with self.assertLogs('audio_streaming.admission', 'WARNING'):
+            self.admission.drain()
+        self.assertEqual(self.admission.reserved, 1)
+
+        communicator = await self.twilio_start('CA1')
+        # El saludo suena: la llamada ocupa la plaza que reservó el webhook
+        self.assertEqual(json.loads((await communicator.receive_output(5))['text'])['event'], 'media')
+        self.assertEqual(self.admission.reserved, 0)
+        self.assertEqual(sessions.get('CA1').stream_sid, 'MZ1')
+        await communicator.disconnect()
+        self.assertIsNone(sessions.get('CA1'))
+
+    async def test_unreserved_call_is_rejected_at_start(self):
+        self.admission.reserve('CA1')
+        with self.assertLogs('audio_streaming.admission', 'WARNING'):
+            self.admission.drain()
+
+        with self.assertLogs('audio_streaming', 'WARNING'):
+            communicator = await self.twilio_start('CA2')
+            message = await communicator.receive_json_from()
+        self.assertEqual((message['event'], message['code']), ('error', 'overloaded'))
+        self.assertEqual(await communicator.receive_output(), {'type': 'websocket.close', 'code': CLOSE_TRY_AGAIN_LATER})
+        self.assertEqual(self.admission.reserved, 1)
+        await communicator.wait()
+
+    def test_reservation_takes_a_slot_and_expires(self):
+        admission = AdmissionController(max_sessions=1, reservation_ttl=0.05)
+        admission.reserve('CA1')
+        self.assertEqual(admission.check(), REJECT_SESSIONS)
+        time.sleep(0.06)
+        self.assertIsNone(admission.check())
+        self.assertEqual(admission.reserved, 0)
+
+
+class UlawCodecTests(SimpleTestCase):
+    def test_reference_values(self):
+        pcm = decode_ulaw(bytes([0x00, 0x80, 0x7F, 0xFF]))
+        self.assertEqual(pcm.tolist(), [-32124, 32124, 0, 0])
+        self.assertEqual(encode_pcm([0, 32767, -32768]), bytes([0xFF, 0x80, 0x00]))
+
+    def test_every_code_round_trips(self):
+        ulaw = bytes(range(256))
+        # 0x7F es el "cero negativo": se codifica como 0xFF
+        expected = ulaw.replace(b'\x7f', b'\xff')
+        self.assertEqual(encode_pcm(decode_ulaw(ulaw)), expected)
+
+    def test_quantization_error_is_bounded(self):
+        pcm = np.arange(-32124, 32125, dtype=np.int32)
+        error = np.abs(decode_ulaw(encode_pcm(pcm)).astype(np.int32) - pcm)
+        # Cada segmento de G.711 duplica el paso: el error crece con la amplitud
+        self.assertTrue(np.all(error <= np.abs(pcm) // 16 + 16))
+
+
+class PCMRingBufferTests(SimpleTestCase):
+    def test_wraps_around(self):
+        ring = PCMRingBuffer(capacity=8)
+        ring.write(np.arange(6))
+        self.assertEqual(ring.read(4).tolist(), [0, 1, 2, 3])
+        ring.write(np.arange(6, 12))
+        self.assertEqual(ring.available, 8)
+        self.assertEqual(ring.read(10).tolist(), list(range(4, 12)))
+        self.assertEqual(ring.overruns, 0)
+
+    def test_decodes_ulaw_in_place(self):
+        ring = PCMRingBuffer(capacity=8)
+        ring.write_ulaw(bytes([0x80, 0x00]))
+        self.assertEqual(ring.read(2).tolist(), [32124, -32124])
+
+    def test_overrun_drops_the_oldest_samples(self):
+        ring = PCMRingBuffer(capacity=4)
+        ring.write(np.arange(3))
+        ring.write(np.arange(3, 6))
+        self.assertEqual(ring.overruns, 2)
+        self.assertEqual(ring.read(4).tolist(), [2, 3, 4, 5])
+
+        ring.write(np.arange(10))
+        self.assertEqual(ring.read(4).tolist(), [6, 7, 8, 9])
+
+
+def media_frame(audio, sequence=4):
+    """Trama `media` como la envía Twilio (JSON compacto, `event` primero)."""
+    return json.dumps({
+        'event': 'media',
+        'sequenceNumber': str(sequence),
+        'media': {'track': 'inbound', 'chunk': '2', 'timestamp': '40', 'payload': base64.b64encode(audio).decode()},
+        'streamSid': 'MZ1',
+    }, separators=(',', ':'))
+
+
+class MessageCodecTests(SimpleTestCase):
+    def backends(self):
+        for backend in BACKENDS.values():
+            try:
+                yield backend()
+            except ImportError:
+                continue
+
+    def test_media_fast_path_matches_the_full_parse(self):
+        text = media_frame(bytes(range(160)))
+        message = MessageCodec().decode(text)
+        full = json.loads(text)
+        self.assertEqual(message['event'], 'media')
+        self.assertEqual(message['sequenceNumber'], full['sequenceNumber'])
+        self.assertEqual(message['media']['payload'], full['media']['payload'])
+
+    def test_escaped_slash_in_payload(self):
+        audio = bytes([0xFF] * 3 + [0xFC] * 3)
+        # Un codificador JSON puede escapar "/" como "\/"; b64decode descarta la barra invertida
+        text = media_frame(audio).replace('/', '\\/')
+        message = MessageCodec().decode(text)
+        self.assertEqual(base64.b64decode(message['media']['payload']), audio)
+
+    def test_unexpected_media_shape_falls_back_to_the_full_parse(self):
+        text = '{"event":"media","media":{"track":"inbound"},"streamSid":"MZ1"}'
+        self.assertEqual(MessageCodec().decode(text), json.loads(text))
+
+    def test_other_messages_use_the_backend(self):
+        text = '{"event":"mark","mark":{"name":"audio-1"}}'
+        for backend in self.backends():
+            with self.subTest(backend=backend.name):
+                codec = MessageCodec(backend)
+                self.assertEqual(codec.decode(text), json.loads(text))
+                self.assertEqual(json.loads(codec.encode({'event': 'clear'})), {'event': 'clear'})
+
+    def test_invalid_messages(self):
+        for backend in self.backends():
+            with self.subTest(backend=backend.name):
+                codec = MessageCodec(backend)
+                with self.assertRaises(DecodeError):
+                    codec.decode('no es json')
+                with self.assertRaises(DecodeError):
+                    codec.decode('[1, 2]')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_backend('yaml')
+
+
+def tone(ms, amplitude=8000, rate=SAMPLE_RATE, frequency=440):
+    """Tono de `ms` milisegundos (amplitud 0: silencio)."""
+    t = np.arange(rate * ms // 1000) / rate
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.int16)
+
+
+class EnergyVADTests(SimpleTestCase):
+    def detect(self, vad, *segments, chunk_ms=20):
+        """Pasa el audio por el búfer en tramas de `chunk_ms`, como llega de Twilio."""
+        ring = PCMRingBuffer()
+        audio = np.concatenate(segments)
+        step = SAMPLE_RATE * chunk_ms // 1000
+        events = []
+        for start in range(0, len(audio), step):
+            ring.write(audio[start:start + step])
+            events += vad.feed(ring)
+        return events
+
+    def test_turn_ends_after_silence(self):
+        events = self.detect(EnergyVAD(), tone(200, 0), tone(500), tone(700, 0))
+        self.assertEqual([event.kind for event in events], [SPEECH_START, UTTERANCE_END])
+        self.assertAlmostEqual(events[1].duration, 0.5, delta=0.1)
+
+    def test_quiet_noise_is_not_speech(self):
+        self.assertEqual(self.detect(EnergyVAD(), tone(1000, amplitude=50)), [])
+
+    def test_short_blip_does_not_end_a_turn(self):
+        events = self.detect(EnergyVAD(), tone(100), tone(800, 0))
+        self.assertEqual([event.kind for event in events], [SPEECH_START])
+
+    def test_long_turn_is_cut(self):
+        events = self.detect(EnergyVAD(max_utterance_ms=1000), tone(2500))
+        ends = [event.duration for event in events if event.kind == UTTERANCE_END]
+        self.assertEqual(ends, [1.0, 1.0])
+        # Tras cada corte empieza un turno nuevo con la voz que sigue
+        self.assertEqual(events[-1].kind, SPEECH_START)
+
+    def test_incomplete_block_waits_in_the_buffer(self):
+        vad = EnergyVAD(block_ms=100)
+        ring = PCMRingBuffer()
+        ring.write(tone(150))
+        self.assertEqual([event.kind for event in vad.feed(ring)], [SPEECH_START])
+        self.assertEqual(ring.available, SAMPLE_RATE * 50 // 1000)
+
+
+def rms(samples):
+    return float(np.sqrt(np.mean(samples.astype(np.float64) ** 2)))
+
+
+def chunked(data, sizes):
+    """Trocea `data` con tamaños irregulares que se repiten."""
+    chunks, start, i = [], 0, 0
+    while start < len(data):
+        chunks.append(data[start:start + sizes[i % len(sizes)]])
+        start += sizes[i % len(sizes)]
+        i += 1
+    return chunks
+
+
+class ResamplerTests(SimpleTestCase):
+    def resample(self, resampler, samples, sizes):
+        out = [resampler.process(chunk) for chunk in chunked(samples, sizes)]
+        return np.concatenate(out + [resampler.flush()])
+
+    def test_chunking_does_not_change_the_output(self):
+        for source, target in ((16000, 8000), (22050, 8000), (8000, 16000)):
+            with self.subTest(source=source, target=target):
+                samples = tone(300, rate=source)
+                whole = self.resample(Resampler(source, target), samples, [len(samples)])
+                pieces = self.resample(Resampler(source, target), samples, [1, 37, 160, 999])
+                np.testing.assert_array_equal(whole, pieces)
+                self.assertAlmostEqual(len(whole), len(samples) * target / source, delta=16)
+
+    def test_keeps_the_tone(self):
+        out = self.resample(Resampler(16000, 8000), tone(500, rate=16000), [320])
+        self.assertAlmostEqual(rms(out[100:-100]), rms(tone(500)), delta=rms(tone(500)) * 0.1)
+
+    def test_filters_above_the_target_nyquist(self):
+        # 6 kHz no cabe en 8 kHz: sin el paso bajo volvería como un alias a 2 kHz
+        out = self.resample(Resampler(16000, 8000), tone(500, rate=16000, frequency=6000), [320])
+        self.assertLess(rms(out[100:-100]), rms(tone(500)) * 0.1)
+
+
+def wav_bytes(samples, rate, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(rate)
+        wav.writeframes(np.repeat(samples, channels).astype('<i2').tobytes())
+    return buffer.getvalue()
+
+
+class TranscoderTests(SimpleTestCase):
+    def transcode(self, source, target, data, sizes):
+        transcoder = Transcoder(source, target)
+        return b''.join(transcoder.feed(chunk) for chunk in chunked(data, sizes)) + transcoder.flush()
+
+    def test_parse_format(self):
+        self.assertEqual(parse_format('pcm_16000'), ('pcm', 16000))
+        self.assertEqual(parse_format('ulaw_8000'), ('ulaw', 8000))
+        self.assertEqual(parse_format('mp3_44100_128'), ('mp3', 44100))
+        self.assertEqual(parse_format('wav'), ('wav', None))
+
+    def test_same_format_passes_through(self):
+        data = encode_pcm(tone(100))
+        self.assertEqual(self.transcode('ulaw_8000', 'ulaw_8000', data, [7]), data)
+
+    def test_pcm_chunks_may_split_samples(self):
+        data = tone(300, rate=16000).astype('<i2').tobytes()
+        whole = self.transcode('pcm_16000', 'ulaw_8000', data, [len(data)])
+        # Tamaños impares: casi todos los fragmentos cortan una muestra por la mitad
+        self.assertEqual(self.transcode('pcm_16000', 'ulaw_8000', data, [3, 101, 641]), whole)
+        self.assertAlmostEqual(len(whole), 2400, delta=16)
+
+    def test_ulaw_to_pcm(self):
+        data = encode_pcm(tone(100))
+        pcm = np.frombuffer(self.transcode('ulaw_8000', 'pcm_8000', data, [160]), dtype='<i2')
+        np.testing.assert_array_equal(pcm, decode_ulaw(data))
+
+    def test_wav_header_split_across_chunks(self):
+        samples = tone(200, rate=16000)
+        expected = self.transcode('pcm_16000', 'ulaw_8000', samples.astype('<i2').tobytes(), [640])
+        for channels in (1, 2):
+            with self.subTest(channels=channels):
+                data = wav_bytes(samples, 16000, channels)
+                self.assertEqual(self.transcode('wav', 'ulaw_8000', data, [5, 17, 333]), expected)
+
+    def test_unsupported_formats(self):
+        with self.assertRaises(ValueError):
+            Transcoder('mp3_44100_128')
+        with self.assertRaises(ValueError):
+            Transcoder('pcm_16000', 'wav')
+        with self.assertRaisesMessage(ValueError, '16 bits'):
+            Transcoder('wav').feed(wav_bytes(tone(10), 8000).replace(b'\x10\x00data', b'\x08\x00data'))
+
+
+class BlockingProvider:
+    """Proveedor bloqueante para `TTSEngine`: cuenta las síntesis simultáneas y los fragmentos leídos."""
+
+    name = 'bloqueante'
+    voice_id = 'voz'
+    model_id = 'modelo'
+
+    def __init__(self, delay=0.0, chunks=None):
+        self.delay = delay
+        # None: el stream no termina nunca
+        self.chunks = chunks
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.produced = 0
+        self.closed = threading.Event()
+
+    def synthesize(self, text, voice_id=None, model_id=None, output_format=None):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        return b'audio'
+
+    def stream(self, text, voice_id=None, model_id=None, output_format=None):
+        try:
+            while self.chunks is None or self.produced < self.chunks:
+                time.sleep(self.delay)
+                self.produced += 1
+                yield b'x'
+        finally:
+            self.closed.set()
+
+
+class TTSEngineTests(SimpleTestCase):
+    def engine(self, **kwargs):
+        engine = TTSEngine(**kwargs)
+        self.addCleanup(engine.shutdown)
+        return engine
+
+    async def test_semaphore_caps_concurrent_synthesis(self):
+        engine = self.engine(max_concurrency=2, executor_workers=4)
+        provider = BlockingProvider(delay=0.05)
+        synthesis = asyncio.gather(*(engine.synthesize(provider, f'texto {i}') for i in range(6)))
+        await asyncio.sleep(0.01)
+        self.assertEqual((engine.in_flight, engine.waiting), (2, 4))
+
+        self.assertEqual(await synthesis, [b'audio'] * 6)
+        self.assertEqual(provider.max_active, 2)
+        self.assertEqual((engine.in_flight, engine.waiting), (0, 0))
+
+    async def test_slow_consumer_blocks_the_producer(self):
+        engine = self.engine(max_concurrency=1)
+        provider = BlockingProvider(chunks=100)
+        stream = engine.stream(provider, 'hola', max_buffered_chunks=2)
+        first = await anext(stream)
+        await asyncio.sleep(0.2)
+        # El entregado, los dos de la cola y el que espera hueco
+        self.assertLessEqual(provider.produced, 4)
+
+        rest = [chunk async for chunk in stream]
+        self.assertEqual(len([first] + rest), 100)
+
+    async def test_cancelled_stream_frees_the_thread(self):
+        engine = self.engine(max_concurrency=1, executor_workers=1)
+        provider = BlockingProvider(delay=0.01)
+        stream = engine.stream(provider, 'hola')
+        await anext(stream)
+        await stream.aclose()
+
+        self.assertTrue(await asyncio.to_thread(provider.closed.wait, 2))
+        # El único hilo del pool vuelve a estar libre
+        self.assertEqual(await asyncio.wait_for(engine.run(lambda: 'libre'), 1), 'libre')
+        self.assertEqual(engine.in_flight, 0)
+
+
+@override_settings(TTS_PROVIDER='stub')
+class TTSProviderRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = TTSProviderRegistry()
+
+    def test_default_provider_comes_from_settings(self):
+        self.assertEqual(self.registry.get().name, 'stub')
+        self.assertEqual(self.registry.status()['default'], 'stub')
+
+    def test_instances_are_shared(self):
+        provider = self.registry.get('stub')
+        self.assertIs(self.registry.get(), provider)
+        self.assertIs(self.registry.get('stub'), provider)
+
+    def test_unknown_provider(self):
+        with self.assertLogs('audio_streaming.clients', 'ERROR'):
+            self.assertIsNone(self.registry.get('nadie'))
+        self.assertEqual(self.registry.status()['providers'], {})
+
+    def test_failed_creation_is_retried(self):
+        with mock.patch.object(StubProvider, 'from_settings', side_effect=RuntimeError('sin clave')):
+            with self.assertLogs('audio_streaming.clients', 'ERROR'):
+                self.assertIsNone(self.registry.get('stub'))
+        self.assertEqual(self.registry.get('stub').name, 'stub')
+
+    def test_close_drops_the_instances(self):
+        provider = self.registry.get('stub')
+        with mock.patch.object(provider, 'close') as close:
+            self.registry.close()
+        close.assert_called_once_with()
+        self.assertIsNot(self.registry.get('stub'), provider)
+
+    def test_health_check(self):
+        self.assertTrue(self.registry.check_health('stub'))
+        self.assertTrue(self.registry.status()['providers']['stub']['healthy'])
+        with self.assertLogs('audio_streaming.clients', 'ERROR'):
+            self.assertFalse(self.registry.check_health('nadie'))
+
+
+class PCMOnlyProvider(TTSProvider):
+    output_formats = ('pcm_16000', 'pcm_24000', 'mp3_44100_128')
+
+
+# Falso espeak-ng: llena stderr más allá del búfer de una tubería y escribe sus argumentos por stdout
+FAKE_ESPEAK = """#!{python}
+import json, sys
+sys.stderr.write('aviso ' * 50000)
+sys.stdout.write(json.dumps(sys.argv[1:]))
+sys.exit({code})
+"""
+
+
+class ProviderTests(SimpleTestCase):
+    def test_negotiate_format(self):
+        provider = PCMOnlyProvider()
+        cases = {
+            'pcm_16000': 'pcm_16000',
+            'ulaw_8000': 'pcm_16000',
+            'pcm_22050': 'pcm_24000',
+            'pcm_44100': 'pcm_24000',
+            'mp3_22050_32': 'mp3_22050_32',
+        }
+        for preferred, expected in cases.items():
+            with self.subTest(preferred=preferred):
+                self.assertEqual(provider.negotiate_format(preferred), expected)
+        self.assertEqual(TTSProvider().negotiate_format('pcm_22050'), 'pcm_22050')
+        self.assertEqual(StubProvider().negotiate_format('ulaw_8000'), 'ulaw_8000')
+
+    def test_stub_returns_silence_in_the_requested_format(self):
+        provider = StubProvider()
+        for output_format, fill in (('ulaw_8000', 0xFF), ('pcm_16000', 0x00)):
+            with self.subTest(output_format=output_format):
+                chunks = list(provider.stream('Hola, ¿en qué puedo ayudarle?', output_format=output_format))
+                audio = b''.join(chunks)
+                self.assertTrue(all(len(chunk) <= LOCAL_CHUNK_BYTES for chunk in chunks))
+                self.assertEqual(set(audio), {fill})
+                self.assertEqual(len(audio) % 2, 0)
+        # ≈ 15 caracteres por segundo: el doble de texto, el doble de audio
+        short = len(b''.join(provider.stream('a' * 100, output_format='ulaw_8000')))
+        self.assertEqual(len(b''.join(provider.stream('a' * 200, output_format='ulaw_8000'))), 2 * short)
+
+    def test_stub_latency(self):
+        started = time.perf_counter()
+        next(StubProvider(latency=0.05).stream('Hola', output_format='ulaw_8000'))
+        self.assertGreaterEqual(time.perf_counter() - started, 0.05)
+
+    def espeak(self, code=0):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        command = f'{directory.name}/espeak-ng'
+        with open(command, 'w') as script:
+            script.write(FAKE_ESPEAK.format(python=sys.executable, code=code))
+        os.chmod(command, 0o755)
+        return EspeakProvider(command=command, timeout=5)
+
+    def test_espeak_text_is_never_an_option(self):
+        audio = b''.join(self.espeak().stream('--help o texto', voice_id='es'))
+        self.assertEqual(json.loads(audio), ['-v', 'es', '-s', '160', '--stdout', '--', '--help o texto'])
+
+    def test_espeak_failure_reports_stderr(self):
+        with self.assertRaises(subprocess.CalledProcessError) as raised:
+            list(self.espeak(code=1).stream('Hola'))
+        self.assertTrue(raised.exception.stderr.startswith(b'aviso '))
+
+
+class TTSCacheTests(SimpleTestCase):
+    def disk_cache(self, **kwargs):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        return TTSCache(disk_dir=directory.name, **kwargs)
+
+    def test_least_recently_used_is_evicted_first(self):
+        cache = TTSCache(max_bytes=10)
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb')
+        cache.get('a')
+        cache.put('c', b'cccc')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (b'aaaa', b'cccc'))
+        self.assertEqual((cache.size, cache.evictions), (8, 1))
+
+    def test_replacing_an_entry_updates_the_size(self):
+        cache = TTSCache(max_bytes=10)
+        cache.put('a', b'aaaa')
+        cache.put('a', b'aa')
+        self.assertEqual((cache.size, cache.get('a')), (2, b'aa'))
+
+    def test_oversized_entry_is_not_cached(self):
+        cache = TTSCache(max_bytes=10)
+        cache.put('a', b'aaaa')
+        cache.put('grande', b'x' * 11)
+        self.assertIsNone(cache.get('grande'))
+        self.assertEqual((cache.get('a'), cache.size, cache.evictions), (b'aaaa', 4, 0))
+
+    def test_evicted_entry_is_served_from_disk(self):
+        cache = self.disk_cache(max_bytes=4)
+        key = cache_key('stub', 'hola', 'voz', 'modelo', 'ulaw_8000')
+        cache.put(key, b'hola')
+        cache.store_disk(key, b'hola')
+        cache.put('otra', b'otra')
+
+        audio = cache.get(key)
+        self.assertEqual(bytes(audio), b'hola')
+        # El mismo mmap sirve los aciertos siguientes, también desde otra instancia (otro worker)
+        self.assertIs(cache.get(key), audio)
+        self.assertEqual(bytes(TTSCache(disk_dir=cache.disk_dir).get(key)), b'hola')
+        self.assertEqual((cache.hits, cache.disk_hits), (0, 2))
+
+    def test_open_maps_are_bounded(self):
+        cache = self.disk_cache(max_bytes=0, max_open_maps=1)
+        for key in ('aa1', 'bb2'):
+            cache.store_disk(key, key.encode())
+            cache.get(key)
+        self.assertEqual(list(cache._maps), ['bb2'])
+        self.assertEqual(bytes(cache.get('aa1')), b'aa1')
+
+    def test_corrupt_or_truncated_file_is_discarded(self):
+        cache = self.disk_cache()
+        for damage in (lambda data: data[:-1], lambda data: data[:-1] + b'?', lambda data: b''):
+            with self.subTest(damage=damage):
+                cache._maps.clear()
+                cache.store_disk('abc', b'audio')
+                path = cache._path('abc')
+                path.write_bytes(damage(path.read_bytes()))
+
+                with self.assertLogs('audio_streaming.cache', 'WARNING'):
+                    self.assertIsNone(cache.get('abc'))
+                self.assertFalse(path.exists())
+
+        # Se puede volver a guardar
+        cache.store_disk('abc', b'audio')
+        self.assertEqual(bytes(cache.get('abc')), b'audio')
+
+    def test_stats(self):
+        cache = TTSCache(max_bytes=10)
+        self.assertIsNone(cache.stats()['hit_ratio'])
+        cache.put('a', b'aaaa')
+        cache.get('a')
+        cache.get('b')
+        stats = cache.stats()
+        self.assertEqual(
+            {name: stats[name] for name in ('entries', 'bytes', 'hits', 'misses', 'hit_ratio', 'disk_enabled')},
+            {'entries': 1, 'bytes': 4, 'hits': 1, 'misses': 1, 'hit_ratio': 0.5, 'disk_enabled': False},
+        )
+
+
+@override_settings(TTS_PROVIDER='stub', PROMPTS_ENABLED=False)
+class BargeInTests(SimpleTestCase):
+    def twilio_consumer(self):
+        consumer = AudioStreamConsumer()
+        consumer.session.start_twilio({'streamSid': 'MZ1', 'callSid': 'CA1'}, vad=EnergyVAD())
+        consumer.session.streaming = True
+        consumer.sent = []
+        consumer.send_json = mock.AsyncMock(side_effect=consumer.sent.append)
+        return consumer
+
+    async def speak(self, consumer, ms):
+        for frame in chunked(encode_pcm(tone(ms)), [FRAME_SAMPLES]):
+            await consumer.receive(media_frame(frame))
+
+    async def test_speech_during_playback_interrupts_the_response(self):
+        consumer = self.twilio_consumer()
+        # Respuesta a medias: audio sin enviar, un mark sin confirmar y la síntesis en curso
+        for i in range(3):
+            await consumer.outbound.put(f'trama {i}')
+        consumer.session.marks.next('respuesta')
+        response = asyncio.ensure_future(asyncio.sleep(10))
+        consumer._response_task = response
+
+        await self.speak(consumer, 200)
+        await asyncio.sleep(0)
+
+        self.assertEqual(consumer.outbound.depth, 0)
+        self.assertEqual(consumer.outbound.flushed, 3)
+        self.assertIn({'event': 'clear', 'streamSid': 'MZ1'}, consumer.sent)
+        self.assertFalse(consumer.session.marks.playing)
+        self.assertTrue(response.cancelled())
+
+    async def test_speech_while_silent_does_not_clear(self):
+        consumer = self.twilio_consumer()
+        await self.speak(consumer, 200)
+        self.assertNotIn({'event': 'clear', 'streamSid': 'MZ1'}, consumer.sent)
+
+
+@override_settings(
+    TTS_PROVIDER='stub', PROMPTS_ENABLED=False, TTS_HEDGE_AFTER_MS=0, TTS_FALLBACK_AFTER_MS=50,
+    VOICE_FALLBACK_MESSAGE='Un momento, por favor.',
+)
+class FillerTests(SimpleTestCase):
+    """El proveedor principal tarda más que `TTS_FALLBACK_AFTER_MS` y el relleno está en la caché."""
+
+    async def consumer(self, output_format=None):
+        consumer = AudioStreamConsumer()
+        consumer.provider = StubProvider(latency=0.2)
+        consumer.tts = TTSEngine(cache=TTSCache())
+        self.addCleanup(consumer.tts.shutdown)
+        await consumer.tts.prewarm(StubProvider(), [settings.VOICE_FALLBACK_MESSAGE], output_format=output_format)
+        consumer.sent = []
+        consumer.send_json = mock.AsyncMock(side_effect=consumer.sent.append)
+        consumer._send_frame = mock.AsyncMock(side_effect=consumer.sent.append)
+        consumer._save_audio_log = mock.AsyncMock()
+        return consumer
+
+    def audio(self, text, output_format=None):
+        return StubProvider()._audio(text, output_format)
+
+    async def test_twilio_plays_the_filler_before_the_answer(self):
+        consumer = await self.consumer('ulaw_8000')
+        consumer.session.start_twilio({'streamSid': 'MZ1', 'callSid': 'CA1'}, vad=EnergyVAD())
+        consumer.session.framing = FRAMING_TWILIO
+        frames = []
+        consumer.outbound.put = mock.AsyncMock(side_effect=frames.append)
+
+        with self.assertLogs('audio_streaming.hedging', 'WARNING'):
+            await consumer._respond('Hola')
+
+        ulaw = b''.join(base64.b64decode(json.loads(frame)['media']['payload'])
+                        for frame in frames if '"media"' in frame)
+        expected = self.audio(settings.VOICE_FALLBACK_MESSAGE, 'ulaw_8000') + self.audio('Hola', 'ulaw_8000')
+        # El framer completa la última trama de 20 ms con silencio
+        self.assertEqual(ulaw[:len(expected)], expected)
+        self.assertLess(len(ulaw) - len(expected), 160)
+
+    async def test_streamed_audio_has_no_filler(self):
+        consumer = await self.consumer()
+        consumer.session.stream_audio = True
+        await consumer._respond('Hola')
+
+        audio = b''.join(item for item in consumer.sent if isinstance(item, bytes))
+        self.assertEqual(audio, self.audio('Hola'))
+        self.assertEqual(consumer.sent[-1]['bytes'], len(audio))
+
+    async def test_whole_response_has_no_filler(self):
+        consumer = await self.consumer()
+        consumer.session.stream_audio = False
+        await consumer._respond('Hola')
+        self.assertEqual(consumer.sent, [self.audio('Hola')])
+
+
+class SessionRegistryTests(SimpleTestCase):
+    def session(self, call_sid=None):
+        session = CallSession(client_id='1')
+        if call_sid:
+            session.start_twilio({'streamSid': 'MZ1', 'callSid': call_sid}, vad=None)
+        return session
+
+    def test_lookup_by_call_sid(self):
+        registry = SessionRegistry()
+        browser, call = self.session(), self.session('CA1')
+        for session in (browser, call):
+            registry.add(session)
+            registry.index(session)
+
+        self.assertIs(registry.get('CA1'), call)
+        self.assertIsNone(registry.get('CA2'))
+        self.assertEqual(registry.stats(), {'active': 2, 'calls': 1})
+
+        registry.remove(call)
+        self.assertIsNone(registry.get('CA1'))
+        self.assertEqual(registry.stats(), {'active': 1, 'calls': 0})
+
+    def test_stale_session_does_not_drop_the_new_one(self):
+        # Twilio reconecta el stream de la misma llamada antes de que se cierre el socket anterior
+        registry = SessionRegistry()
+        old, new = self.session('CA1'), self.session('CA1')
+        for session in (old, new):
+            registry.add(session)
+            registry.index(session)
+        registry.remove(old)
+        self.assertIs(registry.get('CA1'), new)
+        self.assertEqual(len(registry), 1)
+
+
+class MarkTrackerTests(SimpleTestCase):
+    def test_ack_confirms_the_previous_marks(self):
+        marks = MarkTracker()
+        first, second = marks.next(), marks.next()
+        self.assertEqual((first, second), ('audio-1', 'audio-2'))
+        self.assertIsNotNone(marks.ack(second))
+        self.assertFalse(marks.playing)
+
+    def test_mark_of_cleared_audio_is_ignored(self):
+        marks = MarkTracker()
+        stale = marks.next('respuesta')
+        marks.clear()
+        current = marks.next('respuesta')
+        # Twilio devuelve el mark del audio vaciado con `clear`
+        self.assertIsNone(marks.ack(stale))
+        self.assertEqual([name for name, _ in marks.pending], [current])
+
+
+class AudioLogWriterTests(TestCase):
+    def writer(self, **kwargs):
+        kwargs.setdefault('flush_interval', 60)
+        return AudioLogWriter(**kwargs)
+
+    def add(self, writer, count=1):
+        for i in range(count):
+            writer.add(event='media_processed', response_text=f'respuesta {i}', audio_length=1.0)
+
+    async def wait_for(self, condition, timeout=2):
+        async def poll():
+            while not condition():
+                await asyncio.sleep(0.01)
+        await asyncio.wait_for(poll(), timeout)
+
+    async def count(self):
+        return await AudioLog.objects.acount()
+
+    async def test_full_batch_is_written_at_once(self):
+        writer = self.writer(batch_size=3)
+        self.add(writer, 2)
+        await asyncio.sleep(0.05)
+        self.assertEqual(await self.count(), 0)
+
+        self.add(writer)
+        await self.wait_for(lambda: writer.written == 3)
+        self.assertEqual(await self.count(), 3)
+        self.assertEqual(writer.flushes, 1)
+        await writer.close()
+
+    async def test_partial_batch_is_written_after_the_interval(self):
+        writer = self.writer(batch_size=100, flush_interval=0.05)
+        self.add(writer, 2)
+        await self.wait_for(lambda: writer.written == 2)
+        self.assertEqual(await self.count(), 2)
+        await writer.close()
+
+    async def test_records_are_dropped_when_the_queue_is_full(self):
+        writer = self.writer(max_pending=2)
+        self.add(writer, 5)
+        self.assertEqual(writer.stats()['pending'], 2)
+        self.assertEqual(writer.dropped, 3)
+        await writer.close()
+
+    async def test_close_writes_what_is_pending(self):
+        writer = self.writer(batch_size=2)
+        self.add(writer, 3)
+        await writer.close()
+        self.assertEqual(await self.count(), 3)
+        self.assertEqual(writer.stats()['pending'], 0)
+
+    async def test_writes_resume_after_a_database_error(self):
+        writer = self.writer()
+        failing = mock.patch.object(AudioLogWriter, '_bulk_create', side_effect=RuntimeError('db caída'))
+        self.add(writer, 2)
+        with failing, self.assertLogs('audio_streaming.log_writer', 'ERROR'):
+            self.assertEqual(await writer.flush(), 0)
+        self.assertEqual(writer.failed, 2)
+
+        self.add(writer)
+        self.assertEqual(await writer.flush(), 1)
+        self.assertEqual(await self.count(), 1)
+        await writer.close()
+
+
+class LogFeedTests(TestCase):
+    def log(self, pk, event='media_processed'):
+        return AudioLog.objects.create(id=pk, event=event)
+
+    def ids(self, rows):
+        return [row['id'] for row in rows]
+
+    def test_pages_forward_from_the_cursor(self):
+        for pk in range(1, 6):
+            self.log(pk)
+        pages, cursor, more = [], START_CURSOR, True
+        while more:
+            rows, cursor, more = logs_since(cursor, 2)
+            pages.append(self.ids(rows))
+        self.assertEqual(pages, [[2, 1], [4, 3], [5]])
+        self.assertEqual(cursor, '5')
+        self.assertEqual(logs_since(cursor, 2), ([], '5', False))
+
+    def test_latest_logs(self):
+        for pk in range(1, 4):
+            self.log(pk)
+        rows, cursor = latest_logs(2)
+        self.assertEqual((self.ids(rows), cursor), ([3, 2], '3'))
+        self.assertRegex(rows[0]['timestamp'], r'^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d$')
+
+    def test_missing_id_is_delivered_when_it_commits(self):
+        # El id 2 es de un lote de otro worker que aún no se ha confirmado
+        self.log(1)
+        self.log(3)
+        rows, cursor, _ = logs_since(START_CURSOR, 10)
+        self.assertEqual(self.ids(rows), [3, 1])
+        self.assertEqual(decode_log_cursor(cursor)[:2], (1, {3}))
+        self.assertEqual(logs_since(cursor, 10)[0], [])
+
+        self.log(2)
+        rows, cursor, _ = logs_since(cursor, 10)
+        self.assertEqual((self.ids(rows), cursor), ([2], '3'))
+
+    @override_settings(AUDIO_LOG_FEED_GAP_SECONDS=0)
+    def test_missing_id_is_given_up_after_the_wait(self):
+        self.log(1)
+        self.log(3)
+        _, cursor, _ = logs_since(START_CURSOR, 10)
+        self.assertEqual(logs_since(cursor, 10), ([], '3', False))
+
+    def test_bad_cursor(self):
+        for cursor in ('nada', '-1', '5:1.0:3', '1:x:3'):
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_log_cursor(cursor)
+        response = self.client.get('/audio/api/logs/', {'since': 'nada'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_api(self):
+        for pk in range(1, 4):
+            self.log(pk)
+        first = self.client.get('/audio/api/logs/').json()
+        self.assertEqual((self.ids(first['logs']), first['cursor'], first['more']), ([3, 2, 1], '3', False))
+        self.log(4)
+        response = self.client.get('/audio/api/logs/', {'since': first['cursor']}).json()
+        self.assertEqual((self.ids(response['logs']), response['cursor']), ([4], '4'))
+
+    async def events(self, response, count):
+        """Los `count` siguientes eventos con datos del feed SSE, como (id, logs)."""
+        events = []
+        async for chunk in response.streaming_content:
+            lines = dict(line.split(': ', 1) for line in chunk.decode().splitlines() if ': ' in line)
+            if 'data' in lines:
+                events.append((lines['id'], self.ids(json.loads(lines['data'])['logs'])))
+                if len(events) == count:
+                    return events
+
+    async def test_stream_sends_new_logs_and_resumes_from_last_event_id(self):
+        for pk in range(1, 4):
+            await sync_to_async(self.log)(pk)
+
+        # `Last-Event-ID` (reconexión del navegador) manda sobre el `?since` de la primera conexión
+        response = await self.async_client.get(
+            '/audio/api/logs/stream/', {'since': START_CURSOR}, headers={'Last-Event-ID': '1'}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual(await asyncio.wait_for(self.events(response, 1), 5), [('3', [3, 2])])
+
+        await sync_to_async(self.log)(4)
+        await notify_logs_written()
+        self.assertEqual(await asyncio.wait_for(self.events(response, 1), 5), [('4', [4])])
+
+    async def test_stream_starts_at_the_newest_log(self):
+        await sync_to_async(self.log)(1)
+        response = await self.async_client.get('/audio/api/logs/stream/')
+        # El feed empieza a leer con el primer fragmento (`retry:`)
+        self.assertEqual(await anext(aiter(response.streaming_content)), b'retry: 3000\n\n')
+        await sync_to_async(self.log)(2)
+        await notify_logs_written()
+        self.assertEqual(await asyncio.wait_for(self.events(response, 1), 5), [('2', [2])])
+
+    async def test_stream_rejects_a_bad_cursor(self):
+        response = await self.async_client.get('/audio/api/logs/stream/', {'since': 'nada'})
+        self.assertEqual(response.status_code, 400)
+
+
+class NonBlockingQueueHandlerTests(SimpleTestCase):
+    def logger(self, handler):
+        log = logging.getLogger('audio_streaming.tests.cola')
+        log.addHandler(handler)
+        log.propagate = False
+        self.addCleanup(setattr, log, 'propagate', True)
+        self.addCleanup(log.removeHandler, handler)
+        return log
+
+    def test_full_queue_drops_without_blocking(self):
+        handler = NonBlockingQueueHandler(queue.Queue(2))
+        log = self.logger(handler)
+        for i in range(5):
+            log.warning('registro %d', i)
+        self.assertEqual(handler.queue.qsize(), 2)
+        self.assertEqual(handler.dropped, 3)
+
+    def test_message_is_composed_when_enqueued(self):
+        handler = NonBlockingQueueHandler(queue.Queue())
+        log = self.logger(handler)
+        state = ['antes']
+        try:
+            raise ValueError('roto')
+        except ValueError:
+            log.exception('estado %s', state)
+        state[0] = 'después'
+
+        record = handler.queue.get_nowait()
+        self.assertEqual((record.msg, record.args), ("estado ['antes']", None))
+        # El traceback se convierte en texto en el hilo del listener
+        self.assertIsNotNone(record.exc_info)
+        self.assertIn('ValueError: roto', logging.Formatter().format(record))
+
+
+class ErrorReporterTests(SimpleTestCase):
+    def setUp(self):
+        self.reporter = ErrorReporter(burst=2, interval=60, sample_every=3)
+        self.now = 1000.0
+        patcher = mock.patch('audio_streaming.log_pipeline.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def report(self, count, error=None):
+        logger = logging.getLogger('audio_streaming.tests.errores')
+        with self.assertLogs(logger, 'WARNING') as logs:
+            logged = [self.reporter.report(logger, 'tts', 'Falló', error or RuntimeError('caído')) for _ in range(count)]
+            # assertLogs exige al menos un registro
+            logger.warning('fin')
+        return logged, logs.records[:-1]
+
+    def test_burst_then_sampled(self):
+        logged, records = self.report(8)
+        self.assertEqual(logged, [True, True, False, False, True, False, False, True])
+        self.assertTrue(all(record.exc_info for record in records[:2]))
+        self.assertEqual([record.getMessage() for record in records[2:]],
+                         ['Falló: caído (3 similares omitidos)', 'Falló: caído (6 similares omitidos)'])
+        self.assertIsNone(records[2].exc_info)
+        self.assertEqual(self.reporter.stats(), {'counts': {'tts:RuntimeError': 8}, 'suppressed': 6})
+
+    def test_new_interval_reports_the_omitted_count(self):
+        self.report(4)
+        self.now += 60
+        logged, records = self.report(1)
+        self.assertEqual(logged, [True])
+        self.assertEqual(records[0].getMessage(), 'Falló: caído (2 similares omitidos)')
+
+    def test_each_error_type_has_its_own_limit(self):
+        self.report(2)
+        logged, _ = self.report(1, ValueError('otro'))
+        self.assertEqual(logged, [True])
+        self.assertEqual(self.reporter.stats()['counts'], {'tts:RuntimeError': 2, 'tts:ValueError': 1})
+
+    def test_records_point_at_the_caller(self):
+        _, records = self.report(1)
+        self.assertEqual(records[0].module, 'tests')
+
+
+class TwilioMediaFramerTests(SimpleTestCase):
+    def payloads(self, frames):
+        return [base64.b64decode(json.loads(frame)['media']['payload']) for frame in frames]
+
+    def test_frames_are_valid_media_messages(self):
+        frames = TwilioMediaFramer('MZ"1').frames(bytes(320))
+        self.assertEqual([json.loads(frame)['streamSid'] for frame in frames], ['MZ"1', 'MZ"1'])
+        self.assertEqual(json.loads(frames[0])['event'], 'media')
+
+    def test_partial_frames_carry_over(self):
+        framer = TwilioMediaFramer('MZ1')
+        audio = bytes(range(256)) * 2
+
+        first = self.payloads(framer.frames(audio[:400]))
+        self.assertEqual([len(payload) for payload in first], [160, 160])
+        # Los 80 bytes que sobran completan la trama con el siguiente fragmento
+        second = self.payloads(framer.frames(audio[400:500]))
+        self.assertEqual([len(payload) for payload in second], [160])
+        self.assertEqual(self.payloads(framer.frames(audio[500:510])), [])
+        last = self.payloads(framer.flush())
+        self.assertEqual([len(payload) for payload in last], [30])
+
+        self.assertEqual(b''.join(first + second + last), audio[:510])
+        self.assertEqual(framer.flush(), [])
+
+    def test_mark(self):
+        mark = json.loads(TwilioMediaFramer('MZ1').mark('respuesta-1'))
+        self.assertEqual(mark, {'event': 'mark', 'streamSid': 'MZ1', 'mark': {'name': 'respuesta-1'}})
+
+
+@override_settings(TTS_PROVIDER='stub', PROMPTS_ENABLED=False, TTS_HEDGE_AFTER_MS=0, TTS_FALLBACK_AFTER_MS=0)
+class TwilioFramingTests(SimpleTestCase):
+    def queued(self, consumer):
+        return [json.loads(message) for message in consumer.outbound._queue._queue]
+
+    async def test_twilio_stream_ends_with_a_mark(self):
+        consumer = AudioStreamConsumer()
+        consumer.session.start_twilio({'streamSid': 'MZ1', 'callSid': 'CA1'}, vad=EnergyVAD())
+        await consumer._send_twilio_audio('hola')
+        self.assertEqual(self.queued(consumer)[-1]['event'], 'mark')
+        self.assertTrue(consumer.session.marks.playing)
+
+    async def test_browser_with_twilio_framing_gets_no_marks(self):
+        consumer = AudioStreamConsumer()
+        consumer.session.framing = FRAMING_TWILIO
+        await consumer._send_twilio_audio('hola')
+        events = {message['event'] for message in self.queued(consumer)}
+        self.assertEqual(events, {'media'})
+        # Sin marks pendientes el bot deja de "hablar" al vaciarse la cola
+        self.assertFalse(consumer.session.marks.playing)
+
+
+_SAMPLE_LINE = re.compile(r'([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)')
+_LABEL_PAIR = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\[\\"n])*)",?')
+
+
+def _unescape(text):
+    return re.sub(r'\\(.)', lambda match: '\n' if match[1] == 'n' else match[1], text)
+
+
+def parse_prometheus(text):
+    """Parser estricto del formato de texto de Prometheus (0.0.4): falla con cualquier línea mal formada."""
+    assert text.endswith('\n'), 'falta el salto de línea final'
+    families = {}
+    for line in text.splitlines():
+        if line.startswith('# HELP ') or line.startswith('# TYPE '):
+            name, _, value = line[7:].partition(' ')
+            family = families.setdefault(name, {'samples': []})
+            if line.startswith('# HELP '):
+                family['help'] = _unescape(value)
+            else:
+                assert value in ('counter', 'gauge', 'histogram', 'summary', 'untyped'), line
+                family['type'] = value
+            continue
+        match = _SAMPLE_LINE.fullmatch(line)
+        assert match, f'línea mal formada: {line!r}'
+        name, labels, value = match.groups()
+        pairs = list(_LABEL_PAIR.finditer(labels or ''))
+        assert ''.join(pair[0] for pair in pairs) == (labels or ''), f'etiquetas mal formadas: {line!r}'
+        family = name if name in families else re.sub(r'_(bucket|sum|count)$', '', name)
+        assert family in families, f'muestra sin TYPE: {line!r}'
+        families[family]['samples'].append(
+            (name, {pair[1]: _unescape(pair[2]) for pair in pairs}, float(value))
+        )
+    return families
+
+
+def prompt(name, text, audio, provider='stub'):
+    return {'name': name, 'text': text, 'provider': provider, 'voice_id': 'stub', 'model_id': 'stub', 'audio': audio}
+
+
+class PromptLibraryTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = Path(directory.name)
+        self.library = PromptLibrary()
+        self.addCleanup(self.library.close)
+
+    def load(self, expected):
+        with self.assertLogs('audio_streaming.prompts', 'INFO'):
+            self.assertEqual(self.library.load(self.dir), expected)
+
+    def manifest(self, **changes):
+        path = self.dir / MANIFEST_NAME
+        manifest = {**json.loads(path.read_text(encoding='utf-8')), **changes}
+        path.write_text(json.dumps(manifest), encoding='utf-8')
+        return manifest
+
+    def test_round_trip(self):
+        write_bundle(self.dir, [prompt('saludo', 'Hola', b'\x01' * 800), prompt('acuse', 'Vale', b'\x02' * 400)])
+        self.load(2)
+
+        stub = StubProvider()
+        self.assertEqual(bytes(self.library.get('Hola', stub)), b'\x01' * 800)
+        self.assertEqual(bytes(self.library.get('Vale', stub)), b'\x02' * 400)
+        self.assertTrue(self.library.covers('Hola', stub))
+        stats = self.library.stats()
+        self.assertEqual((stats['prompts'], stats['bytes'], stats['hits']), (['acuse', 'saludo'], 1200, 2))
+
+    def test_missing_prompt(self):
+        write_bundle(self.dir, [prompt('saludo', 'Hola', b'\x01' * 800)])
+        self.load(1)
+        self.assertIsNone(self.library.get('Adiós', StubProvider()))
+        self.assertEqual(self.library.misses, 0)
+
+        # Mismo texto con otra voz: se sintetiza como siempre
+        self.assertIsNone(self.library.get('Hola', StubProvider(), voice_id='otra'))
+        self.assertEqual(self.library.misses, 1)
+
+    def test_without_bundle(self):
+        self.load(0)
+        self.assertIsNone(self.library.get('Hola', StubProvider()))
+
+    def test_stale_manifest_is_ignored(self):
+        write_bundle(self.dir, [prompt('saludo', 'Hola', b'\x01' * 800)])
+        for changes in ({'version': 0}, {'format': 'pcm_16000'}, {'bundle': 'prompts-otro.ulaw'}):
+            with self.subTest(changes=changes):
+                original = self.manifest()
+                self.manifest(**changes)
+                self.load(0)
+                self.assertEqual(len(self.library), 0)
+                self.manifest(**original)
+
+    def test_corrupt_manifest_is_ignored(self):
+        write_bundle(self.dir, [prompt('saludo', 'Hola', b'\x01' * 800)])
+        (self.dir / MANIFEST_NAME).write_text('{"version": 1, "form', encoding='utf-8')
+        self.load(0)
+
+    def test_truncated_bundle_skips_the_prompts_outside_it(self):
+        write_bundle(self.dir, [prompt('saludo', 'Hola', b'\x01' * 800), prompt('acuse', 'Vale', b'\x02' * 400)])
+        bundle = self.dir / self.manifest()['bundle']
+        bundle.write_bytes(bundle.read_bytes()[:1000])
+        self.load(1)
+        self.assertIsNotNone(self.library.get('Hola', StubProvider()))
+        self.assertIsNone(self.library.get('Vale', StubProvider()))
+
+    def test_new_bundle_replaces_the_old_one(self):
+        write_bundle(self.dir, [prompt('saludo', 'Hola', b'\x01' * 800)])
+        write_bundle(self.dir, [prompt('saludo', 'Hola', b'\x03' * 800)])
+        self.assertEqual(len(list(self.dir.glob('prompts-*.ulaw'))), 1)
+        self.load(1)
+        self.assertEqual(bytes(self.library.get('Hola', StubProvider())), b'\x03' * 800)
+
+
+@override_settings(TTS_PROVIDER='stub')
+class BuildPromptsCommandTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+
+    def test_builds_a_bundle_the_library_loads(self):
+        out = io.StringIO()
+        call_command('build_prompts', provider='stub', output=self.dir, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), len(settings.VOICE_PROMPTS) + 1)
+        for name, line in zip(settings.VOICE_PROMPTS, lines):
+            self.assertRegex(line, rf'^🗣️ {name}: \d+\.\d\d s$')
+        self.assertIn(f'{len(settings.VOICE_PROMPTS)} locuciones de stub', lines[-1])
+
+        library = PromptLibrary()
+        self.addCleanup(library.close)
+        with self.assertLogs('audio_streaming.prompts', 'INFO'):
+            self.assertEqual(library.load(self.dir), len(settings.VOICE_PROMPTS))
+        for text in settings.VOICE_PROMPTS.values():
+            self.assertEqual(bytes(library.get(text, StubProvider())), StubProvider()._audio(text, 'ulaw_8000'))
+
+    def test_only_some_prompts(self):
+        name = next(iter(settings.VOICE_PROMPTS))
+        call_command('build_prompts', provider='stub', output=self.dir, only=[name], stdout=io.StringIO())
+        manifest = json.loads((Path(self.dir) / MANIFEST_NAME).read_text(encoding='utf-8'))
+        self.assertEqual(list(manifest['prompts']), [name])
+
+    def test_bad_arguments(self):
+        with self.assertRaisesMessage(CommandError, 'Locuciones desconocidas: nada'):
+            call_command('build_prompts', provider='stub', output=self.dir, only=['nada'])
+        with self.assertLogs('audio_streaming.clients', 'ERROR'), \
+                self.assertRaisesMessage(CommandError, 'Proveedor TTS no disponible: nadie'):
+            call_command('build_prompts', provider='nadie', output=self.dir)
+        self.assertFalse((Path(self.dir) / MANIFEST_NAME).exists())
+
+
+class MetricsTests(SimpleTestCase):
+    def test_histogram_buckets_sum_and_count(self):
+        registry = Registry()
+        histogram = registry.histogram('respuesta_seconds', 'Latencia', buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+
+        family = parse_prometheus(registry.render_prometheus())['respuesta_seconds']
+        self.assertEqual(family['type'], 'histogram')
+        samples = {(name, labels.get('le')): value for name, labels, value in family['samples']}
+        self.assertEqual(samples, {
+            ('respuesta_seconds_bucket', '0.1'): 2,
+            ('respuesta_seconds_bucket', '1.0'): 3,
+            ('respuesta_seconds_bucket', '+Inf'): 4,
+            ('respuesta_seconds_sum', None): 2.65,
+            ('respuesta_seconds_count', None): 4,
+        })
+
+    def test_help_is_escaped(self):
+        registry = Registry()
+        registry.counter('avisos_total', 'Dos líneas\ny una barra \\').inc(3)
+        text = registry.render_prometheus()
+        self.assertEqual(len(text.splitlines()), 3)
+        family = parse_prometheus(text)['avisos_total']
+        self.assertEqual(family['help'], 'Dos líneas\ny una barra \\')
+        self.assertEqual(family['samples'], [('avisos_total', {}, 3.0)])
+
+    def test_metrics_endpoint(self):
+        response = self.client.get('/audio/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+
+        families = parse_prometheus(response.content.decode())
+        self.assertIn('tts_in_flight', families)
+        for name, family in families.items():
+            with self.subTest(metric=name):
+                self.assertIn('help', family)
+                if family['type'] != 'histogram':
+                    continue
+                buckets = [value for sample, labels, value in family['samples'] if sample.endswith('_bucket')]
+                count = next(value for sample, _, value in family['samples'] if sample.endswith('_count'))
+                self.assertEqual(buckets, sorted(buckets))
+                self.assertEqual(buckets[-1], count)
+
+
+@override_settings(TTS_PROVIDER='stub', PROMPTS_ENABLED=False)
+class LoadgenTests(SimpleTestCase):
+    """Una pasada corta de `benchmarks.loadgen` contra un Uvicorn en el mismo proceso."""
+
+    @mock.patch.object(AudioStreamConsumer, '_save_audio_log', mock.AsyncMock())
+    async def test_calls_are_greeted_and_answered(self):
+        import uvicorn
+        from benchmarks import loadgen
+        from voice_flow.asgi import application
+
+        server = uvicorn.Server(uvicorn.Config(application, port=0, lifespan='off', log_level='warning'))
+        serving = asyncio.ensure_future(server.serve())
+        try:
+            while not server.started:
+                await asyncio.sleep(0.01)
+            port = server.servers[0].sockets[0].getsockname()[1]
+            args = argparse.Namespace(
+                url=f'ws://127.0.0.1:{port}/ws/audio/stream/', turns=1, lead_in_ms=500, speech_ms=600,
+                silence_ms=1500, ramp_up=0.1,
+            )
+            stats = await asyncio.wait_for(loadgen.run_step(args, 3), 30)
+        finally:
+            server.should_exit = True
+            await asyncio.wait_for(serving, 5)
+
+        self.assertEqual((stats.completed, stats.failed, stats.server_errors), (3, 0, 0), stats.errors)
+        self.assertEqual(stats.missed_turns, 0)
+        self.assertEqual((len(stats.greeting_ttfa), len(stats.ttfa)), (3, 3))
+        self.assertGreater(stats.frames_received, 0)
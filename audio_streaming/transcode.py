@@ -0,0 +1,179 @@
+# Nombre del archivo: transcode.py
+
+import numpy as np
+
+from .twilio_media import decode_ulaw, encode_pcm
+
+# Formatos que sabe convertir `Transcoder`: μ-law y PCM 16 bits a cualquier
+# frecuencia (`ulaw_8000`, `pcm_22050`...) y WAV PCM 16 bits como entrada
+ENCODING_ULAW = 'ulaw'
+ENCODING_PCM = 'pcm'
+ENCODING_WAV = 'wav'
+RAW_ENCODINGS = (ENCODING_ULAW, ENCODING_PCM)
+
+# Coeficientes del filtro paso bajo que se aplica antes de bajar la frecuencia
+LOWPASS_TAPS = 31
+
+
+def parse_format(name):
+    """`'pcm_16000'` -> `('pcm', 16000)`; `'wav'` -> `('wav', None)`; `'mp3_44100_128'` -> `('mp3', 44100)`."""
+    encoding, _, rest = (name or '').partition('_')
+    rate = rest.partition('_')[0]
+    return encoding, int(rate) if rate.isdigit() else None
+
+
+def is_raw_format(name):
+    """True si `name` es μ-law o PCM con frecuencia: lo que el pipeline de telefonía puede consumir."""
+    encoding, rate = parse_format(name)
+    return encoding in RAW_ENCODINGS and rate is not None
+
+
+def _lowpass(source_rate, target_rate):
+    """FIR de fase lineal (sinc con ventana de Hamming) con corte algo por debajo del Nyquist de destino."""
+    cutoff = 0.9 * target_rate / source_rate / 2
+    n = np.arange(LOWPASS_TAPS) - (LOWPASS_TAPS - 1) / 2
+    taps = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(LOWPASS_TAPS)
+    return (taps / taps.sum()).astype(np.float32)
+
+
+class Resampler:
+    """
+    Cambio de frecuencia incremental por interpolación lineal.
+
+    Conserva entre fragmentos la última muestra, la fase de interpolación y
+    la historia del filtro paso bajo (solo al bajar de frecuencia), así que
+    trocear la entrada no introduce clics ni desfases.
+    """
+
+    def __init__(self, source_rate, target_rate):
+        self.source_rate = source_rate
+        self.target_rate = target_rate
+        self.step = source_rate / target_rate
+        self._taps = _lowpass(source_rate, target_rate) if target_rate < source_rate else None
+        self._history = np.zeros(LOWPASS_TAPS - 1, dtype=np.float32) if self._taps is not None else None
+        self._previous = None
+        self._position = 0.0
+
+    def process(self, samples):
+        """Muestras int16 a `source_rate` -> muestras int16 a `target_rate`."""
+        if not len(samples):
+            return np.empty(0, dtype=np.int16)
+        x = samples.astype(np.float32)
+        if self._taps is not None:
+            padded = np.concatenate((self._history, x))
+            self._history = padded[len(padded) - (LOWPASS_TAPS - 1):]
+            x = np.convolve(padded, self._taps, mode='valid')
+        if self._previous is not None:
+            x = np.concatenate(((self._previous,), x))
+        self._previous = x[-1]
+
+        last = len(x) - 1
+        positions = np.arange(self._position, last + 1e-9, self.step)
+        self._position = (positions[-1] + self.step - last) if len(positions) else self._position - last
+        out = np.interp(positions, np.arange(len(x)), x)
+        return np.clip(np.rint(out), -32768, 32767).astype(np.int16)
+
+    def flush(self):
+        """Saca las muestras retenidas por el retardo del filtro."""
+        if self._taps is None or self._previous is None:
+            return np.empty(0, dtype=np.int16)
+        return self.process(np.zeros((LOWPASS_TAPS - 1) // 2, dtype=np.int16))
+
+
+class Transcoder:
+    """
+    Conversión en memoria, fragmento a fragmento, del audio del TTS al formato de destino.
+
+    Acepta μ-law, PCM 16 bits (`pcm_<hz>`) o WAV y entrega μ-law o PCM a la
+    frecuencia pedida. No escribe a disco ni acumula el audio entero: solo
+    guarda entre fragmentos el byte suelto de una muestra cortada, la
+    cabecera WAV a medio llegar y el estado del `Resampler`. Si origen y
+    destino coinciden, los fragmentos pasan tal cual. Los formatos
+    comprimidos (mp3) no se decodifican: hay que pedir al proveedor μ-law o PCM.
+    """
+
+    def __init__(self, source_format, target_format='ulaw_8000'):
+        self.source_format = source_format
+        self.target_format = target_format
+        self.source_encoding, self.source_rate = parse_format(source_format)
+        self.target_encoding, self.target_rate = parse_format(target_format)
+        if self.source_encoding not in RAW_ENCODINGS + (ENCODING_WAV,) or (
+            self.source_encoding != ENCODING_WAV and self.source_rate is None
+        ):
+            raise ValueError(f'Formato de origen no soportado: {source_format}')
+        if not is_raw_format(target_format):
+            raise ValueError(f'Formato de destino no soportado: {target_format}')
+        self.passthrough = source_format == target_format
+        self._pending = b''
+        self._header = self.source_encoding == ENCODING_WAV
+        self._channels = 1
+        self._resampler = None
+        if self.source_rate is not None:
+            self._set_rate(self.source_rate)
+
+    def _set_rate(self, rate):
+        self.source_rate = rate
+        if rate != self.target_rate:
+            self._resampler = Resampler(rate, self.target_rate)
+
+    def feed(self, chunk):
+        """Convierte un fragmento; puede devolver b'' si aún no hay una muestra completa."""
+        if self.passthrough:
+            return bytes(chunk)
+        samples = self._decode(chunk)
+        if samples is None or not len(samples):
+            return b''
+        if self._resampler is not None:
+            samples = self._resampler.process(samples)
+        return self._encode(samples)
+
+    def flush(self):
+        """Final del audio: devuelve lo que quedaba retenido en el remuestreo."""
+        if self.passthrough or self._resampler is None:
+            return b''
+        return self._encode(self._resampler.flush())
+
+    def _decode(self, chunk):
+        if self.source_encoding == ENCODING_ULAW:
+            return decode_ulaw(chunk)
+        data = self._pending + chunk if self._pending else bytes(chunk)
+        if self._header:
+            data = self._parse_wav_header(data)
+            if data is None:
+                return None
+        # PCM 16 bits: un fragmento puede cortar una muestra (o una trama multicanal) por la mitad
+        frame_bytes = 2 * self._channels
+        usable = len(data) - len(data) % frame_bytes
+        self._pending = data[usable:]
+        samples = np.frombuffer(data, dtype='<i2', count=usable // 2)
+        if self._channels > 1:
+            samples = samples[::self._channels]
+        return samples
+
+    def _parse_wav_header(self, data):
+        """Lee la cabecera RIFF cuando ha llegado entera; devuelve los bytes de audio que la siguen, o None."""
+        offset = 12
+        while offset + 8 <= len(data):
+            chunk_id, size = data[offset:offset + 4], int.from_bytes(data[offset + 4:offset + 8], 'little')
+            body = offset + 8
+            if chunk_id == b'fmt ':
+                if body + 16 > len(data):
+                    break
+                if int.from_bytes(data[body + 14:body + 16], 'little') != 16:
+                    raise ValueError('Solo se admite WAV PCM de 16 bits')
+                self._channels = int.from_bytes(data[body + 2:body + 4], 'little')
+                self._set_rate(int.from_bytes(data[body + 4:body + 8], 'little'))
+            elif chunk_id == b'data':
+                if self.source_rate is None:
+                    raise ValueError('WAV sin bloque fmt antes de los datos')
+                # El tamaño de `data` no se usa: por stdout espeak-ng no lo conoce al escribir la cabecera
+                self._header = False
+                return data[body:]
+            offset = body + size + size % 2
+        self._pending = data
+        return None
+
+    def _encode(self, samples):
+        if self.target_encoding == ENCODING_ULAW:
+            return encode_pcm(samples)
+        return samples.astype('<i2', copy=False).tobytes()
@@ -0,0 +1,244 @@
+# Nombre del archivo: tts.py
+
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from . import metrics
+from .cache import TTSCache, cache_key
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+# Formato que usa ElevenLabs cuando no se indica `output_format`
+DEFAULT_OUTPUT_FORMAT = 'mp3_44100_128'
+# Tamaño de los fragmentos con los que se reenvía en streaming un audio cacheado
+CACHED_CHUNK_SIZE = 4096
+
+
+class TTSEngine:
+    """
+    Capa asíncrona de síntesis de voz.
+
+    Los proveedores (`providers.py`) son bloqueantes, así que cada síntesis se
+    ejecuta en un pool de hilos acotado. Un semáforo limita cuántas síntesis hay en vuelo por
+    worker; el resto espera en el event loop sin bloquear a otros WebSockets.
+    """
+
+    def __init__(self, max_concurrency=16, executor_workers=None, cache=None):
+        self.max_concurrency = max_concurrency
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(
+            max_workers=executor_workers or max_concurrency,
+            thread_name_prefix='tts',
+        )
+        self._semaphore = None
+        self.in_flight = 0
+        self.waiting = 0
+
+    def _get_semaphore(self):
+        # Se crea perezosamente para quedar ligado al event loop del servidor
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    @contextlib.asynccontextmanager
+    async def _slot(self):
+        """Reserva uno de los `max_concurrency` huecos de síntesis del worker."""
+        semaphore = self._get_semaphore()
+        self.waiting += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            semaphore.release()
+
+    async def run(self, func, *args, **kwargs):
+        """Ejecuta una función bloqueante respetando el límite de concurrencia."""
+        async with self._slot():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def synthesize(self, provider, text, voice_id=None, model_id=None, output_format=None):
+        """Sintetiza `text` con `provider` y devuelve el audio completo en bytes."""
+        voice_id, model_id = voice_id or provider.voice_id, model_id or provider.model_id
+        key = self._cache_key(provider, text, voice_id, model_id, output_format)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return bytes(cached)
+
+        started = time.perf_counter()
+        audio = await self.run(provider.synthesize, text, voice_id, model_id, output_format)
+        metrics.TTS_SYNTHESIS.observe(time.perf_counter() - started)
+        await self._cache_put(key, audio)
+        return audio
+
+    async def stream(self, provider, text, voice_id=None, model_id=None, output_format=None, max_buffered_chunks=8):
+        """
+        Sintetiza `text` y va entregando los fragmentos de audio según llegan.
+
+        Un hilo del pool lee la respuesta del proveedor en streaming y deposita cada
+        fragmento en una cola del event loop. Como mucho hay
+        `max_buffered_chunks` fragmentos pendientes: si el cliente WebSocket es
+        lento, el hilo deja de leer y la memoria no crece sin límite. Si el
+        cliente abandona el stream (interrupción), el hilo cierra la respuesta
+        del proveedor y vuelve al pool.
+        """
+        started = time.perf_counter()
+        voice_id, model_id = voice_id or provider.voice_id, model_id or provider.model_id
+        key = self._cache_key(provider, text, voice_id, model_id, output_format)
+        cached = self._cache_get(key)
+        if cached is not None:
+            metrics.TTS_TIME_TO_FIRST_BYTE.observe(time.perf_counter() - started)
+            for offset in range(0, len(cached), CACHED_CHUNK_SIZE):
+                yield bytes(cached[offset:offset + CACHED_CHUNK_SIZE])
+            return
+
+        received = [] if key else None
+        chunks = self._stream(provider, text, voice_id, model_id, output_format, max_buffered_chunks)
+        async with self._slot(), contextlib.aclosing(chunks):
+            first = True
+            async for chunk in chunks:
+                if first:
+                    first = False
+                    metrics.TTS_TIME_TO_FIRST_BYTE.observe(time.perf_counter() - started)
+                if received is not None:
+                    received.append(chunk)
+                yield chunk
+        metrics.TTS_SYNTHESIS.observe(time.perf_counter() - started)
+
+        # Solo se cachea el audio que se recibió completo
+        if received:
+            await self._cache_put(key, b''.join(received))
+
+    def cached(self, provider, text, voice_id=None, model_id=None, output_format=None):
+        """Audio ya cacheado de `text` con esos parámetros, o None. Nunca sintetiza."""
+        voice_id, model_id = voice_id or provider.voice_id, model_id or provider.model_id
+        cached = self._cache_get(self._cache_key(provider, text, voice_id, model_id, output_format))
+        return bytes(cached) if cached is not None else None
+
+    async def prewarm(self, provider, texts, voice_id=None, model_id=None, output_format=None):
+        """Sintetiza de antemano `texts` (saludos, avisos...) para que la primera llamada ya acierte en caché."""
+        results = await asyncio.gather(
+            *(self.synthesize(provider, text, voice_id, model_id, output_format) for text in texts),
+            return_exceptions=True,
+        )
+        for text, result in zip(texts, results):
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ No se pudo precalentar '{text}': {str(result)}")
+        warmed = sum(1 for result in results if not isinstance(result, Exception))
+        logger.info(f"🔥 Caché TTS precalentada: {warmed}/{len(texts)} textos")
+        return warmed
+
+    def _cache_key(self, provider, text, voice_id, model_id, output_format):
+        if self.cache is None:
+            return None
+        return cache_key(provider.name, text, voice_id, model_id, output_format or DEFAULT_OUTPUT_FORMAT)
+
+    def _cache_get(self, key):
+        return self.cache.get(key) if key else None
+
+    async def _cache_put(self, key, audio):
+        if not key:
+            return
+        self.cache.put(key, audio)
+        if self.cache.disk_dir:
+            await asyncio.to_thread(self.cache.store_disk, key, audio)
+
+    async def _stream(self, provider, text, voice_id, model_id, output_format, max_buffered_chunks):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        slots = threading.Semaphore(max_buffered_chunks)
+        stop = threading.Event()
+
+        def produce():
+            chunks = None
+            try:
+                chunks = iter(provider.stream(text, voice_id, model_id, output_format))
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    if not chunk:
+                        continue
+                    # Espera a que el consumidor libere hueco (backpressure)
+                    while not slots.acquire(timeout=0.25):
+                        if stop.is_set():
+                            return
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, _END)
+            except Exception as e:
+                if not stop.is_set():
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                # Cierra la respuesta del proveedor (conexión HTTP, proceso local) y libera el hilo
+                close = getattr(chunks, 'close', None)
+                if close is not None:
+                    close()
+
+        loop.run_in_executor(self._executor, produce)
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                slots.release()
+                yield item
+        finally:
+            # Desbloquea al hilo productor si el consumidor se fue antes del final
+            stop.set()
+            slots.release()
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+_engine = None
+
+
+def _register_metrics(engine):
+    metrics.REGISTRY.gauge('tts_in_flight', 'Síntesis en curso en este worker', lambda: engine.in_flight)
+    metrics.REGISTRY.gauge('tts_waiting', 'Síntesis esperando un hueco de concurrencia', lambda: engine.waiting)
+    cache = engine.cache
+    if cache is None:
+        return
+    metrics.REGISTRY.counter('tts_cache_hits_total', 'Aciertos de la caché TTS en memoria', lambda: cache.hits)
+    metrics.REGISTRY.counter('tts_cache_disk_hits_total', 'Aciertos de la caché TTS en disco', lambda: cache.disk_hits)
+    metrics.REGISTRY.counter('tts_cache_misses_total', 'Fallos de la caché TTS', lambda: cache.misses)
+    metrics.REGISTRY.counter('tts_cache_evictions_total', 'Entradas expulsadas de la caché TTS en memoria', lambda: cache.evictions)
+    metrics.REGISTRY.gauge('tts_cache_bytes', 'Bytes de audio en la caché TTS en memoria', lambda: cache.size)
+
+
+def get_tts_engine():
+    """Devuelve el motor TTS compartido por todas las conexiones del proceso."""
+    global _engine
+    if _engine is None:
+        cache = None
+        if settings.TTS_CACHE_ENABLED:
+            cache = TTSCache(
+                max_bytes=settings.TTS_CACHE_MAX_BYTES,
+                disk_dir=settings.TTS_CACHE_DIR,
+            )
+        _engine = TTSEngine(
+            max_concurrency=settings.TTS_MAX_CONCURRENCY,
+            executor_workers=settings.TTS_EXECUTOR_WORKERS,
+            cache=cache,
+        )
+        _register_metrics(_engine)
+        logger.info(f"⚙️ Motor TTS listo (concurrencia máx. {settings.TTS_MAX_CONCURRENCY})")
+    return _engine
@@ -0,0 +1,166 @@
+# Nombre del archivo: twilio_media.py
+
+import time
+from collections import deque
+
+import numpy as np
+
+# Twilio Media Streams: μ-law (G.711), 8 kHz, mono, tramas de 20 ms
+SAMPLE_RATE = 8000
+FRAME_MS = 20
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+# El mismo formato con la nomenclatura de los proveedores TTS
+WIRE_FORMAT = 'ulaw_8000'
+
+_ULAW_BIAS = 0x84
+_ULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+
+
+def _build_decode_table():
+    ulaw = ~np.arange(256, dtype=np.uint8)
+    sign = ulaw & 0x80
+    exponent = (ulaw >> 4) & 0x07
+    mantissa = ulaw & 0x0F
+    magnitude = (((mantissa.astype(np.int32) << 3) + _ULAW_BIAS) << exponent) - _ULAW_BIAS
+    return np.where(sign != 0, -magnitude, magnitude).astype(np.int16)
+
+
+def _build_encode_table():
+    # Una entrada por cada valor int16 posible, indexada por su patrón de bits (uint16).
+    # Mismo redondeo que G.711 de referencia: se trabaja sobre 14 bits.
+    pcm = np.arange(65536, dtype=np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(pcm), 8159) + 0x21
+    segment = np.searchsorted(_ULAW_SEGMENT_ENDS, magnitude)
+    ulaw = (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    ulaw = np.where(segment >= 8, 0x7F, ulaw)
+    return (ulaw ^ mask).astype(np.uint8)
+
+
+# Tablas de consulta: decodificar/codificar una trama es un único `take` vectorizado
+ULAW_TO_PCM = _build_decode_table()
+PCM_TO_ULAW = _build_encode_table()
+
+
+def decode_ulaw(ulaw, out=None):
+    """Convierte bytes μ-law en muestras PCM int16."""
+    return ULAW_TO_PCM.take(np.frombuffer(ulaw, dtype=np.uint8), out=out)
+
+
+def encode_pcm(pcm):
+    """Convierte muestras PCM int16 en bytes μ-law."""
+    return PCM_TO_ULAW.take(np.asarray(pcm, dtype=np.int16).view(np.uint16)).tobytes()
+
+
+class PCMRingBuffer:
+    """
+    Búfer circular de muestras PCM int16 reservado una sola vez.
+
+    Las tramas entrantes se decodifican directamente dentro del búfer, sin
+    arrays intermedios. Si el lector se queda atrás se sobrescriben las
+    muestras más antiguas y se cuentan en `overruns`.
+    """
+
+    __slots__ = ('capacity', 'samples', 'write_pos', 'read_pos', 'overruns')
+
+    def __init__(self, capacity=SAMPLE_RATE * 10):
+        self.capacity = capacity
+        self.samples = np.zeros(capacity, dtype=np.int16)
+        self.write_pos = 0
+        self.read_pos = 0
+        self.overruns = 0
+
+    @property
+    def available(self):
+        return self.write_pos - self.read_pos
+
+    def write_ulaw(self, ulaw):
+        """Decodifica bytes μ-law y los añade al búfer."""
+        self._write(np.frombuffer(ulaw, dtype=np.uint8), ULAW_TO_PCM)
+
+    def write(self, pcm):
+        """Añade muestras PCM int16 al búfer."""
+        self._write(np.asarray(pcm, dtype=np.int16), None)
+
+    def _write(self, data, table):
+        n = len(data)
+        if n > self.capacity:
+            data = data[-self.capacity:]
+            self.write_pos += n - self.capacity
+            n = self.capacity
+
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self._copy(data[:first], self.samples[start:start + first], table)
+        if first < n:
+            self._copy(data[first:], self.samples[:n - first], table)
+        self.write_pos += n
+
+        if self.available > self.capacity:
+            self.overruns += self.available - self.capacity
+            self.read_pos = self.write_pos - self.capacity
+
+    @staticmethod
+    def _copy(src, dst, table):
+        if table is None:
+            dst[:] = src
+        else:
+            table.take(src, out=dst)
+
+    def read(self, n):
+        """Extrae hasta `n` muestras (las más antiguas pendientes)."""
+        n = min(n, self.available)
+        start = self.read_pos % self.capacity
+        end = start + n
+        if end <= self.capacity:
+            out = self.samples[start:end].copy()
+        else:
+            out = np.concatenate((self.samples[start:], self.samples[:end - self.capacity]))
+        self.read_pos += n
+        return out
+
+    def clear(self):
+        self.read_pos = self.write_pos
+
+
+class MarkTracker:
+    """
+    Sigue los mensajes `mark` enviados a Twilio.
+
+    Twilio devuelve cada `mark` cuando termina de reproducir el audio enviado
+    antes que él, en el mismo orden, así que una cola basta para saber qué
+    audio sigue pendiente y cuánto tardó en sonar.
+    """
+
+    __slots__ = ('pending', 'counter', 'last_latency')
+
+    def __init__(self):
+        self.pending = deque()
+        self.counter = 0
+        self.last_latency = None
+
+    def next(self, label='audio'):
+        self.counter += 1
+        name = f'{label}-{self.counter}'
+        self.pending.append((name, time.monotonic()))
+        return name
+
+    def ack(self, name):
+        """Marca `name` (y las anteriores) como reproducidas. Devuelve la latencia o None."""
+        if not any(pending_name == name for pending_name, _ in self.pending):
+            # Mark de audio ya descartado con `clear`: no toca las de la respuesta en curso
+            return None
+        while self.pending:
+            pending_name, sent_at = self.pending.popleft()
+            if pending_name == name:
+                self.last_latency = time.monotonic() - sent_at
+                return self.last_latency
+        return None
+
+    def clear(self):
+        """Olvida las marcas pendientes: tras un `clear` Twilio ya no reproducirá ese audio."""
+        self.pending.clear()
+
+    @property
+    def playing(self):
+        return bool(self.pending)
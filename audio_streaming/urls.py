@@ -4,5 +4,10 @@ from . import views
 urlpatterns = [
     # path('streams.xml', views.streams_xml, name='streams_xml'),  # <- esta línea sobra
     path('api/logs/', views.audio_logs_api, name='audio_logs_api'),
+    path('api/logs/stream/', views.audio_logs_stream, name='audio_logs_stream'),
     path('logs/', views.logs_page, name='logs_page'),
+    path('health/', views.health, name='health'),
+    path('metrics/', views.metrics, name='metrics'),
+    path('admin/drain/', views.drain, name='drain'),
+    path('admin/profiling/', views.profiling, name='profiling'),
 ]
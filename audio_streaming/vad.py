@@ -0,0 +1,87 @@
+# Nombre del archivo: vad.py
+
+from collections import namedtuple
+
+import numpy as np
+
+from .twilio_media import FRAME_MS, FRAME_SAMPLES
+
+SPEECH_START = 'speech_start'
+UTTERANCE_END = 'utterance_end'
+
+# `duration`: segundos de voz del turno (solo en UTTERANCE_END)
+VADEvent = namedtuple('VADEvent', 'kind duration')
+
+_FULL_SCALE_POWER = 32768.0 ** 2
+
+
+class EnergyVAD:
+    """
+    Detector de turnos por energía.
+
+    Las tramas de 20 ms se acumulan en el búfer circular y se analizan por
+    bloques (`block_ms`): la energía de todas las tramas del bloque se calcula
+    de una vez con NumPy y solo la máquina de estados recorre el resultado.
+
+    - Hay voz cuando `start_ms` seguidos superan `threshold_db` (dBFS).
+    - El turno termina tras `end_silence_ms` de silencio, si duró al menos
+      `min_speech_ms`; los turnos más largos que `max_utterance_ms` se cortan.
+    """
+
+    __slots__ = (
+        'threshold_db', 'start_frames', 'end_frames', 'min_speech_frames', 'max_frames', 'block_samples',
+        'in_speech', 'voiced_run', 'silence_run', 'speech_frames', 'utterance_frames',
+    )
+
+    def __init__(self, threshold_db=-40.0, start_ms=60, end_silence_ms=600,
+                 min_speech_ms=200, max_utterance_ms=15000, block_ms=100):
+        self.threshold_db = threshold_db
+        self.start_frames = max(1, start_ms // FRAME_MS)
+        self.end_frames = max(1, end_silence_ms // FRAME_MS)
+        self.min_speech_frames = max(1, min_speech_ms // FRAME_MS)
+        self.max_frames = max(1, max_utterance_ms // FRAME_MS)
+        self.block_samples = max(1, block_ms // FRAME_MS) * FRAME_SAMPLES
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self.voiced_run = 0
+        self.silence_run = 0
+        self.speech_frames = 0
+        self.utterance_frames = 0
+
+    def feed(self, ring):
+        """Analiza los bloques completos pendientes en `ring` y devuelve los eventos detectados."""
+        usable = ring.available - ring.available % self.block_samples
+        if not usable:
+            return []
+
+        frames = ring.read(usable).reshape(-1, FRAME_SAMPLES).astype(np.float32)
+        power = np.einsum('ij,ij->i', frames, frames) / FRAME_SAMPLES
+        energy_db = 10.0 * np.log10(power / _FULL_SCALE_POWER + 1e-12)
+        return self._update((energy_db > self.threshold_db).tolist())
+
+    def _update(self, voiced_frames):
+        events = []
+        for voiced in voiced_frames:
+            if not self.in_speech:
+                self.voiced_run = self.voiced_run + 1 if voiced else 0
+                if self.voiced_run >= self.start_frames:
+                    self.in_speech = True
+                    self.speech_frames = self.utterance_frames = self.voiced_run
+                    self.silence_run = 0
+                    events.append(VADEvent(SPEECH_START, None))
+                continue
+
+            self.utterance_frames += 1
+            if voiced:
+                self.speech_frames += 1
+                self.silence_run = 0
+            else:
+                self.silence_run += 1
+
+            if self.silence_run >= self.end_frames or self.utterance_frames >= self.max_frames:
+                if self.speech_frames >= self.min_speech_frames:
+                    events.append(VADEvent(UTTERANCE_END, self.speech_frames * FRAME_MS / 1000))
+                self.reset()
+        return events
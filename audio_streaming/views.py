@@ -1,21 +1,184 @@
-from django.http import JsonResponse
+import asyncio
+import json
+
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from .models import AudioLog
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from calls.state_cache import get_call_state_cache
+from . import metrics as audio_metrics
+from .access import admin_required
+from .admission import get_admission
+from .clients import tts_providers
+from .layers import PROFILE_STATUS, WORKER_DRAIN, WORKER_RESUME
+from .log_feed import LOG_FEED_GROUP, START_CURSOR, decode_log_cursor, latest_logs, logs_since
+from .log_pipeline import get_error_reporter, get_log_pipeline
+from .log_writer import get_audio_log_writer
+from .loop_monitor import get_loop_monitor
+from .profiling import STACKS_PROFILE, get_profiler
+from .prompts import get_prompt_library
+from .sessions import sessions
+from .wire import get_message_codec
+from .tts import get_tts_engine
 
 def audio_logs_api(request):
-    logs = AudioLog.objects.order_by('-timestamp')[:100]
-    data = [
-        {
-            'timestamp': log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            'event': log.event,
-            'response_text': log.response_text,
-            'audio_length': log.audio_length,
-            'twilio_sid': log.twilio_sid,
-            'ip_address': log.ip_address
-        }
-        for log in logs
-    ]
-    return JsonResponse({'logs': data})
+    """
+    Logs de audio, del más reciente al más antiguo.
+
+    Sin parámetros devuelve los últimos `AUDIO_LOG_API_LIMIT`. Con
+    `?since=<cursor>` solo los posteriores a ese cursor, para que un panel
+    pida únicamente lo nuevo. La respuesta trae el `cursor` para la siguiente
+    petición y `more` si quedaron logs por entregar.
+    """
+    since = request.GET.get('since')
+    limit = settings.AUDIO_LOG_API_LIMIT
+    if not since:
+        logs, cursor = latest_logs(limit)
+        return JsonResponse({'logs': logs, 'cursor': cursor, 'more': False})
+    try:
+        logs, cursor, more = logs_since(since, limit)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({'logs': logs, 'cursor': cursor, 'more': more})
+
+async def audio_logs_stream(request):
+    """
+    Feed de logs nuevos por Server-Sent Events.
+
+    Cada evento lleva en `data` el mismo JSON que `audio_logs_api` con
+    `since`, y su `id` es el cursor: al reconectar, el navegador lo manda en
+    `Last-Event-ID` y el feed sigue donde se quedó. Ese cursor manda sobre el
+    `?since` de la URL, que es el de la primera conexión.
+    """
+    since = request.GET.get('since')
+    last_event_id = request.headers.get('Last-Event-ID')
+    if last_event_id:
+        try:
+            decode_log_cursor(last_event_id)
+            since = last_event_id
+        except ValueError:
+            # Cursor de otra versión del feed: se sigue desde `since`
+            pass
+    if since:
+        try:
+            decode_log_cursor(since)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+    response = StreamingHttpResponse(_log_events(since), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def _log_events(since):
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    # Primero se entra al grupo: un aviso que llegue durante la consulta queda en el canal
+    await layer.group_add(LOG_FEED_GROUP, channel)
+    try:
+        if not since:
+            # Solo interesa lo que llegue a partir de ahora
+            _, since = await database_sync_to_async(latest_logs)(1)
+            since = since or START_CURSOR
+        yield 'retry: 3000\n\n'
+        while True:
+            logs, since, more = await database_sync_to_async(logs_since)(since, settings.AUDIO_LOG_API_LIMIT)
+            if logs:
+                data = json.dumps({'logs': logs, 'cursor': since, 'more': more}, cls=DjangoJSONEncoder)
+                yield f'id: {since}\ndata: {data}\n\n'
+            if more:
+                continue
+            try:
+                await asyncio.wait_for(layer.receive(channel), settings.AUDIO_LOG_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield ': keepalive\n\n'
+    finally:
+        await layer.group_discard(LOG_FEED_GROUP, channel)
 
 def logs_page(request):
     return render(request, 'audio_streaming/logs.html')
+
+def health(request):
+    """Estado del worker y del cliente TTS compartido; 503 si el worker está en drenaje."""
+    cache = get_tts_engine().cache
+    admission = get_admission()
+    return JsonResponse({
+        'status': 'draining' if admission.draining else 'ok',
+        'tts': tts_providers.status(),
+        'tts_cache': cache.stats() if cache else None,
+        'audio_log_writer': get_audio_log_writer().stats(),
+        'call_state_cache': get_call_state_cache().stats(),
+        'sessions': sessions.stats(),
+        'ws_codec': get_message_codec().name,
+        'logging': {**get_log_pipeline().stats(), 'errors': get_error_reporter().stats()},
+        'admission': admission.stats(),
+        'prompts': get_prompt_library().stats(),
+    }, status=503 if admission.draining else 200)
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@admin_required
+def drain(request):
+    """
+    Drenaje de este worker para un despliegue sin cortes.
+
+    `POST` con `action=drain` deja de admitir llamadas (las que están en curso
+    siguen) y `action=resume` vuelve a admitirlas; `GET` solo devuelve el
+    estado. Para todos los workers a la vez: `python manage.py drain`.
+    """
+    admission = get_admission()
+    if request.method == 'POST':
+        action = request.POST.get('action', WORKER_DRAIN)
+        if action == WORKER_DRAIN:
+            admission.drain()
+        elif action == WORKER_RESUME:
+            admission.resume()
+        else:
+            return JsonResponse({'error': f'Acción no soportada: {action}'}, status=400)
+    return JsonResponse(admission.stats())
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+@admin_required
+def profiling(request):
+    """
+    Perfilado en caliente del event loop de este worker.
+
+    `GET` devuelve el retraso del loop, los bloqueos detectados (con el método
+    del consumidor al que se atribuyen) y el último perfil por muestreo; con
+    `?format=collapsed&kind=profile|stalls` devuelve las pilas en formato
+    "collapsed" para flamegraph.pl o speedscope. `POST` con `action=`
+    `stalls_on` (`threshold_ms`), `stalls_off`, `profile` (`seconds`,
+    `interval_ms`), `profile_stop`, `reset` o `dump` (`kind`). Para todos los
+    workers a la vez: `python manage.py profile`.
+    """
+    profiler = get_profiler()
+    try:
+        if request.method == 'POST':
+            return JsonResponse(profiler.control(request.POST.get('action', PROFILE_STATUS), request.POST))
+        if request.GET.get('format') == 'collapsed':
+            return HttpResponse(
+                profiler.collapsed(request.GET.get('kind', STACKS_PROFILE)),
+                content_type='text/plain; charset=utf-8',
+            )
+        return JsonResponse(profiler.stats())
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+def metrics(request):
+    """Métricas del worker en el formato de texto de Prometheus."""
+    # Crea el motor, el escritor, el control de admisión y la biblioteca de locuciones si aún no existen para que registren sus métricas
+    get_tts_engine()
+    get_prompt_library()
+    get_audio_log_writer()
+    get_admission()
+    get_loop_monitor()
+    return HttpResponse(
+        audio_metrics.REGISTRY.render_prometheus(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
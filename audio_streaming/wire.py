@@ -0,0 +1,173 @@
+# Nombre del archivo: wire.py
+
+import json
+
+from django.conf import settings
+
+# Bibliotecas JSON que puede usar el WebSocket (`WS_JSON_CODEC`)
+CODEC_AUTO = 'auto'
+CODEC_JSON = 'json'
+CODEC_ORJSON = 'orjson'
+CODEC_MSGSPEC = 'msgspec'
+
+# Las tramas `media` de Twilio empiezan siempre por el campo `event`
+_MEDIA_PREFIX = '{"event":"media",'
+_PAYLOAD_KEY = '"payload":"'
+_SEQUENCE_KEY = '"sequenceNumber":"'
+
+
+class DecodeError(ValueError):
+    """El mensaje recibido no es un objeto JSON válido."""
+
+
+class JSONBackend:
+    """`json` de la biblioteca estándar."""
+
+    name = CODEC_JSON
+
+    def loads(self, text):
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise DecodeError(str(e)) from e
+
+    def dumps(self, content):
+        return json.dumps(content)
+
+
+class OrjsonBackend:
+    """`orjson` (opcional): `pip install orjson`."""
+
+    name = CODEC_ORJSON
+
+    def __init__(self):
+        try:
+            import orjson
+        except ImportError as e:
+            raise ImportError("WS_JSON_CODEC=orjson necesita `pip install orjson`") from e
+        self._loads = orjson.loads
+        self._dumps = orjson.dumps
+        self._error = orjson.JSONDecodeError
+
+    def loads(self, text):
+        try:
+            return self._loads(text)
+        except self._error as e:
+            raise DecodeError(str(e)) from e
+
+    def dumps(self, content):
+        return self._dumps(content).decode()
+
+
+class MsgspecBackend:
+    """`msgspec` (opcional): `pip install msgspec`."""
+
+    name = CODEC_MSGSPEC
+
+    def __init__(self):
+        try:
+            import msgspec
+        except ImportError as e:
+            raise ImportError("WS_JSON_CODEC=msgspec necesita `pip install msgspec`") from e
+        self._decoder = msgspec.json.Decoder()
+        self._encoder = msgspec.json.Encoder()
+        self._error = msgspec.DecodeError
+
+    def loads(self, text):
+        try:
+            return self._decoder.decode(text)
+        except self._error as e:
+            raise DecodeError(str(e)) from e
+
+    def dumps(self, content):
+        return self._encoder.encode(content).decode()
+
+
+BACKENDS = {
+    CODEC_JSON: JSONBackend,
+    CODEC_ORJSON: OrjsonBackend,
+    CODEC_MSGSPEC: MsgspecBackend,
+}
+
+
+def get_backend(name=CODEC_AUTO):
+    """Crea el backend `name`; `auto` usa orjson o msgspec si están instalados y si no `json`."""
+    if name != CODEC_AUTO:
+        if name not in BACKENDS:
+            raise ValueError(f'Códec JSON desconocido: {name}')
+        return BACKENDS[name]()
+    for backend in (OrjsonBackend, MsgspecBackend):
+        try:
+            return backend()
+        except ImportError:
+            continue
+    return JSONBackend()
+
+
+def parse_media(text):
+    """
+    Lee una trama `media` de Twilio sin parsear el JSON completo.
+
+    Solo extrae lo que usa el consumidor, el `payload` y el `sequenceNumber`,
+    cortándolos del texto: el base64 no lleva comillas, así que su final es la
+    siguiente comilla (un `\\/` escapado lo descarta `b64decode`). Devuelve el
+    mismo dict que daría el parseo completo, con esos dos campos, o None si el
+    mensaje no tiene la forma esperada y hay que parsearlo entero.
+    """
+    head, found, rest = text.partition(_PAYLOAD_KEY)
+    if not found:
+        return None
+    payload, found, _ = rest.partition('"')
+    if not found:
+        return None
+
+    message = {'event': 'media', 'media': {'payload': payload}}
+    _, found, rest = head.partition(_SEQUENCE_KEY)
+    if found:
+        message['sequenceNumber'] = rest.partition('"')[0]
+    return message
+
+
+class MessageCodec:
+    """
+    Códec de los mensajes de texto del WebSocket.
+
+    Las tramas `media` (50 por segundo y llamada, con el audio en base64) se
+    reconocen por su prefijo y se leen con `parse_media`, sin construir el
+    árbol JSON completo ni validar el resto del mensaje. Los demás mensajes
+    (`start`, `mark`, `stop`, los del navegador) y las respuestas pasan por el
+    backend JSON configurado.
+    """
+
+    def __init__(self, backend=None, media_fast_path=True):
+        self.backend = backend or JSONBackend()
+        self.media_fast_path = media_fast_path
+
+    @property
+    def name(self):
+        return self.backend.name + ('+media' if self.media_fast_path else '')
+
+    def decode(self, text):
+        """Devuelve el mensaje como dict; lanza `DecodeError` si no es un objeto JSON."""
+        if self.media_fast_path and text.startswith(_MEDIA_PREFIX):
+            message = parse_media(text)
+            if message is not None:
+                return message
+        message = self.backend.loads(text)
+        if not isinstance(message, dict):
+            raise DecodeError('El mensaje no es un objeto JSON')
+        return message
+
+    def encode(self, content):
+        return self.backend.dumps(content)
+
+
+_codec = None
+
+
+def get_message_codec():
+    """Devuelve el códec compartido por todas las conexiones del proceso."""
+    global _codec
+    if _codec is None:
+        _codec = MessageCodec(get_backend(settings.WS_JSON_CODEC), settings.WS_MEDIA_FAST_PATH)
+    return _codec
@@ -0,0 +1,101 @@
+"""
+Benchmark del listado de llamadas con una tabla grande.
+
+Crea una base de datos de prueba con N filas de `Call` y compara, para una
+página de `--page-size` filas:
+
+- `legacy`: `CallSerializer` sobre `Call.objects.all()` (el listado anterior).
+- `offset`: página a profundidad `--depth` con OFFSET y `CallSerializer`.
+- `keyset`: la misma página con `keyset_page` y `values()`.
+- `keyset+status`: la misma consulta filtrando por estado.
+
+Uso:
+    python -m benchmarks.call_list --rows 1000000 --depth 900000
+    python -m benchmarks.call_list --rows 1000000 --skip-legacy
+"""
+
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'voice_flow.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+
+from calls.models import Call  # noqa: E402
+from calls.pagination import encode_cursor, keyset_page  # noqa: E402
+from calls.serializers import CallSerializer  # noqa: E402
+from calls.views import CALL_LIST_FIELDS  # noqa: E402
+
+STATUSES = ('received', 'in-progress', 'completed', 'failed')
+INSERT_BATCH = 50000
+
+
+def populate(rows):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rng = random.Random(0)
+    sql = (
+        'INSERT INTO calls_call (call_sid, from_number, to_number, status, duration, created_at, updated_at) '
+        'VALUES (%s, %s, %s, %s, %s, %s, %s)'
+    )
+    with connection.cursor() as cursor:
+        for offset in range(0, rows, INSERT_BATCH):
+            batch = []
+            for i in range(offset, min(offset + INSERT_BATCH, rows)):
+                # Dos llamadas por segundo: hay empates en created_at que desempata el id
+                created_at = start + timedelta(seconds=i // 2)
+                batch.append((f'CA{i:032x}', '+15550000000', '+15551111111', rng.choice(STATUSES),
+                              rng.randint(0, 600), created_at, created_at))
+            cursor.executemany(sql, batch)
+
+
+def timed(label, func, repeat):
+    func()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:>14}: {elapsed * 1000:10.2f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--depth', type=int, default=None, help='fila donde empieza la página (por defecto, 90 %% de la tabla)')
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--skip-legacy', action='store_true', help='no medir el listado completo sin paginar')
+    args = parser.parse_args()
+    depth = args.depth if args.depth is not None else int(args.rows * 0.9)
+
+    connection.creation.create_test_db(verbosity=0)
+    start = time.perf_counter()
+    populate(args.rows)
+    print(f"{args.rows} llamadas insertadas en {time.perf_counter() - start:.1f} s")
+
+    if not args.skip_legacy:
+        timed('legacy', lambda: CallSerializer(Call.objects.all(), many=True).data, 1)
+
+    page = args.page_size
+    timed('offset', lambda: CallSerializer(Call.objects.all()[depth:depth + page], many=True).data, args.repeat)
+
+    # Cursor de la fila anterior a la página (como si el cliente viniera paginando)
+    previous = Call.objects.values('id', 'created_at')[depth - 1] if depth else None
+    cursor = encode_cursor(previous['created_at'], previous['id']) if previous else None
+    timed('keyset', lambda: keyset_page(Call.objects.all(), CALL_LIST_FIELDS, cursor, page), args.repeat)
+    timed('keyset+status', lambda: keyset_page(Call.objects.filter(status='failed'), CALL_LIST_FIELDS, cursor, page),
+          args.repeat)
+
+    query = Call.objects.filter(status='failed').order_by('-created_at', '-id').values(*CALL_LIST_FIELDS)[:page]
+    print(f"Plan: {query.explain()}")
+
+
+if __name__ == '__main__':
+    main()
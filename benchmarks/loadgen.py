@@ -0,0 +1,268 @@
+"""
+Generador de carga: llamadas simultáneas de Twilio Media Streams contra el consumidor.
+
+Cada llamada es un cliente asyncio que reproduce una sesión como la de Twilio:
+`connected`, `start`, tramas `media` de 20 ms en μ-law (silencio y turnos de
+voz) a ritmo real, confirmación de los `mark` cuando termina de "reproducir"
+el audio recibido, y `stop`. Mide:
+
+- Tiempo hasta el primer audio (TTFA): del fin de cada turno de voz a la
+  primera trama de la respuesta (incluye el silencio que espera el VAD), y
+  del `start` al primer audio del saludo.
+- Jitter de las tramas recibidas dentro de una respuesta y cortes de
+  reproducción (una trama que llega cuando el audio anterior ya se agotó).
+- Con `--ramp`, el máximo de llamadas que el worker sostiene cumpliendo
+  `--slo-ms` en el p95 del TTFA, sin errores ni cortes.
+
+El servidor se arranca aparte, normalmente con el TTS simulado y sin caché
+para que cada respuesta pague la latencia configurada:
+
+    TTS_PROVIDER=stub TTS_STUB_LATENCY_MS=200 TTS_CACHE_ENABLED=False \\
+        uvicorn voice_flow.asgi:application --port 8000
+
+Uso:
+    python -m benchmarks.loadgen --calls 100 --turns 3
+    python -m benchmarks.loadgen --ramp 50,100,200,400 --slo-ms 1500
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import time
+import uuid
+
+import numpy as np
+import websockets
+
+from audio_streaming.twilio_media import FRAME_MS, FRAME_SAMPLES, SAMPLE_RATE, encode_pcm
+
+FRAME_SECONDS = FRAME_MS / 1000
+
+
+def _media_frames(pcm):
+    ulaw = encode_pcm(pcm)
+    return [base64.b64encode(ulaw[i:i + FRAME_SAMPLES]).decode('ascii')
+            for i in range(0, len(ulaw) - FRAME_SAMPLES + 1, FRAME_SAMPLES)]
+
+
+# Un segundo de tono de 300 Hz (voz) y una trama de ruido de fondo muy bajo (silencio)
+_t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+SPEECH_FRAMES = _media_frames((6000 * np.sin(2 * np.pi * 300 * _t)).astype(np.int16))
+SILENCE_FRAMES = _media_frames(np.random.default_rng(0).integers(-20, 20, SAMPLE_RATE).astype(np.int16))
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+class Stats:
+    def __init__(self):
+        self.ttfa = []
+        self.greeting_ttfa = []
+        self.gaps = []
+        self.underruns = 0
+        self.frames_received = 0
+        self.send_lateness = []
+        self.completed = 0
+        self.failed = 0
+        self.errors = []
+        self.server_errors = 0
+        self.missed_turns = 0
+
+
+class CallSession:
+    """Una llamada simulada."""
+
+    def __init__(self, url, stats, turns, lead_in, speech, silence):
+        self.url = url
+        self.stats = stats
+        self.turns = turns
+        self.lead_in = lead_in
+        self.speech = speech
+        self.silence = silence
+        self.stream_sid = 'MZ' + uuid.uuid4().hex
+        self.call_sid = 'CA' + uuid.uuid4().hex
+        self.sequence = 0
+        self.started_at = None
+        self.turn_ended_at = None
+        self.greeted = False
+        self.play_until = 0.0
+        self.last_frame_at = None
+        self.pending_marks = set()
+
+    def _message(self, event, **fields):
+        self.sequence += 1
+        return json.dumps({'event': event, 'sequenceNumber': str(self.sequence), 'streamSid': self.stream_sid, **fields})
+
+    def _media(self, payload, timestamp_ms):
+        self.sequence += 1
+        return (f'{{"event":"media","sequenceNumber":"{self.sequence}","streamSid":"{self.stream_sid}",'
+                f'"media":{{"track":"inbound","chunk":"{self.sequence}","timestamp":"{timestamp_ms}",'
+                f'"payload":"{payload}"}}}}')
+
+    async def run(self):
+        try:
+            async with websockets.connect(self.url, max_size=None, open_timeout=30) as ws:
+                receiver = asyncio.ensure_future(self._receive(ws))
+                try:
+                    await self._send(ws)
+                finally:
+                    receiver.cancel()
+            self.stats.completed += 1
+        except Exception as e:
+            self.stats.failed += 1
+            self.stats.errors.append(f'{type(e).__name__}: {e}')
+
+    async def _send(self, ws):
+        await ws.send(json.dumps({'event': 'connected', 'protocol': 'Call', 'version': '1.0.0'}))
+        await ws.send(self._message('start', start={
+            'streamSid': self.stream_sid,
+            'callSid': self.call_sid,
+            'accountSid': 'AC' + '0' * 32,
+            'tracks': ['inbound'],
+            'mediaFormat': {'encoding': 'audio/x-mulaw', 'sampleRate': SAMPLE_RATE, 'channels': 1},
+            'customParameters': {},
+        }))
+
+        # Guion de la llamada: (segundos, tramas) alternando silencio y voz
+        script = [(self.lead_in, SILENCE_FRAMES)]
+        for _ in range(self.turns):
+            script += [(self.speech, SPEECH_FRAMES), (self.silence, SILENCE_FRAMES)]
+
+        loop = asyncio.get_running_loop()
+        self.started_at = start = loop.time()
+        frame = 0
+        for seconds, frames in script:
+            for i in range(int(seconds / FRAME_SECONDS)):
+                # Ritmo real con horario absoluto: un retraso no se acumula
+                due = start + frame * FRAME_SECONDS
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    self.stats.send_lateness.append(-delay)
+                await ws.send(self._media(frames[i % len(frames)], frame * FRAME_MS))
+                frame += 1
+            if frames is SPEECH_FRAMES:
+                if self.turn_ended_at is not None:
+                    self.stats.missed_turns += 1
+                self.turn_ended_at = loop.time()
+
+        if self.turn_ended_at is not None:
+            self.stats.missed_turns += 1
+        await ws.send(self._message('stop', stop={'accountSid': 'AC' + '0' * 32, 'callSid': self.call_sid}))
+
+    async def _receive(self, ws):
+        loop = asyncio.get_running_loop()
+        async for raw in ws:
+            now = loop.time()
+            message = json.loads(raw)
+            event = message.get('event')
+            if event == 'media':
+                self._on_media(now)
+            elif event == 'mark':
+                name = message['mark']['name']
+                # Twilio devuelve el mark cuando termina de reproducir lo que iba antes
+                loop.call_at(max(now, self.play_until), self._ack_mark, ws, name)
+            elif event == 'clear':
+                self.play_until = now
+                self.last_frame_at = None
+            elif event == 'error':
+                self.stats.server_errors += 1
+
+    def _on_media(self, now):
+        self.stats.frames_received += 1
+        if self.turn_ended_at is not None:
+            self.stats.ttfa.append(now - self.turn_ended_at)
+            self.turn_ended_at = None
+            self.last_frame_at = None
+        elif not self.greeted:
+            self.stats.greeting_ttfa.append(now - self.started_at)
+            self.last_frame_at = None
+        self.greeted = True
+
+        if self.last_frame_at is not None:
+            self.stats.gaps.append(now - self.last_frame_at)
+            if now > self.play_until:
+                # El audio anterior ya se había reproducido entero: el llamante oye un corte
+                self.stats.underruns += 1
+        self.last_frame_at = now
+        self.play_until = max(self.play_until, now) + FRAME_SECONDS
+
+    def _ack_mark(self, ws, name):
+        asyncio.ensure_future(self._send_mark(ws, name))
+
+    async def _send_mark(self, ws, name):
+        try:
+            await ws.send(self._message('mark', mark={'name': name}))
+        except websockets.ConnectionClosed:
+            pass
+
+
+async def run_step(args, calls):
+    stats = Stats()
+    sessions = [CallSession(args.url, stats, args.turns, args.lead_in_ms / 1000, args.speech_ms / 1000,
+                            args.silence_ms / 1000) for _ in range(calls)]
+    tasks = []
+    for i, session in enumerate(sessions):
+        tasks.append(asyncio.ensure_future(session.run()))
+        # Las llamadas entran repartidas a lo largo de `--ramp-up` segundos
+        await asyncio.sleep(args.ramp_up / calls if i < calls - 1 else 0)
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def report(calls, stats, slo):
+    ms = 1000
+    ttfa_p95 = percentile(stats.ttfa, 95) * ms
+    ok = (
+        stats.failed == 0 and stats.server_errors == 0 and stats.missed_turns == 0
+        and stats.underruns == 0 and ttfa_p95 <= slo
+    )
+    print(f"\n== {calls} llamadas: {stats.completed} completadas, {stats.failed} fallidas, "
+          f"{stats.server_errors} errores del servidor, {stats.missed_turns} turnos sin respuesta")
+    print(f"   TTFA turno  p50 {percentile(stats.ttfa, 50) * ms:7.0f} ms  p95 {ttfa_p95:7.0f} ms  "
+          f"p99 {percentile(stats.ttfa, 99) * ms:7.0f} ms  ({len(stats.ttfa)} respuestas)")
+    print(f"   TTFA saludo p50 {percentile(stats.greeting_ttfa, 50) * ms:7.0f} ms  "
+          f"p95 {percentile(stats.greeting_ttfa, 95) * ms:7.0f} ms  p99 {percentile(stats.greeting_ttfa, 99) * ms:7.0f} ms")
+    print(f"   Jitter entre tramas p50 {percentile(stats.gaps, 50) * ms:6.1f} ms  p95 {percentile(stats.gaps, 95) * ms:6.1f} ms  "
+          f"p99 {percentile(stats.gaps, 99) * ms:6.1f} ms  cortes {stats.underruns} de {stats.frames_received} tramas")
+    lateness_p99 = percentile(stats.send_lateness, 99) * ms if stats.send_lateness else 0.0
+    print(f"   Retraso del generador p99 {lateness_p99:.1f} ms" + ("  ⚠️ el generador no da abasto" if lateness_p99 > FRAME_MS else ''))
+    for error in stats.errors[:3]:
+        print(f"   ❌ {error}")
+    print(f"   {'✅ dentro del SLO' if ok else '❌ fuera del SLO'} ({slo:.0f} ms en p95)")
+    return ok
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='ws://localhost:8000/ws/audio/stream/')
+    parser.add_argument('--calls', type=int, default=50, help='llamadas simultáneas')
+    parser.add_argument('--ramp', default='', help='lista de escalones de llamadas, p. ej. 50,100,200')
+    parser.add_argument('--turns', type=int, default=3, help='turnos de voz por llamada')
+    parser.add_argument('--lead-in-ms', type=int, default=4000, help='silencio inicial (deja sonar el saludo)')
+    parser.add_argument('--speech-ms', type=int, default=1000)
+    parser.add_argument('--silence-ms', type=int, default=3500, help='silencio tras cada turno (espera de la respuesta)')
+    parser.add_argument('--ramp-up', type=float, default=2.0, help='segundos en los que entran las llamadas')
+    parser.add_argument('--slo-ms', type=float, default=1500, help='p95 máximo del TTFA por turno')
+    args = parser.parse_args()
+
+    steps = [int(n) for n in args.ramp.split(',')] if args.ramp else [args.calls]
+    sustainable = 0
+    for calls in steps:
+        stats = await run_step(args, calls)
+        if report(calls, stats, args.slo_ms):
+            sustainable = calls
+        elif args.ramp:
+            break
+    if args.ramp:
+        print(f"\nMáximo sostenible por worker: {sustainable} llamadas" if sustainable else "\nNingún escalón cumplió el SLO")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
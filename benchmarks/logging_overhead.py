@@ -0,0 +1,130 @@
+"""
+Micro-benchmark del coste de los logs en el hilo del event loop.
+
+Compara, por llamada al logger, lo que paga el hilo que registra con el
+`FileHandler` síncrono de antes y con la tubería de `audio_streaming/log_pipeline.py`
+(cola + hilo escritor), para los casos del hot path: una línea INFO, un
+DEBUG desactivado con f-string y con argumentos diferidos, y un error con
+traceback (`traceback.format_exc()` + f-string frente a `ErrorReporter`,
+dentro y fuera del límite). En los casos con cola se muestra también el
+tiempo total hasta que el hilo escritor vacía la cola. `--io-latency-ms`
+simula un disco lento (cada escritura espera ese tiempo): es lo que el
+`FileHandler` síncrono hace pagar al event loop.
+
+Uso:
+    python -m benchmarks.logging_overhead --records 20000
+    python -m benchmarks.logging_overhead --records 2000 --io-latency-ms 1
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+import traceback
+
+from audio_streaming.log_pipeline import ErrorReporter, QueueLogging
+
+FORMAT = '[{asctime}] {levelname} {module} {message}'
+
+
+class SlowFileHandler(logging.FileHandler):
+    """`FileHandler` con una espera fija por escritura, como un disco o un volumen de red lentos."""
+
+    def __init__(self, path, latency):
+        super().__init__(path)
+        self.latency = latency
+
+    def emit(self, record):
+        super().emit(record)
+        if self.latency:
+            time.sleep(self.latency)
+
+
+def _logger(path, level=logging.DEBUG, latency=0.0):
+    logger = logging.getLogger('bench')
+    logger.handlers = []
+    logger.propagate = False
+    logger.setLevel(level)
+    handler = SlowFileHandler(path, latency)
+    handler.setFormatter(logging.Formatter(FORMAT, style='{', datefmt='%Y-%m-%d %H:%M:%S'))
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def _fail():
+    return int('x')
+
+
+def info_fstring(logger, reporter, i):
+    logger.info(f"🎵 Audio enviado para cliente {i} ({i * 160} bytes)")
+
+
+def debug_fstring(logger, reporter, i):
+    logger.debug(f"🔖 Mark respuesta-{i} reproducido tras {i * 0.02:.0f} ms")
+
+
+def debug_lazy(logger, reporter, i):
+    logger.debug("🔖 Mark respuesta-%d reproducido tras %.0f ms", i, i * 0.02)
+
+
+def error_format_exc(logger, reporter, i):
+    try:
+        _fail()
+    except Exception as e:
+        error_traceback = traceback.format_exc()
+        logger.error(f"❌ Error procesando datos de audio: {str(e)}\n{error_traceback}")
+
+
+def error_reporter(logger, reporter, i):
+    try:
+        _fail()
+    except Exception as e:
+        reporter.report(logger, 'media', "❌ Error procesando datos de audio", e)
+
+
+# (nombre, función, nivel del logger, cola, límite de errores)
+CASES = (
+    ('info f-string', info_fstring, logging.DEBUG, False, None),
+    ('info f-string', info_fstring, logging.DEBUG, True, None),
+    ('debug desactivado, f-string', debug_fstring, logging.INFO, False, None),
+    ('debug desactivado, diferido', debug_lazy, logging.INFO, False, None),
+    ('debug diferido', debug_lazy, logging.DEBUG, True, None),
+    ('error format_exc()', error_format_exc, logging.DEBUG, False, None),
+    ('error format_exc()', error_format_exc, logging.DEBUG, True, None),
+    ('error reporter, en el límite', error_reporter, logging.DEBUG, True, 10 ** 9),
+    ('error reporter, omitido', error_reporter, logging.DEBUG, True, 5),
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000, help='llamadas al logger por caso')
+    parser.add_argument('--io-latency-ms', type=float, default=0.0, help='espera simulada por escritura en disco')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'debug.log')
+        print(f"{args.records} llamadas por caso; µs por llamada en el hilo que registra (total con el escritor)")
+        for name, func, level, queued, burst in CASES:
+            logger, handler = _logger(path, level, args.io_latency_ms / 1000)
+            reporter = ErrorReporter(burst=burst or 5, interval=3600, sample_every=10 ** 9)
+            pipeline = QueueLogging(max_records=args.records + 1)
+            if queued:
+                pipeline.start(('bench',))
+
+            started = time.perf_counter()
+            for i in range(args.records):
+                func(logger, reporter, i)
+            caller = time.perf_counter() - started
+            pipeline.stop()
+            total = time.perf_counter() - started
+            handler.close()
+
+            mode = 'cola' if queued else 'síncrono'
+            detail = f" ({total / args.records * 1e6:7.2f} µs)" if queued else ''
+            print(f"{name:>30} [{mode:>8}]: {caller / args.records * 1e6:7.2f} µs{detail}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""
+Micro-benchmark del entramado del audio saliente.
+
+Compara, en bytes de audio por segundo y núcleo, tres formas de preparar una
+respuesta μ-law de varios segundos para Twilio:
+
+- `legacy`: base64 del audio completo (el trabajo que se descartaba antes) y
+  `json.dumps` de un mensaje por fragmento del TTS.
+- `dumps-20ms`: tramas de 20 ms copiando cada trozo y con `json.dumps`.
+- `framer`: `TwilioMediaFramer` (memoryview + prefijo/sufijo precalculados).
+
+Uso:
+    python -m benchmarks.outbound_framing --seconds 10 --repeat 200
+"""
+
+import argparse
+import base64
+import json
+import os
+import time
+
+from audio_streaming.framing import TwilioMediaFramer
+from audio_streaming.twilio_media import FRAME_SAMPLES, SAMPLE_RATE
+
+TTS_CHUNK_BYTES = 4096
+
+
+def _chunks(audio):
+    return [audio[i:i + TTS_CHUNK_BYTES] for i in range(0, len(audio), TTS_CHUNK_BYTES)]
+
+
+def legacy(audio, chunks):
+    base64.b64encode(audio).decode('utf-8')
+    for chunk in chunks:
+        json.dumps({'event': 'media', 'streamSid': 'MZbench', 'media': {'payload': base64.b64encode(chunk).decode('ascii')}})
+
+
+def dumps_20ms(audio, chunks):
+    for chunk in chunks:
+        for i in range(0, len(chunk), FRAME_SAMPLES):
+            payload = base64.b64encode(bytes(chunk[i:i + FRAME_SAMPLES])).decode('ascii')
+            json.dumps({'event': 'media', 'streamSid': 'MZbench', 'media': {'payload': payload}})
+
+
+def framer(audio, chunks):
+    f = TwilioMediaFramer('MZbench')
+    for chunk in chunks:
+        f.frames(chunk)
+    f.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0, help='duración de la respuesta de audio')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    audio = os.urandom(int(SAMPLE_RATE * args.seconds))
+    chunks = _chunks(audio)
+    for name, func in (('legacy', legacy), ('dumps-20ms', dumps_20ms), ('framer', framer)):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            func(audio, chunks)
+        elapsed = time.perf_counter() - start
+        rate = len(audio) * args.repeat / elapsed
+        print(f"{name:>10}: {rate / 1e6:7.2f} MB/s de audio por núcleo (~{rate / SAMPLE_RATE:8.0f} s de audio por segundo)")
+
+
+if __name__ == '__main__':
+    main()
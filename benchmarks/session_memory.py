@@ -0,0 +1,110 @@
+"""
+Memoria por llamada: cuánto ocupa cada sesión de audio en un worker.
+
+Crea N sesiones como las de llamadas de Twilio ya iniciadas (con VAD y
+registro por `callSid`) y mide con `tracemalloc` los bytes por sesión en
+tres estados:
+
+- `idle`: tras el `start`, sin audio todavía (el búfer de entrada no existe).
+- `active`: tras recibir una trama (búfer circular de
+  `--buffer-seconds` reservado).
+- `legacy`: el estado anterior, con atributos sueltos en un objeto con
+  `__dict__` y el búfer de 10 s reservado desde el `start`.
+
+Uso:
+    python -m benchmarks.session_memory --sessions 5000 --buffer-seconds 2
+"""
+
+import argparse
+import base64
+import gc
+import tracemalloc
+
+import numpy as np
+
+from audio_streaming.sessions import CallSession, SessionRegistry
+from audio_streaming.twilio_media import FRAME_SAMPLES, SAMPLE_RATE, MarkTracker, PCMRingBuffer
+from audio_streaming.vad import EnergyVAD
+
+PAYLOAD = base64.b64encode(np.full(FRAME_SAMPLES, 0xFF, dtype=np.uint8).tobytes()).decode('ascii')
+
+
+class LegacyState:
+    """Lo que guardaban antes el consumidor y `TwilioMediaStream` por conexión."""
+
+    def __init__(self, start):
+        self.is_streaming = True
+        self.stream_audio = False
+        self.client_id = str(id(self))
+        self.framing = 'twilio'
+        self.stream_sid = start.get('streamSid')
+        self.call_sid = start.get('callSid')
+        self.account_sid = start.get('accountSid')
+        self.media_format = start.get('mediaFormat', {})
+        self.custom_parameters = start.get('customParameters', {})
+        self.inbound = PCMRingBuffer(SAMPLE_RATE * 10)
+        self.last_sequence = None
+        self.frames = 0
+        self.lost_frames = 0
+        self.vad = EnergyVAD()
+        self.marks = MarkTracker()
+        self._received_at = 0.0
+        self._turn_ended_at = None
+
+
+def _start(i):
+    return {
+        'streamSid': f'MZ{i:032x}',
+        'callSid': f'CA{i:032x}',
+        'accountSid': 'AC' + '0' * 32,
+        'mediaFormat': {'encoding': 'audio/x-mulaw', 'sampleRate': SAMPLE_RATE, 'channels': 1},
+        'customParameters': {},
+    }
+
+
+def measure(build, count):
+    starts = [_start(i) for i in range(count)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build(i, start) for i, start in enumerate(starts)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, default=5000)
+    parser.add_argument('--buffer-seconds', type=int, default=2, help='TWILIO_INBOUND_BUFFER_SECONDS')
+    parser.add_argument('--budget-mb', type=float, default=256, help='memoria para estimar sesiones por worker')
+    args = parser.parse_args()
+
+    registry = SessionRegistry()
+
+    def idle(i, start):
+        session = CallSession(str(i), buffer_seconds=args.buffer_seconds)
+        session.start_twilio(start, vad=EnergyVAD())
+        registry.add(session)
+        registry.index(session)
+        return session
+
+    def active(i, start):
+        session = idle(i, start)
+        session.receive_media(PAYLOAD, 1)
+        return session
+
+    def legacy(i, start):
+        return LegacyState(start)
+
+    budget = args.budget_mb * 1024 * 1024
+    for name, build in (('idle', idle), ('active', active), ('legacy', legacy)):
+        per_session = measure(build, args.sessions)
+        registry = SessionRegistry()
+        print(f"{name:>7}: {per_session / 1024:8.1f} KB por sesión -> "
+              f"~{budget / per_session:8.0f} sesiones en {args.budget_mb:.0f} MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""
+Micro-benchmark del transcodificador en memoria (`audio_streaming/transcode.py`).
+
+Convierte varios segundos de voz sintética desde cada formato que puede
+entregar un proveedor TTS a μ-law 8 kHz para Twilio, fragmento a fragmento
+como llega del proveedor, y mide el tiempo de CPU por segundo de audio y el
+factor de tiempo real (segundos de audio convertidos por segundo de CPU).
+`--whole` añade, como referencia, la conversión de todo el audio de una vez.
+
+Uso:
+    python -m benchmarks.transcode --seconds 10 --repeat 20 --chunk-bytes 4096
+"""
+
+import argparse
+import io
+import time
+import wave
+
+import numpy as np
+
+from audio_streaming.transcode import Transcoder
+from audio_streaming.twilio_media import encode_pcm
+
+SOURCES = ('ulaw_8000', 'pcm_8000', 'pcm_16000', 'pcm_22050', 'pcm_24000', 'pcm_44100', 'wav_22050')
+
+
+def _voice(rate, seconds):
+    # Tono con armónicos y envolvente silábica: no es voz, pero tiene su espectro
+    t = np.arange(int(rate * seconds)) / rate
+    tone = sum(np.sin(2 * np.pi * 140 * k * t) / k for k in range(1, 12))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+    return (6000 * tone * envelope / 3).astype(np.int16)
+
+
+def _audio(source, seconds):
+    encoding, _, rate = source.partition('_')
+    samples = _voice(int(rate), seconds)
+    if encoding == 'ulaw':
+        return 'ulaw_8000', encode_pcm(samples)
+    if encoding == 'pcm':
+        return source, samples.astype('<i2').tobytes()
+    out = io.BytesIO()
+    with wave.open(out, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(int(rate))
+        wav.writeframes(samples.astype('<i2').tobytes())
+    return 'wav', out.getvalue()
+
+
+def streamed(source_format, chunks):
+    transcoder = Transcoder(source_format, 'ulaw_8000')
+    size = sum(len(transcoder.feed(chunk)) for chunk in chunks)
+    return size + len(transcoder.flush())
+
+
+def whole(source_format, chunks):
+    transcoder = Transcoder(source_format, 'ulaw_8000')
+    return len(transcoder.feed(b''.join(chunks))) + len(transcoder.flush())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=10.0, help='segundos de audio por conversión')
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--chunk-bytes', type=int, default=4096, help='tamaño de los fragmentos del proveedor')
+    parser.add_argument('--whole', action='store_true', help='medir también la conversión del audio completo')
+    args = parser.parse_args()
+
+    modes = [('stream', streamed)] + ([('whole', whole)] if args.whole else [])
+    print(f"{args.seconds:.0f} s de audio x {args.repeat}, fragmentos de {args.chunk_bytes} bytes -> μ-law 8 kHz")
+    for source in SOURCES:
+        source_format, audio = _audio(source, args.seconds)
+        chunks = [audio[i:i + args.chunk_bytes] for i in range(0, len(audio), args.chunk_bytes)]
+        for mode, func in modes:
+            size = func(source_format, chunks)
+            started = time.process_time()
+            for _ in range(args.repeat):
+                func(source_format, chunks)
+            cpu = (time.process_time() - started) / args.repeat
+            print(f"{source:>10} {mode:>6}: {cpu / args.seconds * 1000:7.3f} ms de CPU por segundo de audio, "
+                  f"{args.seconds / cpu:8.0f}x tiempo real ({size / 8000:.2f} s de salida)")
+
+
+if __name__ == '__main__':
+    main()
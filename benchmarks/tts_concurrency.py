@@ -0,0 +1,60 @@
+"""
+Benchmark de throughput de síntesis con muchas conexiones concurrentes.
+
+Simula N consumidores que piden audio al proveedor simulado (`StubProvider`,
+bloqueante) con una latencia fija y compara la llamada directa en el event loop (comportamiento
+anterior) contra `TTSEngine`.
+
+Uso:
+    python -m benchmarks.tts_concurrency --connections 50 --requests 4 --latency-ms 300
+"""
+
+import argparse
+import asyncio
+import time
+
+from audio_streaming.providers import StubProvider
+from audio_streaming.tts import TTSEngine
+
+
+async def _blocking_consumer(provider, requests):
+    for _ in range(requests):
+        provider.synthesize('hola')
+
+
+async def _engine_consumer(engine, provider, requests):
+    for _ in range(requests):
+        await engine.synthesize(provider, 'hola')
+
+
+async def run(mode, connections, requests, latency, concurrency):
+    provider = StubProvider(latency=latency)
+    engine = TTSEngine(max_concurrency=concurrency)
+    start = time.perf_counter()
+    if mode == 'blocking':
+        tasks = [_blocking_consumer(provider, requests) for _ in range(connections)]
+    else:
+        tasks = [_engine_consumer(engine, provider, requests) for _ in range(connections)]
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    engine.shutdown()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--connections', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=4, help='síntesis por conexión')
+    parser.add_argument('--latency-ms', type=float, default=300.0)
+    parser.add_argument('--concurrency', type=int, default=16, help='TTS_MAX_CONCURRENCY')
+    args = parser.parse_args()
+
+    total = args.connections * args.requests
+    latency = args.latency_ms / 1000.0
+    for mode in ('blocking', 'engine'):
+        elapsed = asyncio.run(run(mode, args.connections, args.requests, latency, args.concurrency))
+        print(f"{mode:>8}: {total} síntesis en {elapsed:6.2f}s -> {total / elapsed:8.1f} síntesis/s")
+
+
+if __name__ == '__main__':
+    main()
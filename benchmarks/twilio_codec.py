@@ -0,0 +1,62 @@
+"""
+Benchmark del códec de Twilio Media Streams.
+
+Mide cuántas tramas de 20 ms por segundo y núcleo se pueden decodificar
+(base64 -> μ-law -> búfer circular PCM) y codificar (PCM -> μ-law), y cuántas
+llamadas a 50 tramas/s representa eso.
+
+Uso:
+    python -m benchmarks.twilio_codec --frames 200000
+"""
+
+import argparse
+import base64
+import time
+
+import numpy as np
+
+from audio_streaming.sessions import CallSession
+from audio_streaming.twilio_media import FRAME_SAMPLES, encode_pcm
+
+FRAMES_PER_SECOND = 50
+
+
+def bench_decode(frames):
+    stream = CallSession('bench', buffer_seconds=10)
+    stream.start_twilio({'streamSid': 'MZbench', 'callSid': 'CAbench'}, vad=None)
+    rng = np.random.default_rng(0)
+    payloads = [
+        base64.b64encode(rng.integers(0, 256, FRAME_SAMPLES, dtype=np.uint8).tobytes()).decode('ascii')
+        for _ in range(64)
+    ]
+    start = time.perf_counter()
+    for i in range(frames):
+        stream.receive_media(payloads[i & 63], i + 2)
+    return time.perf_counter() - start
+
+
+def bench_encode(frames):
+    rng = np.random.default_rng(0)
+    pcm = rng.integers(-32768, 32767, FRAME_SAMPLES, dtype=np.int16)
+    start = time.perf_counter()
+    for _ in range(frames):
+        encode_pcm(pcm)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=200000)
+    args = parser.parse_args()
+
+    for name, bench in (('decode', bench_decode), ('encode', bench_encode)):
+        elapsed = bench(args.frames)
+        rate = args.frames / elapsed
+        print(
+            f"{name}: {elapsed / args.frames * 1e6:6.2f} µs/trama, {rate:10.0f} tramas/s "
+            f"-> ~{rate / FRAMES_PER_SECOND:6.0f} llamadas por núcleo"
+        )
+
+
+if __name__ == '__main__':
+    main()
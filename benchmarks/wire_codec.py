@@ -0,0 +1,87 @@
+"""
+Micro-benchmark del códec de mensajes del WebSocket (`audio_streaming/wire.py`).
+
+Genera las tramas `media` de Twilio de `--streams` llamadas simultáneas
+(20 ms de μ-law en base64 cada una, intercaladas como las recibe un worker)
+y mide el tiempo de CPU por trama al leerlas con cada backend JSON
+disponible, con y sin la vía rápida de las tramas `media`. También mide la
+codificación de un mensaje de control (`clear`), que es lo que pasa por
+`send_json`. `--with-audio` suma la decodificación del audio dentro de la
+sesión (base64, μ-law y búfer circular) para ver qué parte del coste
+total de una trama es el JSON.
+
+Uso:
+    python -m benchmarks.wire_codec --streams 500 --seconds 2 --with-audio
+"""
+
+import argparse
+import base64
+import os
+import time
+
+from audio_streaming.sessions import CallSession
+from audio_streaming.twilio_media import FRAME_MS, FRAME_SAMPLES
+from audio_streaming.wire import BACKENDS, MessageCodec
+
+FRAMES_PER_SECOND = 1000 // FRAME_MS
+
+
+def _media(stream_sid, sequence):
+    payload = base64.b64encode(os.urandom(FRAME_SAMPLES)).decode('ascii')
+    # Mismo orden de campos que envía Twilio
+    return (f'{{"event":"media","sequenceNumber":"{sequence}","media":{{"track":"inbound",'
+            f'"chunk":"{sequence}","timestamp":"{sequence * FRAME_MS}","payload":"{payload}"}},'
+            f'"streamSid":"{stream_sid}"}}')
+
+
+def _backends():
+    for name, backend in BACKENDS.items():
+        try:
+            yield backend()
+        except ImportError:
+            print(f"{name:>8}: no instalado, se omite")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--streams', type=int, default=500, help='llamadas simultáneas')
+    parser.add_argument('--seconds', type=float, default=2.0, help='segundos de audio por llamada')
+    parser.add_argument('--with-audio', action='store_true', help='decodificar también el audio en la sesión')
+    args = parser.parse_args()
+
+    sids = [f'MZ{i:032x}' for i in range(args.streams)]
+    per_stream = int(args.seconds * FRAMES_PER_SECOND)
+    frames = [(sid, _media(sid, sequence)) for sequence in range(2, per_stream + 2) for sid in sids]
+    rate = args.streams * FRAMES_PER_SECOND
+    control = {'event': 'clear', 'streamSid': sids[0]}
+    print(f"{args.streams} llamadas x {per_stream} tramas = {len(frames)} mensajes ({rate} tramas/s en producción)")
+
+    for backend in _backends():
+        for fast_path in (False, True):
+            codec = MessageCodec(backend, media_fast_path=fast_path)
+            sessions = {}
+            if args.with_audio:
+                for sid in sids:
+                    sessions[sid] = CallSession(sid)
+                    sessions[sid].start_twilio({'streamSid': sid}, vad=None)
+
+            started = time.process_time()
+            for sid, text in frames:
+                message = codec.decode(text)
+                if args.with_audio:
+                    # En el consumidor la sesión es la de la conexión, no hace falta leer el streamSid
+                    sessions[sid].receive_media(message['media']['payload'], message['sequenceNumber'])
+            per_frame = (time.process_time() - started) / len(frames)
+
+            started = time.process_time()
+            for _ in range(len(frames)):
+                codec.encode(control)
+            per_encode = (time.process_time() - started) / len(frames)
+
+            print(f"{codec.name:>14}: {per_frame * 1e6:6.2f} µs por trama "
+                  f"({per_frame * rate * 100:5.1f} % de un núcleo a {rate} tramas/s), "
+                  f"encode {per_encode * 1e6:5.2f} µs")
+
+
+if __name__ == '__main__':
+    main()
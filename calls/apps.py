@@ -1,6 +1,17 @@
+import asyncio
+
 from django.apps import AppConfig
 
 
 class CallsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "calls"
+
+    def ready(self):
+        from audio_streaming import lifespan
+        from .state_cache import get_call_state_cache
+
+        @lifespan.on_shutdown
+        async def flush_call_state():
+            # Escribe los cambios de estado que aún estaban acumulados
+            await asyncio.to_thread(get_call_state_cache().close)
@@ -0,0 +1,30 @@
+# Generated by Django 5.0.1 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("calls", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="call",
+            options={"ordering": ["-created_at", "-id"]},
+        ),
+        migrations.AddIndex(
+            model_name="call",
+            index=models.Index(
+                fields=["-created_at", "-id"], name="call_created_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="call",
+            index=models.Index(
+                fields=["status", "-created_at", "-id"],
+                name="call_status_created_id_idx",
+            ),
+        ),
+    ]
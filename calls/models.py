@@ -13,4 +13,10 @@ class Call(models.Model):
         return f"Call {self.call_sid} from {self.from_number} to {self.to_number}"
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Listado paginado por cursor: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='call_created_id_idx'),
+            # Mismo listado filtrando por estado
+            models.Index(fields=['status', '-created_at', '-id'], name='call_status_created_id_idx'),
+        ]
@@ -0,0 +1,43 @@
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+
+def encode_cursor(created_at, pk):
+    """Cursor opaco con la posición (created_at, id) de la última fila entregada."""
+    raw = f"{created_at.isoformat()}|{pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Devuelve (created_at, id); lanza ValueError si el cursor no es válido."""
+    try:
+        created_at, pk = base64.urlsafe_b64decode(cursor.encode('ascii')).decode().split('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except ValueError as e:
+        raise ValueError(f'Cursor inválido: {cursor}') from e
+
+
+def keyset_page(queryset, fields, cursor=None, limit=50):
+    """
+    Página de `queryset` ordenada por (-created_at, -id) usando keyset pagination.
+
+    En lugar de OFFSET, cada página filtra las filas anteriores al cursor, así
+    que el coste no crece con la profundidad y lo resuelve el índice
+    (created_at, id). Las filas salen como diccionarios con `values(*fields)`;
+    `fields` debe incluir `id` y `created_at`.
+    Devuelve (filas, cursor de la página siguiente o None).
+    """
+    queryset = queryset.order_by('-created_at', '-id')
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        # (created_at, id) < cursor; el `created_at <= ...` suelto deja al motor recorrer el índice por rango
+        queryset = queryset.filter(created_at__lte=created_at).filter(Q(created_at__lt=created_at) | Q(id__lt=pk))
+
+    # Se pide una fila de más para saber si hay página siguiente
+    rows = list(queryset.values(*fields)[:limit + 1])
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
@@ -0,0 +1,271 @@
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+# Estados finales de Twilio: se escriben en la base de datos sin esperar
+TERMINAL_STATUSES = frozenset(('completed', 'busy', 'failed', 'no-answer', 'canceled'))
+
+# Campos que las actualizaciones de estado pueden acumular en memoria
+COALESCED_FIELDS = frozenset(('status', 'duration'))
+
+_timestamp = serializers.DateTimeField()
+
+
+def _redis_client(url):
+    if url.startswith('fakeredis://'):
+        import fakeredis
+
+        return fakeredis.FakeRedis()
+    import redis
+
+    return redis.Redis.from_url(url)
+
+
+class CallStateCache:
+    """
+    Estado de las llamadas por `call_sid` sin ir a la base de datos en cada petición.
+
+    Las lecturas se sirven de una LRU en memoria o, si hay `redis_url`, de un
+    nivel Redis compartido por los workers (con la LRU como respaldo). Las
+    entradas de la LRU caducan a los `ttl` segundos: sin Redis, es lo que
+    tarda un worker en ver lo que escribió otro. Las actualizaciones de
+    `status` y `duration` se aplican al momento en la caché (write-through) y
+    se acumulan como pendientes: un hilo las escribe cada `flush_interval`
+    segundos, con una sola consulta por llamada aunque hayan llegado varias.
+    Los estados finales se escriben en el acto y ya no cambian.
+    """
+
+    def __init__(self, max_entries=10000, flush_interval=1.0, redis_url='', redis_ttl=3600, ttl=5.0):
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.ttl = ttl
+        self.redis_ttl = redis_ttl
+        self._redis = _redis_client(redis_url) if redis_url else None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = {}
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._closed = False
+        self.hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.db_writes = 0
+
+    def get(self, call_sid):
+        """Representación de la llamada (como `CallSerializer`) o None si no existe."""
+        # Con Redis manda lo compartido: otro worker puede haber actualizado la llamada
+        data = self._redis_get(call_sid)
+        if data is not None:
+            self.redis_hits += 1
+            self._remember(call_sid, data)
+            return dict(data)
+
+        with self._lock:
+            entry = self._entries.get(call_sid)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(call_sid)
+                self.hits += 1
+                return dict(entry[0])
+
+        self.misses += 1
+        data = self._load(call_sid)
+        if data is None:
+            return None
+        with self._lock:
+            # Lo pendiente aún no está en la base de datos pero es más nuevo
+            data.update(self._dirty.get(call_sid, {}))
+        self._remember(call_sid, data)
+        self._redis_set(call_sid, data)
+        return dict(data)
+
+    def put(self, call_sid, data):
+        """
+        Guarda la representación ya persistida de una llamada. Los cambios
+        pendientes que tuviera son anteriores y se descartan: escribirlos
+        después pisaría la fila nueva.
+        """
+        data = dict(data)
+        with self._lock:
+            self._dirty.pop(call_sid, None)
+        self._remember(call_sid, data)
+        self._redis_set(call_sid, data)
+
+    def invalidate(self, call_sid):
+        """Olvida la llamada; la siguiente lectura va a la base de datos."""
+        with self._lock:
+            self._entries.pop(call_sid, None)
+        if self._redis is not None:
+            try:
+                self._redis.delete(self._redis_key(call_sid))
+            except Exception as e:
+                logger.warning(f"⚠️ Redis no disponible para el estado de llamadas: {str(e)}")
+
+    def update(self, call_sid, changes):
+        """
+        Aplica `changes` (solo campos de COALESCED_FIELDS, ya validados) y
+        devuelve la representación nueva, o None si la llamada no existe.
+        """
+        data = self.get(call_sid)
+        if data is None:
+            return None
+        changes = dict(changes)
+        if data.get('status') in TERMINAL_STATUSES and changes.get('status', data['status']) != data['status']:
+            # Un callback atrasado no reabre una llamada terminada (igual que en `_write`)
+            logger.info(f"⏭️ Llamada {call_sid} ya en estado final {data['status']}: se ignora '{changes['status']}'")
+            del changes['status']
+        data.update(changes)
+        data['updated_at'] = _timestamp.to_representation(timezone.now())
+        self._remember(call_sid, data)
+        self._redis_set(call_sid, data)
+
+        with self._lock:
+            if call_sid in self._dirty:
+                self.coalesced += 1
+            self._dirty.setdefault(call_sid, {}).update(changes)
+            terminal = data.get('status') in TERMINAL_STATUSES
+        if terminal:
+            self._write(call_sid)
+            # Si la base de datos rechazó el estado, la caché se invalidó: se devuelve lo guardado
+            data = self.get(call_sid) or data
+        else:
+            self._ensure_started()
+        return data
+
+    def flush(self, call_sid=None):
+        """Escribe las actualizaciones pendientes (todas o las de `call_sid`). Devuelve cuántas llamadas se escribieron."""
+        if call_sid is not None:
+            return self._write(call_sid)
+        with self._lock:
+            call_sids = list(self._dirty)
+        return sum(self._write(call_sid) for call_sid in call_sids)
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'pending': len(self._dirty),
+            'hits': self.hits,
+            'redis_hits': self.redis_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'db_writes': self.db_writes,
+        }
+
+    def _remember(self, call_sid, data):
+        with self._lock:
+            self._entries[call_sid] = (data, time.monotonic() + self.ttl)
+            self._entries.move_to_end(call_sid)
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                if oldest in self._dirty:
+                    # No se pierde nada: lo pendiente sigue en `_dirty` hasta escribirse
+                    logger.debug(f"🧹 Llamada {oldest} expulsada de la caché con cambios pendientes")
+
+    def _write(self, call_sid):
+        from .models import Call
+
+        with self._lock:
+            changes = self._dirty.pop(call_sid, None)
+        if not changes:
+            return 0
+        try:
+            calls = Call.objects.filter(call_sid=call_sid)
+            now = timezone.now()
+            if 'status' not in changes:
+                calls.update(updated_at=now, **changes)
+            elif not calls.exclude(status__in=TERMINAL_STATUSES).update(updated_at=now, **changes):
+                # Ya hay un estado final (quizá de otro worker): ese no se pisa, el resto de campos sí
+                others = {field: value for field, value in changes.items() if field != 'status'}
+                if others:
+                    calls.update(updated_at=now, **others)
+                # La caché tiene un estado que no llegó a la base de datos
+                self.invalidate(call_sid)
+            self.db_writes += 1
+            return 1
+        except Exception as e:
+            logger.error(f"❌ Error guardando el estado de la llamada {call_sid}: {str(e)}")
+            with self._lock:
+                # Se reintenta en el siguiente ciclo; lo llegado mientras tanto es más nuevo
+                self._dirty[call_sid] = {**changes, **self._dirty.get(call_sid, {})}
+            self._ensure_started()
+            return 0
+
+    def _ensure_started(self):
+        if self._thread is None and not self._closed:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='call-state-flush', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            if self._closed:
+                break
+            self.flush()
+            # El hilo tiene su propia conexión a la base de datos
+            close_old_connections()
+
+    @staticmethod
+    def _load(call_sid):
+        from .models import Call
+        from .serializers import CallSerializer
+
+        call = Call.objects.filter(call_sid=call_sid).first()
+        return dict(CallSerializer(call).data) if call else None
+
+    def _redis_key(self, call_sid):
+        return f'call_state:{call_sid}'
+
+    def _redis_get(self, call_sid):
+        if self._redis is None:
+            return None
+        try:
+            raw = self._redis.get(self._redis_key(call_sid))
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            logger.warning(f"⚠️ Redis no disponible para el estado de llamadas: {str(e)}")
+            return None
+
+    def _redis_set(self, call_sid, data):
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(self._redis_key(call_sid), json.dumps(data), ex=self.redis_ttl)
+        except Exception as e:
+            logger.warning(f"⚠️ Redis no disponible para el estado de llamadas: {str(e)}")
+
+
+_cache = None
+
+
+def get_call_state_cache():
+    """Devuelve la caché de estado de llamadas compartida por el proceso."""
+    global _cache
+    if _cache is None:
+        _cache = CallStateCache(
+            max_entries=settings.CALL_STATE_CACHE_MAX_ENTRIES,
+            flush_interval=settings.CALL_STATE_FLUSH_INTERVAL,
+            redis_url=settings.CALL_STATE_REDIS_URL,
+            redis_ttl=settings.CALL_STATE_REDIS_TTL,
+            ttl=settings.CALL_STATE_CACHE_TTL,
+        )
+    return _cache
@@ -1,3 +1,305 @@
-from django.test import TestCase
+import asyncio
+import base64
+import importlib.util
+import json
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.testing import WebsocketCommunicator
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from audio_streaming.admission import AdmissionController
+from audio_streaming.consumers import AudioStreamConsumer
+
+from .models import Call
+from .pagination import decode_cursor, encode_cursor
+from .state_cache import CallStateCache
+
+
+class CallStateCacheTests(TestCase):
+    def setUp(self):
+        # Sin hilo de escritura: los tests llaman a `flush` cuando toca
+        patcher = mock.patch.object(CallStateCache, '_ensure_started')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = CallStateCache(flush_interval=60, ttl=60)
+        Call.objects.create(call_sid='CA1', from_number='+1', to_number='+2', status='ringing')
+
+    def db(self, call_sid='CA1'):
+        return Call.objects.values_list('status', 'duration').get(call_sid=call_sid)
+
+    def test_get_missing_call(self):
+        self.assertIsNone(self.cache.get('CAnope'))
+        self.assertIsNone(self.cache.update('CAnope', {'status': 'completed'}))
+
+    def test_updates_are_coalesced_until_flush(self):
+        self.cache.update('CA1', {'status': 'in-progress'})
+        data = self.cache.update('CA1', {'duration': 4})
+
+        self.assertEqual((data['status'], data['duration']), ('in-progress', 4))
+        self.assertEqual(self.cache.get('CA1')['status'], 'in-progress')
+        self.assertEqual(self.db(), ('ringing', 0))
+        self.assertEqual(self.cache.stats()['coalesced'], 1)
+
+        self.assertEqual(self.cache.flush(), 1)
+        self.assertEqual(self.db(), ('in-progress', 4))
+        self.assertEqual(self.cache.stats()['pending'], 0)
+        self.assertEqual(self.cache.stats()['db_writes'], 1)
+
+    def test_terminal_status_is_written_at_once(self):
+        self.cache.update('CA1', {'status': 'completed', 'duration': 12})
+        self.assertEqual(self.db(), ('completed', 12))
+        self.assertEqual(self.cache.stats()['pending'], 0)
+
+    def test_late_status_does_not_reopen_a_terminal_call(self):
+        self.cache.update('CA1', {'status': 'completed', 'duration': 12})
+
+        data = self.cache.update('CA1', {'status': 'in-progress'})
+        self.cache.flush()
+        self.assertEqual(data['status'], 'completed')
+        self.assertEqual(self.cache.get('CA1')['status'], 'completed')
+        self.assertEqual(self.db(), ('completed', 12))
+
+    def test_duration_is_saved_after_terminal_status(self):
+        self.cache.update('CA1', {'status': 'completed', 'duration': 12})
+
+        data = self.cache.update('CA1', {'duration': 13})
+        self.assertEqual(data['duration'], 13)
+        self.assertEqual(self.cache.get('CA1')['duration'], 13)
+        self.assertEqual(self.db(), ('completed', 13))
+
+    def test_status_rejected_by_database_invalidates_the_cache(self):
+        self.cache.get('CA1')
+        # Otro worker ya escribió un estado final
+        Call.objects.filter(call_sid='CA1').update(status='busy')
+
+        self.cache.update('CA1', {'status': 'in-progress', 'duration': 3})
+        self.cache.flush()
+        self.assertEqual(self.db(), ('busy', 3))
+        self.assertEqual(self.cache.get('CA1')['status'], 'busy')
+
+    def test_failed_write_keeps_changes_pending(self):
+        self.cache.update('CA1', {'status': 'in-progress', 'duration': 1})
+        with mock.patch.object(Call.objects, 'filter', side_effect=RuntimeError('db down')):
+            self.assertEqual(self.cache.flush(), 0)
+        self.assertEqual(self.cache.stats()['pending'], 1)
+
+        # Lo que llega después es más nuevo y gana
+        self.cache.update('CA1', {'duration': 2})
+        self.assertEqual(self.cache.flush(), 1)
+        self.assertEqual(self.db(), ('in-progress', 2))
+
+    def test_evicted_entry_keeps_pending_changes(self):
+        cache = CallStateCache(max_entries=1, flush_interval=60, ttl=60)
+        Call.objects.create(call_sid='CA2', from_number='+1', to_number='+2', status='ringing')
+        cache.update('CA1', {'status': 'in-progress'})
+        cache.get('CA2')
+        self.assertEqual(cache.get('CA1')['status'], 'in-progress')
+
+    def test_entries_expire(self):
+        cache = CallStateCache(flush_interval=60, ttl=0)
+        cache.get('CA1')
+        Call.objects.filter(call_sid='CA1').update(duration=9)
+        self.assertEqual(cache.get('CA1')['duration'], 9)
+
+
+@override_settings(TWILIO_STREAM_URL='', VOICE_BUSY_MESSAGE='Ocupado', TWILIO_SAY_LANGUAGE='es-ES')
+class HandleCallTests(TestCase):
+    def setUp(self):
+        self.admission = AdmissionController(max_sessions=1)
+        patcher = mock.patch('calls.views.get_admission', return_value=self.admission)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def call(self, call_sid='CA1'):
+        return self.client.post('/twilio/stream/', {'CallSid': call_sid, 'From': '+1', 'To': '+2'})
+
+    def test_connects_the_stream_and_reserves_a_slot(self):
+        response = self.call()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/xml')
+        self.assertIn(b'<Connect><Stream url="wss://testserver/ws/audio/stream/" /></Connect>', response.content)
+        self.assertNotIn(b'<Say', response.content)
+        call = Call.objects.get(call_sid='CA1')
+        self.assertEqual((call.from_number, call.to_number, call.status), ('+1', '+2', 'received'))
+        self.assertEqual(self.admission.reserved, 1)
+
+    def test_busy_when_the_reserved_slots_are_taken(self):
+        self.call('CA1')
+        response = self.call('CA2')
+        self.assertIn(b'<Say language="es-ES">Ocupado</Say><Hangup />', response.content)
+        self.assertNotIn(b'<Connect', response.content)
+        self.assertEqual(Call.objects.get(call_sid='CA2').status, 'busy')
+        self.assertEqual(self.admission.reserved, 1)
+
+    def test_retry_does_not_reset_a_live_call(self):
+        self.call()
+        Call.objects.filter(call_sid='CA1').update(status='in-progress')
+        self.assertIn(b'<Connect>', self.call().content)
+        self.assertEqual(Call.objects.get(call_sid='CA1').status, 'in-progress')
+        self.assertEqual(Call.objects.count(), 1)
+
+    def test_incomplete_data(self):
+        response = self.client.post('/twilio/stream/', {'CallSid': 'CA1'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Call.objects.exists())
+
+
+class CallDetailTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(CallStateCache, '_ensure_started')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache = CallStateCache(flush_interval=60, ttl=60)
+        patcher = mock.patch('calls.views.get_call_state_cache', return_value=self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        Call.objects.create(call_sid='CA1', from_number='+1', to_number='+2', status='ringing')
+
+    def test_status_update_is_served_from_the_cache(self):
+        response = self.client.put('/calls/CA1/', {'status': 'in-progress'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/calls/CA1/').json()['status'], 'in-progress')
+        self.assertEqual(Call.objects.get(call_sid='CA1').status, 'ringing')
+
+    def test_direct_write_is_not_overwritten_by_pending_changes(self):
+        self.client.put('/calls/CA1/', {'duration': 5}, format='json')
+        response = self.client.put('/calls/CA1/', {'duration': 7, 'to_number': '+3'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.cache.flush()
+        call = Call.objects.get(call_sid='CA1')
+        self.assertEqual((call.duration, call.to_number), (7, '+3'))
+        self.assertEqual(self.client.get('/calls/CA1/').json()['duration'], 7)
+
+    def test_invalid_update(self):
+        response = self.client.put('/calls/CA1/', {'duration': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class CallListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        now = timezone.now()
+        # Siete llamadas, tres de ellas con el mismo `created_at`: el `id` desempata
+        for i, offset in enumerate((0, 1, 1, 1, 2, 3, 4)):
+            call = Call.objects.create(call_sid=f'CA{i}', from_number='+1', to_number='+2',
+                                       status='completed' if i % 2 else 'ringing')
+            Call.objects.filter(pk=call.pk).update(created_at=now - timedelta(seconds=offset))
+
+    def pages(self, **params):
+        sids, cursor = [], None
+        while True:
+            response = self.client.get('/calls/', {**params, **({'cursor': cursor} if cursor else {})})
+            self.assertEqual(response.status_code, 200)
+            sids.append([row['call_sid'] for row in response.json()['results']])
+            cursor = response.json()['next']
+            if cursor is None:
+                return sids
+
+    def test_pages_follow_the_full_order_without_gaps(self):
+        expected = list(Call.objects.order_by('-created_at', '-id').values_list('call_sid', flat=True))
+        pages = self.pages(limit=2)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual(sum(pages, []), expected)
+
+    def test_filter_by_status(self):
+        pages = self.pages(limit=2, status='completed')
+        self.assertEqual(sorted(sum(pages, [])), ['CA1', 'CA3', 'CA5'])
+
+    def test_last_page_has_no_cursor(self):
+        response = self.client.get('/calls/', {'limit': 7})
+        self.assertEqual(len(response.json()['results']), 7)
+        self.assertIsNone(response.json()['next'])
+
+    def test_cursor_round_trip(self):
+        created_at = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 42)), (created_at, 42))
+
+    def test_bad_cursor_or_limit(self):
+        bad_cursors = ('nada', base64.urlsafe_b64encode(b'2024-01-01|x').decode(), 'ñ')
+        for cursor in bad_cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/calls/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Cursor inválido', response.json()['error'])
+        for limit in ('0', 'muchas'):
+            with self.subTest(limit=limit):
+                self.assertEqual(self.client.get('/calls/', {'limit': limit}).status_code, 400)
+
+
+@override_settings(ADMIN_API_TOKEN='secreto', CALL_TRANSFER_ALLOWLIST=['+34900000000'])
+class CallControlTests(SimpleTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        patcher = mock.patch('calls.views.get_channel_layer')
+        self.layer = patcher.start().return_value
+        self.layer.group_send = mock.AsyncMock()
+        self.addCleanup(patcher.stop)
+
+    def post(self, data, token='secreto'):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.post('/calls/CA1/control/', data, format='json', **headers)
+
+    def test_requires_admin(self):
+        self.assertEqual(self.post({'action': 'hangup'}, token=None).status_code, 403)
+        self.assertEqual(self.post({'action': 'hangup'}, token='otro').status_code, 403)
+        self.layer.group_send.assert_not_called()
+
+    def test_sends_the_order_to_the_call_group(self):
+        response = self.post({'action': 'say', 'text': 'Hola'})
+        self.assertEqual(response.status_code, 202)
+        self.layer.group_send.assert_awaited_once_with(
+            'call.CA1', {'type': 'call.control', 'action': 'say', 'text': 'Hola'}
+        )
+
+    def test_transfer_only_to_allowed_numbers(self):
+        response = self.post({'action': 'transfer', 'to': '+44700000000'})
+        self.assertEqual(response.status_code, 403)
+        self.layer.group_send.assert_not_called()
+
+        response = self.post({'action': 'transfer', 'to': '+34900000000'})
+        self.assertEqual(response.status_code, 202)
+
+    def test_invalid_orders(self):
+        self.assertEqual(self.post({'action': 'reboot'}).status_code, 400)
+        self.assertEqual(self.post({'action': 'say'}).status_code, 400)
+
+
+@skipUnless(importlib.util.find_spec('fakeredis'), 'requiere fakeredis[lua]')
+@override_settings(
+    ADMIN_API_TOKEN='secreto',
+    TTS_PROVIDER='stub',
+    PROMPTS_ENABLED=False,
+    CHANNEL_LAYERS={'default': {'BACKEND': 'audio_streaming.layers.FakeRedisChannelLayer'}},
+)
+class CallControlGroupTests(SimpleTestCase):
+    """La orden viaja por el grupo de la llamada en una capa Redis (simulada) hasta el consumidor."""
+
+    @mock.patch.object(AudioStreamConsumer, '_save_audio_log', mock.AsyncMock())
+    async def test_hangup_reaches_the_consumer(self):
+        communicator = WebsocketCommunicator(AudioStreamConsumer.as_asgi(), '/ws/audio/stream/')
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        await communicator.receive_json_from()  # connection_established
+        await communicator.send_json_to({
+            'event': 'start', 'streamSid': 'MZ1', 'start': {'streamSid': 'MZ1', 'callSid': 'CA1'},
+        })
+        # El saludo empieza a sonar: el consumidor ya está en el grupo `call.CA1`
+        self.assertEqual(json.loads((await communicator.receive_output(5))['text'])['event'], 'media')
+
+        response = await sync_to_async(APIClient().post)(
+            '/calls/CA1/control/', {'action': 'hangup'}, format='json', HTTP_AUTHORIZATION='Bearer secreto'
+        )
+        self.assertEqual(response.status_code, 202)
+
+        async def closed():
+            while (await communicator.receive_output(5))['type'] != 'websocket.close':
+                pass
+
+        await asyncio.wait_for(closed(), 5)
+        await communicator.wait()
@@ -1,6 +1,10 @@
 from django.urls import path
+from . import views
 
 
 urlpatterns = [
-    
-]
\ No newline at end of file
+    path('twilio/stream/', views.handle_call, name='handle_call'),
+    path('calls/', views.call_list, name='call_list'),
+    path('calls/<str:call_sid>/', views.call_detail, name='call_detail'),
+    path('calls/<str:call_sid>/control/', views.call_control, name='call_control'),
+]
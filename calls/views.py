@@ -1,79 +1,187 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
-from twilio.twiml.voice_response import VoiceResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_POST
+from twilio.twiml.voice_response import Connect, VoiceResponse
 from .models import Call
+from .pagination import keyset_page
+from .state_cache import COALESCED_FIELDS, get_call_state_cache
 from .serializers import CallSerializer
 from django.shortcuts import get_object_or_404
+from django.conf import settings
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from audio_streaming.access import IsAdmin
+from audio_streaming.admission import get_admission
+from audio_streaming.layers import CONTROL_ACTIONS, CONTROL_SAY, CONTROL_TRANSFER, call_group, control_message
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _stream_url(request):
+    """URL wss:// del consumidor de audio al que Twilio conectará el stream."""
+    if settings.TWILIO_STREAM_URL:
+        return settings.TWILIO_STREAM_URL
+    return f"wss://{request.get_host()}{settings.WEBSOCKET_URL}"
+
+
+async def _save_call(call_data):
+    try:
+        # Twilio puede reintentar el webhook: la misma llamada no debe fallar por duplicada
+        # ni volver a `received` si ya está en curso
+        call_sid = call_data.pop('call_sid')
+        _, created = await Call.objects.aget_or_create(call_sid=call_sid, defaults=call_data)
+        if created:
+            logger.info(f"✅ Llamada registrada: {call_sid}")
+    except Exception as e:
+        logger.warning(f"⚠️ Error guardando llamada: {str(e)}")
+
+
 @csrf_exempt
-@api_view(['POST'])
-def handle_call(request):
+@require_POST
+async def handle_call(request):
     """
     Maneja las llamadas entrantes de Twilio y responde con TwiML.
-    """
-    response = VoiceResponse()
 
-    call_sid = request.data.get('CallSid')
-    from_number = request.data.get('From')
-    to_number = request.data.get('To')
+    Registra la llamada y devuelve un `<Connect><Stream>` hacia el
+    consumidor WebSocket, con la plaza del control de admisión reservada
+    hasta que el stream conecte. Si el control la rechaza (worker saturado
+    o en drenaje), Twilio dice `VOICE_BUSY_MESSAGE` y cuelga, sin abrir el
+    stream.
+    """
+    call_sid = request.POST.get('CallSid')
+    from_number = request.POST.get('From')
+    to_number = request.POST.get('To')
 
     # Verifica que los datos sean válidos
     if not call_sid or not from_number or not to_number:
         logger.error("❌ Datos de llamada incompletos")
-        return Response({'error': 'Datos de llamada incompletos'}, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'error': 'Datos de llamada incompletos'}, status=status.HTTP_400_BAD_REQUEST)
 
-    call_data = {
+    # Un reintento de una llamada ya admitida recupera su reserva
+    admission = get_admission()
+    rejected = admission.check(call_sid)
+    if not rejected:
+        admission.reserve(call_sid)
+
+    await _save_call({
         'call_sid': call_sid,
         'from_number': from_number,
         'to_number': to_number,
-        'status': 'received'
-    }
+        'status': 'busy' if rejected else 'received'
+    })
 
-    serializer = CallSerializer(data=call_data)
-    if serializer.is_valid():
-        serializer.save()
-        logger.info(f"✅ Llamada registrada: {call_sid}")
-    else:
-        logger.warning(f"⚠️ Error guardando llamada: {serializer.errors}")
+    response = VoiceResponse()
+    if rejected:
+        logger.warning(f"🚦 Llamada {call_sid} rechazada ({rejected})")
+        response.say(settings.VOICE_BUSY_MESSAGE, language=settings.TWILIO_SAY_LANGUAGE)
+        response.hangup()
+        return HttpResponse(str(response), content_type='text/xml')
 
-    # Respuesta de voz
-    response.say('Bienvenido al sistema de respuesta de voz.', voice='alice', language='es-MX')
+    # El saludo lo reproduce el consumidor al iniciarse el stream
+    connect = Connect()
+    connect.stream(url=_stream_url(request))
+    response.append(connect)
 
     return HttpResponse(str(response), content_type='text/xml')
 
+# Campos del listado; se leen con values() sin instanciar modelos ni serializadores
+CALL_LIST_FIELDS = ('id', 'call_sid', 'from_number', 'to_number', 'status', 'duration', 'created_at', 'updated_at')
+
+
 @api_view(['GET'])
 def call_list(request):
     """
-    Lista todas las llamadas o filtra por estado.
+    Lista las llamadas, de la más reciente a la más antigua, o filtra por estado.
+
+    Paginada por cursor: `?cursor=` con el valor `next` de la página anterior
+    y `?limit=` hasta `CALLS_MAX_PAGE_SIZE`.
     """
     status_filter = request.query_params.get('status', None)
     calls = Call.objects.filter(status=status_filter) if status_filter else Call.objects.all()
 
-    serializer = CallSerializer(calls, many=True)
-    return Response(serializer.data)
+    try:
+        limit = min(int(request.query_params.get('limit', settings.CALLS_PAGE_SIZE)), settings.CALLS_MAX_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError(f'limit debe ser positivo: {limit}')
+        rows, next_cursor = keyset_page(calls, CALL_LIST_FIELDS, request.query_params.get('cursor'), limit)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({'results': rows, 'next': next_cursor})
 
 @api_view(['GET', 'PUT'])
 def call_detail(request, call_sid):
     """
     Obtiene o actualiza los detalles de una llamada específica.
+
+    Se sirve desde la caché de estado de llamadas. Los cambios de solo
+    `status`/`duration` (los callbacks de estado de Twilio) se acumulan y se
+    escriben en la base de datos por lotes; el resto va directo al modelo.
     """
-    call = get_object_or_404(Call, call_sid=call_sid)
+    cache = get_call_state_cache()
 
     if request.method == 'GET':
-        serializer = CallSerializer(call)
-        return Response(serializer.data)
+        data = cache.get(call_sid)
+        if data is None:
+            raise Http404
+        return Response(data)
 
     elif request.method == 'PUT':
-        serializer = CallSerializer(call, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            logger.info(f"✅ Llamada {call_sid} actualizada")
-            return Response(serializer.data)
+        if request.data and set(request.data) <= COALESCED_FIELDS:
+            serializer = CallSerializer(data=request.data, partial=True)
+            if serializer.is_valid():
+                data = cache.update(call_sid, serializer.validated_data)
+                if data is None:
+                    raise Http404
+                logger.info(f"✅ Llamada {call_sid} actualizada")
+                return Response(data)
+        else:
+            # Lo acumulado se escribe antes: el modelo lo lee y no queda nada pendiente que pise esta escritura
+            cache.flush(call_sid)
+            call = get_object_or_404(Call, call_sid=call_sid)
+            serializer = CallSerializer(call, data=request.data, partial=True)
+            if serializer.is_valid():
+                serializer.save()
+                cache.put(call_sid, serializer.data)
+                logger.info(f"✅ Llamada {call_sid} actualizada")
+                return Response(serializer.data)
         logger.warning(f"⚠️ Error actualizando llamada {call_sid}: {serializer.errors}")
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+@api_view(['POST'])
+@permission_classes([IsAdmin])
+def call_control(request, call_sid):
+    """
+    Envía una orden (hangup, say, transfer) al stream de una llamada en curso.
+
+    La orden viaja por el grupo `call.<CallSid>` de la capa de canales y la
+    ejecuta el worker que tenga abierto el stream, sea cual sea. Requiere el
+    token de administración o un usuario staff, y `transfer` solo marca
+    números de `CALL_TRANSFER_ALLOWLIST`.
+    """
+    action = request.data.get('action')
+    if action not in CONTROL_ACTIONS:
+        return Response({'error': f'Acción no soportada: {action}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    params = {}
+    if action == CONTROL_SAY:
+        params['text'] = request.data.get('text')
+        if not params['text']:
+            return Response({'error': 'Falta el texto a decir'}, status=status.HTTP_400_BAD_REQUEST)
+    elif action == CONTROL_TRANSFER:
+        params['to'] = request.data.get('to')
+        if not params['to']:
+            return Response({'error': 'Falta el número de destino'}, status=status.HTTP_400_BAD_REQUEST)
+        if params['to'] not in settings.CALL_TRANSFER_ALLOWLIST:
+            # La llamada saliente la paga la cuenta de Twilio: solo a destinos conocidos
+            logger.warning(f"🚫 Transferencia de {call_sid} a un número no permitido: {params['to']}")
+            return Response({'error': f"Número de destino no permitido: {params['to']}"},
+                            status=status.HTTP_403_FORBIDDEN)
+
+    async_to_sync(get_channel_layer().group_send)(call_group(call_sid), control_message(action, **params))
+    logger.info(f"🎛️ Orden '{action}' enviada a la llamada {call_sid}")
+    return Response({'call_sid': call_sid, 'action': action}, status=status.HTTP_202_ACCEPTED)
@@ -3,6 +3,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from audio_streaming.routing import websocket_urlpatterns
+from audio_streaming.lifespan import lifespan_app
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'voice_flow.settings')
 
@@ -13,6 +14,8 @@ application = ProtocolTypeRouter({
             websocket_urlpatterns
         )
     ),
+    # Arranque y parada del worker (pool HTTP del TTS, etc.)
+    "lifespan": lifespan_app,
 })
 
 # Asegurarse de que la aplicación esté disponible para el servidor ASGI
@@ -86,11 +86,40 @@ TEMPLATES = [
 ASGI_APPLICATION = 'voice_flow.asgi.application'
 
 # Channel Layers Configuration
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# Sin REDIS_URL la capa es en memoria y todo cabe en un solo proceso. Con
+# REDIS_URL (redis://host:6379/0) varios workers comparten grupos y mensajes;
+# `fakeredis://` usa un Redis simulado en el propio proceso para pruebas.
+REDIS_URL = os.getenv('REDIS_URL', '')
+CHANNEL_LAYER_CAPACITY = int(os.getenv('CHANNEL_LAYER_CAPACITY', '100'))
+CHANNEL_LAYER_EXPIRY = int(os.getenv('CHANNEL_LAYER_EXPIRY', '60'))
+
+if REDIS_URL.startswith('fakeredis://'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'audio_streaming.layers.FakeRedisChannelLayer',
+            'CONFIG': {
+                'capacity': CHANNEL_LAYER_CAPACITY,
+                'expiry': CHANNEL_LAYER_EXPIRY,
+            },
+        }
+    }
+elif REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+                'capacity': CHANNEL_LAYER_CAPACITY,
+                'expiry': CHANNEL_LAYER_EXPIRY,
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
 
 # Database Configuration
 DATABASES = {
@@ -100,6 +129,17 @@ DATABASES = {
     }
 }
 
+# Escritura por lotes de AudioLog: tamaño del lote, segundos máximos entre
+# escrituras y registros pendientes a partir de los cuales se descartan
+AUDIO_LOG_BATCH_SIZE = int(os.getenv('AUDIO_LOG_BATCH_SIZE', '100'))
+AUDIO_LOG_FLUSH_INTERVAL = float(os.getenv('AUDIO_LOG_FLUSH_INTERVAL', '1.0'))
+AUDIO_LOG_MAX_PENDING = int(os.getenv('AUDIO_LOG_MAX_PENDING', '10000'))
+# API de logs: máximo de logs por respuesta, segundos entre keepalives del feed SSE
+# y segundos que se espera a un id que falta (lote de otro worker aún sin confirmar)
+AUDIO_LOG_API_LIMIT = int(os.getenv('AUDIO_LOG_API_LIMIT', '100'))
+AUDIO_LOG_STREAM_HEARTBEAT = float(os.getenv('AUDIO_LOG_STREAM_HEARTBEAT', '15'))
+AUDIO_LOG_FEED_GAP_SECONDS = float(os.getenv('AUDIO_LOG_FEED_GAP_SECONDS', '5'))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -137,25 +177,174 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Listado de llamadas paginado por cursor: tamaño de página por defecto y máximo
+CALLS_PAGE_SIZE = int(os.getenv('CALLS_PAGE_SIZE', '50'))
+CALLS_MAX_PAGE_SIZE = int(os.getenv('CALLS_MAX_PAGE_SIZE', '500'))
+# Caché del estado de llamadas: entradas en memoria (y segundos que valen, lo que
+# tarda un worker sin Redis en ver los cambios de otro), segundos entre escrituras
+# acumuladas y Redis opcional compartido por los workers (con su caducidad)
+CALL_STATE_CACHE_MAX_ENTRIES = int(os.getenv('CALL_STATE_CACHE_MAX_ENTRIES', '10000'))
+CALL_STATE_CACHE_TTL = float(os.getenv('CALL_STATE_CACHE_TTL', '5.0'))
+CALL_STATE_FLUSH_INTERVAL = float(os.getenv('CALL_STATE_FLUSH_INTERVAL', '2.0'))
+CALL_STATE_REDIS_URL = os.getenv('CALL_STATE_REDIS_URL', '')
+CALL_STATE_REDIS_TTL = int(os.getenv('CALL_STATE_REDIS_TTL', '3600'))
+
 # Security Settings
 CSRF_TRUSTED_ORIGINS = [
     'https://*.ngrok-free.app',
 ]
+# Token de los endpoints de administración y control (`Authorization: Bearer
+# <token>`); vacío = solo usuarios staff con sesión de Django
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN', '')
+# Números E.164 a los que `POST /calls/<CallSid>/control/` puede transferir una
+# llamada (separados por comas); vacío = transferencias desactivadas
+CALL_TRANSFER_ALLOWLIST = [
+    number.strip() for number in os.getenv('CALL_TRANSFER_ALLOWLIST', '').split(',') if number.strip()
+]
 
 # Websocket Configuration
 WEBSOCKET_URL = '/ws/audio/stream/'
+# URL wss:// completa del stream que se pone en el TwiML; vacía = wss://<host del webhook>WEBSOCKET_URL
+TWILIO_STREAM_URL = os.getenv('TWILIO_STREAM_URL', '')
 
 # Twilio Configuration
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
+# Twilio Media Streams: formato pedido al TTS para responder (ulaw_8000 o pcm_<hz>,
+# que se convierte a μ-law 8 kHz en memoria) y segundos de audio entrante que
+# guarda cada llamada en su búfer circular (el VAD lo vacía cada bloque: 2 s
+# son 32 KB por llamada y sobran para absorber retrasos del event loop)
+TWILIO_TTS_OUTPUT_FORMAT = os.getenv('TWILIO_TTS_OUTPUT_FORMAT', 'ulaw_8000')
+TWILIO_INBOUND_BUFFER_SECONDS = int(os.getenv('TWILIO_INBOUND_BUFFER_SECONDS', '2'))
+# Detección de turnos (VAD por energía) sobre el audio entrante de Twilio
+VAD_CONFIG = {
+    'threshold_db': float(os.getenv('VAD_THRESHOLD_DB', '-40')),
+    'start_ms': int(os.getenv('VAD_START_MS', '60')),
+    'end_silence_ms': int(os.getenv('VAD_END_SILENCE_MS', '600')),
+    'min_speech_ms': int(os.getenv('VAD_MIN_SPEECH_MS', '200')),
+    'max_utterance_ms': int(os.getenv('VAD_MAX_UTTERANCE_MS', '15000')),
+    'block_ms': int(os.getenv('VAD_BLOCK_MS', '100')),
+}
 
 # Ngrok Configuration
 NGROK_AUTHTOKEN = os.getenv('NGROK_AUTHTOKEN')
 
 # ElevenLabs Configuration
 ELEVENLABS_API_KEY = os.getenv('ELEVENLABS_API_KEY')
+ELEVENLABS_VOICE_ID = os.getenv('ELEVENLABS_VOICE_ID', '9BWtsMINqrJLrRacOk9x')
+ELEVENLABS_MODEL_ID = os.getenv('ELEVENLABS_MODEL_ID', 'eleven_multilingual_v2')
+
+# Mensajes de voz de la aplicación
+VOICE_WELCOME_MESSAGE = 'Bienvenido al sistema de respuesta de voz.'
+VOICE_ACK_MESSAGE = 'Mensaje recibido correctamente'
+# Frase de relleno cuando el TTS no responde a tiempo (se sirve solo desde la caché)
+VOICE_FALLBACK_MESSAGE = os.getenv('VOICE_FALLBACK_MESSAGE', 'Un momento, por favor.')
+# Mensaje para las llamadas rechazadas por sobrecarga o drenaje; lo dice Twilio
+# con <Say> (no se abre stream) en el idioma TWILIO_SAY_LANGUAGE, y después cuelga
+VOICE_BUSY_MESSAGE = os.getenv(
+    'VOICE_BUSY_MESSAGE', 'En este momento todas nuestras líneas están ocupadas. Por favor, llame más tarde.'
+)
+TWILIO_SAY_LANGUAGE = os.getenv('TWILIO_SAY_LANGUAGE', 'es-ES')
+# Catálogo de locuciones fijas: `manage.py build_prompts` las sintetiza en μ-law
+# 8 kHz en un bundle en PROMPTS_DIR que cada worker mapea en memoria al arrancar
+# y reproduce sin llamar al TTS (el mensaje de ocupado lo dice Twilio, no va aquí)
+VOICE_PROMPTS = {
+    'welcome': VOICE_WELCOME_MESSAGE,
+    'ack': VOICE_ACK_MESSAGE,
+    'fallback': VOICE_FALLBACK_MESSAGE,
+}
+PROMPTS_ENABLED = os.getenv('PROMPTS_ENABLED', 'True') == 'True'
+PROMPTS_DIR = Path(os.getenv('PROMPTS_DIR') or BASE_DIR / 'prompts')
+
+# TTS Configuration
+# Proveedor TTS por defecto: 'elevenlabs', 'stub' (simulado y determinista, para
+# pruebas de carga) o 'local' (espeak-ng, sin conexión), y proveedores que una
+# conexión puede pedir en su mensaje de inicio
+TTS_PROVIDER = os.getenv('TTS_PROVIDER', 'elevenlabs')
+TTS_SELECTABLE_PROVIDERS = [
+    name.strip() for name in os.getenv('TTS_SELECTABLE_PROVIDERS', 'elevenlabs,stub,local').split(',') if name.strip()
+]
+# Latencia hasta el primer fragmento y pausa entre fragmentos del stub
+TTS_STUB_LATENCY_MS = float(os.getenv('TTS_STUB_LATENCY_MS', '0'))
+TTS_STUB_CHUNK_INTERVAL_MS = float(os.getenv('TTS_STUB_CHUNK_INTERVAL_MS', '0'))
+# Motor local: ejecutable de espeak-ng, voz y velocidad (palabras por minuto)
+TTS_LOCAL_COMMAND = os.getenv('TTS_LOCAL_COMMAND', 'espeak-ng')
+TTS_LOCAL_VOICE = os.getenv('TTS_LOCAL_VOICE', 'es')
+TTS_LOCAL_RATE = int(os.getenv('TTS_LOCAL_RATE', '160'))
+# Síntesis simultáneas permitidas por worker y tamaño del pool de hilos que las ejecuta
+TTS_MAX_CONCURRENCY = int(os.getenv('TTS_MAX_CONCURRENCY', '16'))
+TTS_EXECUTOR_WORKERS = int(os.getenv('TTS_EXECUTOR_WORKERS', '16'))
+# Envío del audio fragmento a fragmento según llega del TTS, y fragmentos que
+# pueden quedar pendientes por conexión antes de frenar la lectura del proveedor
+TTS_STREAMING = os.getenv('TTS_STREAMING', 'False') == 'True'
+TTS_STREAM_BUFFER_CHUNKS = int(os.getenv('TTS_STREAM_BUFFER_CHUNKS', '8'))
+# Mensajes de audio pendientes de envío por conexión (se descartan si el llamante interrumpe)
+OUTBOUND_QUEUE_MAX_MESSAGES = int(os.getenv('OUTBOUND_QUEUE_MAX_MESSAGES', '50'))
+# JSON de los mensajes del WebSocket: 'auto' (orjson o msgspec si están
+# instalados, si no `json`), 'json', 'orjson' o 'msgspec'. Las tramas `media`
+# de Twilio se leen sin parsear el JSON completo salvo con WS_MEDIA_FAST_PATH=False
+WS_JSON_CODEC = os.getenv('WS_JSON_CODEC', 'auto')
+WS_MEDIA_FAST_PATH = os.getenv('WS_MEDIA_FAST_PATH', 'True') == 'True'
+# Pool HTTP compartido por proceso hacia el proveedor TTS (keep-alive)
+TTS_HTTP_TIMEOUT = float(os.getenv('TTS_HTTP_TIMEOUT', '60'))
+TTS_HTTP_MAX_CONNECTIONS = int(os.getenv('TTS_HTTP_MAX_CONNECTIONS', '32'))
+TTS_HTTP_MAX_KEEPALIVE = int(os.getenv('TTS_HTTP_MAX_KEEPALIVE', '16'))
+TTS_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('TTS_HTTP_KEEPALIVE_EXPIRY', '60'))
+TTS_HEALTHCHECK_ON_STARTUP = os.getenv('TTS_HEALTHCHECK_ON_STARTUP', 'True') == 'True'
+# Caché de audio sintetizado: LRU en memoria (en bytes) y nivel opcional en disco
+TTS_CACHE_ENABLED = os.getenv('TTS_CACHE_ENABLED', 'True') == 'True'
+TTS_CACHE_MAX_BYTES = int(os.getenv('TTS_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR') or None
+# Textos que se sintetizan al arrancar el worker para que ya estén en caché
+TTS_PREWARM_ON_STARTUP = os.getenv('TTS_PREWARM_ON_STARTUP', 'True') == 'True'
+TTS_PREWARM_TEXTS = [VOICE_WELCOME_MESSAGE, VOICE_ACK_MESSAGE, VOICE_FALLBACK_MESSAGE]
+# Plazo para el primer fragmento del TTS: pasados TTS_HEDGE_AFTER_MS sin audio se
+# lanza una petición de respaldo (0 = desactivado) a TTS_HEDGE_PROVIDER, con
+# TTS_HEDGE_VOICE_ID (vacía = la del proveedor). Sin TTS_HEDGE_PROVIDER no hay
+# respaldo; contra el proveedor de la propia conexión, que duplica peticiones y
+# cuota, solo con TTS_HEDGE_SAME_PROVIDER=True. Pasados TTS_FALLBACK_AFTER_MS
+# suena VOICE_FALLBACK_MESSAGE si está en caché (0 = nunca) hasta que llega la respuesta
+TTS_HEDGE_AFTER_MS = float(os.getenv('TTS_HEDGE_AFTER_MS', '800'))
+TTS_HEDGE_PROVIDER = os.getenv('TTS_HEDGE_PROVIDER', '')
+TTS_HEDGE_VOICE_ID = os.getenv('TTS_HEDGE_VOICE_ID', '')
+TTS_HEDGE_SAME_PROVIDER = os.getenv('TTS_HEDGE_SAME_PROVIDER', 'False') == 'True'
+TTS_FALLBACK_AFTER_MS = float(os.getenv('TTS_FALLBACK_AFTER_MS', '2500'))
+
+# Control de admisión: una llamada o conexión nueva se rechaza si el worker
+# tiene ya ADMISSION_MAX_SESSIONS sesiones, ADMISSION_MAX_TTS_WAITING síntesis
+# esperando hueco o un retraso medio del event loop de ADMISSION_MAX_LOOP_LAG_MS
+# (0 = sin límite; el de sesiones depende de la máquina, ver benchmarks.loadgen).
+# El retraso se mide cada LOOP_LAG_INTERVAL_MS. WORKER_ID identifica al worker
+# en `manage.py drain` (vacío = <host>-<pid>). Una llamada admitida en el
+# webhook guarda su plaza ADMISSION_RESERVATION_SECONDS hasta que conecta su stream
+ADMISSION_MAX_SESSIONS = int(os.getenv('ADMISSION_MAX_SESSIONS', '0'))
+ADMISSION_MAX_TTS_WAITING = int(os.getenv('ADMISSION_MAX_TTS_WAITING', '64'))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv('ADMISSION_MAX_LOOP_LAG_MS', '250'))
+ADMISSION_RESERVATION_SECONDS = float(os.getenv('ADMISSION_RESERVATION_SECONDS', '30'))
+LOOP_LAG_INTERVAL_MS = float(os.getenv('LOOP_LAG_INTERVAL_MS', '100'))
+WORKER_ID = os.getenv('WORKER_ID', '')
+
+# Perfilado del event loop (se activa en caliente con /audio/admin/profiling/ o
+# `manage.py profile`): LOOP_STALL_DETECTION la activa ya al arrancar. Se
+# registra cada bloqueo de más de LOOP_STALL_THRESHOLD_MS; el perfil por
+# muestreo toma una pila cada PROFILE_SAMPLE_INTERVAL_MS durante PROFILE_MAX_SECONDS como mucho
+LOOP_STALL_DETECTION = os.getenv('LOOP_STALL_DETECTION', 'False') == 'True'
+LOOP_STALL_THRESHOLD_MS = float(os.getenv('LOOP_STALL_THRESHOLD_MS', '100'))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', '300'))
 
 # Logging Configuration
+# Logs: nivel de los loggers del proyecto, escritura en segundo plano (cola
+# con un hilo que escribe en consola y fichero; si se llena se descartan
+# registros) y límite de errores del mismo tipo que se escriben con traceback
+# por intervalo (del resto se escribe uno de cada LOG_ERROR_SAMPLE_EVERY)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'DEBUG')
+LOG_QUEUE_ENABLED = os.getenv('LOG_QUEUE_ENABLED', 'True') == 'True'
+LOG_QUEUE_MAX_RECORDS = int(os.getenv('LOG_QUEUE_MAX_RECORDS', '10000'))
+LOG_ERROR_BURST = int(os.getenv('LOG_ERROR_BURST', '5'))
+LOG_ERROR_INTERVAL = float(os.getenv('LOG_ERROR_INTERVAL', '60'))
+LOG_ERROR_SAMPLE_EVERY = int(os.getenv('LOG_ERROR_SAMPLE_EVERY', '100'))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -184,12 +373,12 @@ LOGGING = {
         },
         'calls': {
             'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
         'audio_streaming': {
             'handlers': ['console', 'file'],
-            'level': 'DEBUG',
+            'level': LOG_LEVEL,
             'propagate': False,
         },
     },